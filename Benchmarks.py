@@ -0,0 +1,449 @@
+#-------------------------------------------------------------------------------
+# Name:        Benchmarks
+''' Purpose:  Reproducible throughput benchmarks for the computational core of the
+              Forestry Tools and OARS scripts. Inputs are synthetic and generated
+              from a fixed seed, so every run (and every machine) times the same
+              data: fire origins with an E911 reference folder, OARS shapefile
+              folders, Float Grid slope rasters, IPA and county/district layers,
+              render jobs and Forest Health code tables. Only code paths that run
+              without arcpy are timed (shapefiles are read and written by
+              Shapefile_IO.py, rasters are Float Grids and maps are rendered by the
+              "preview" backend), so the suite runs on any machine with numpy.
+              Stage times, rows and bytes are recorded with Tool_Timing.py and
+              written to a JSON results file. Given a baseline (a results file from
+              an earlier run), stages that got slower are reported and the exit
+              status is 1.
+              Example:
+                python Benchmarks.py
+                python Benchmarks.py e911 ipa --scale 4 --workers 8
+                python Benchmarks.py --output today.json --baseline last_week.json
+'''
+#-------------------------------------------------------------------------------
+import argparse, json, math, os, platform, shutil, sys, tempfile, time
+import numpy
+import CRS_Transforms, E911_Batch, E911_Reference, ForestHealth_Decoder, IPA_Partition, OARS_Ingest, OARS_Merge, OARS_Pipeline
+import Render_Queue, Shapefile_IO, Slope_Zonal, Tool_Timing, WKT_Export
+
+WORKSPACE = os.path.join(tempfile.gettempdir(), "Forestry Tools Benchmarks")
+SEED = 2018
+TOLERANCE = 0.25                                                                # Stages more than 25% slower than the baseline are regressions
+MIN_SECONDS = 0.05                                                              # ...if they are also at least this much slower (timer noise)
+# Sizes at --scale 1. Counts grow linearly with the scale, the slope raster's width and height with its square root.
+SIZES = {"fires": 200, "addresses": 100000, "oarsFiles": 200, "oarsPolygons": 20, "oarsVertices": 40, "rasterSize": 2000,
+         "slopeZones": 40, "wktPolygons": 2000, "wktVertices": 200, "ipas": 300, "ipaPlants": 3000, "renderZones": 20, "decodeRows": 200000}
+NM_LATITUDES = (32.5, 36.5)                                                     # Fire origins fall in the UTM Zone 13N part of New Mexico
+NM_LONGITUDES = (-105.9, -103.1)
+NAD83_UTM13 = 'PROJCS["NAD_1983_UTM_Zone_13N",GEOGCS["GCS_North_American_1983",DATUM["D_North_American_1983",SPHEROID["GRS_1980",6378137.0,298.257222101]],' \
+              'PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]],PROJECTION["Transverse_Mercator"],PARAMETER["False_Easting",500000.0],' \
+              'PARAMETER["False_Northing",0.0],PARAMETER["Central_Meridian",-105.0],PARAMETER["Scale_Factor",0.9996],PARAMETER["Latitude_Of_Origin",0.0],UNIT["Meter",1.0]]'
+NAD27_UTM13 = NAD83_UTM13.replace("NAD_1983", "NAD_1927").replace("North_American_1983", "North_American_1927").replace('"GRS_1980",6378137.0,298.257222101', '"Clarke_1866",6378206.4,294.9786982')
+WGS84 = 'GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]]'
+
+
+# Synthetic data --------------------------------------------------------------
+def circle(x, y, radius, vertices, rng=None, jitter=0.0):
+    """Closed clockwise ring (a shapefile outer ring) around (x, y), optionally with the radius jittered by up to 'jitter'."""
+    angles = -2 * numpy.pi * numpy.arange(vertices) / vertices
+    radii = radius * (1 + rng.uniform(-jitter, jitter, vertices)) if jitter else numpy.full(vertices, float(radius))
+    ring = list(zip((x + radii * numpy.cos(angles)).tolist(), (y + radii * numpy.sin(angles)).tolist()))
+    return ring + ring[:1]
+
+
+def rectangle(xmin, ymin, xmax, ymax):
+    return [(xmin, ymin), (xmin, ymax), (xmax, ymax), (xmax, ymin), (xmin, ymin)]
+
+
+def grid_cells(bbox, ncols, nrows):
+    """(column, row, rectangle ring) of a regular grid of polygons covering 'bbox'."""
+    xmin, ymin, xmax, ymax = bbox
+    width, height = (xmax - xmin) / float(ncols), (ymax - ymin) / float(nrows)
+    return [(c, r, rectangle(xmin + c * width, ymin + r * height, xmin + (c + 1) * width, ymin + (r + 1) * height)) for r in range(nrows) for c in range(ncols)]
+
+
+def write_shapefile(path, shapeType, fields, features, prj=NAD83_UTM13):
+    """Write [(shape, record)] to a new shapefile. Returns the path."""
+    with Shapefile_IO.ShapefileWriter(path, shapeType, fields, prj) as writer:
+        for shape, record in features:
+            writer.write(shape, record)
+    return path
+
+
+def utm_extent(latitudes=NM_LATITUDES, longitudes=NM_LONGITUDES, margin=10000.0):
+    """NAD83 UTM Zone 13N bounding box of a latitude/longitude range, padded by 'margin' meters."""
+    lon, lat = numpy.meshgrid(numpy.linspace(longitudes[0], longitudes[1], 5), numpy.linspace(latitudes[0], latitudes[1], 5))
+    xs, ys = CRS_Transforms.wgs84_to_utm13(lon.ravel(), lat.ravel())
+    return xs.min() - margin, ys.min() - margin, xs.max() + margin, ys.max() + margin
+
+
+def make_fires(count, rng):
+    """[(fire name, latitude, longitude)] like E911_Batch.read_fire_origins() returns."""
+    latitudes = rng.uniform(NM_LATITUDES[0], NM_LATITUDES[1], count)
+    longitudes = rng.uniform(NM_LONGITUDES[0], NM_LONGITUDES[1], count)
+    return [("Fire {0}".format(i + 1), round(float(lat), 6), round(float(lon), 6)) for i, (lat, lon) in enumerate(zip(latitudes, longitudes))]
+
+
+def make_e911_reference(folder, addresses, rng):
+    """E911 reference folder (addresses, land ownership, counties, districts and townships) covering the fire origins.
+    Addresses are clustered around towns; a tenth of the townships are missing, like the gaps in PLSS coverage."""
+    os.makedirs(folder)
+    bbox = utm_extent()
+    towns = numpy.column_stack((rng.uniform(bbox[0], bbox[2], 60), rng.uniform(bbox[1], bbox[3], 60)))
+    town = rng.randint(0, len(towns), addresses)
+    xs = towns[town, 0] + rng.normal(0, 4000, addresses)
+    ys = towns[town, 1] + rng.normal(0, 4000, addresses)
+    write_shapefile(os.path.join(folder, E911_Reference.ADDRESSES), Shapefile_IO.POINT, [("ADDRESS", "C", 50, 0), ("ZIP", "N", 5, 0)],
+                    [((float(x), float(y)), ["{0} Main St".format(i + 1), 87500 + i % 500]) for i, (x, y) in enumerate(zip(xs, ys))])
+    owners = ["Private", "State Trust", "BLM", "USFS", "Tribal", "NPS"]
+    write_shapefile(os.path.join(folder, "E911_Land_Ownership.shp"), Shapefile_IO.POLYGON, [("Ownership", "C", 30, 0)],
+                    [([ring], [owners[rng.randint(len(owners))]]) for c, r, ring in grid_cells(bbox, 60, 60)])
+    write_shapefile(os.path.join(folder, "E911_County.shp"), Shapefile_IO.POLYGON, [("NAME", "C", 30, 0), ("FIPS", "C", 5, 0)],
+                    [([ring], ["County {0}-{1}".format(c, r), "35{0:03d}".format(c * 10 + r)]) for c, r, ring in grid_cells(bbox, 6, 5)])
+    write_shapefile(os.path.join(folder, "E911_NMSF_Districts.shp"), Shapefile_IO.POLYGON, [("NAME", "C", 30, 0)],
+                    [([ring], ["District {0}".format(c + r * 3 + 1)]) for c, r, ring in grid_cells(bbox, 3, 2)])
+    write_shapefile(os.path.join(folder, "E911_Township.shp"), Shapefile_IO.POLYGON, [("TWN", "C", 5, 0), ("RNG", "C", 5, 0)],
+                    [([ring], ["{0}N".format(r + 1), "{0}E".format(c + 1)]) for c, r, ring in grid_cells(bbox, 50, 50) if rng.uniform() > 0.1])
+
+
+def make_oars_folder(folder, files, polygons, vertices, rng):
+    """Raw OARS submissions: polygon shapefiles with a mix of templates (older ones use Forest_Typ) and coordinate systems,
+    plus a few point shapefiles (wrong geometry) and junk files. Returns the paths of the polygon shapefiles."""
+    os.makedirs(folder)
+    bbox = utm_extent(margin=0)
+    newTemplate = [("Orig_Name", "C", 100, 0), ("ProjectNam", "C", 100, 0), ("ForestType", "C", 50, 0), ("Treatment", "C", 100, 0),
+                   ("District", "C", 25, 0), ("Acres", "N", 19, 11)]
+    oldTemplate = [("Orig_Name", "C", 60, 0), ("Project", "C", 120, 0), ("Forest_Typ", "C", 75, 0), ("Treatment", "C", 50, 0), ("District", "C", 20, 0),
+                   ("Acres", "F", 13, 4)]
+    forestTypes = ["Ponderosa Pine", "Pinyon-Juniper", "Mixed Conifer", "Spruce-Fir"]
+    shapefiles = []
+    for i in range(files):
+        name = "Treatment {0} ({1}).shp".format(5000 + i, OARS_Ingest.COUNTIES[i % len(OARS_Ingest.COUNTIES)])   # Spaces and parentheses are sanitized by OARS_Pipeline.py
+        prj = NAD27_UTM13 if i % 10 == 3 else WGS84 if i % 10 == 7 else None if i % 25 == 11 else NAD83_UTM13
+        fields = oldTemplate if i % 3 == 0 else newTemplate
+        x0, y0 = rng.uniform(bbox[0], bbox[2]), rng.uniform(bbox[1], bbox[3])
+        features = []
+        for p in range(polygons):
+            ring = circle(x0 + rng.uniform(-5000, 5000), y0 + rng.uniform(-5000, 5000), rng.uniform(50, 400), vertices, rng, 0.2)
+            if prj == WGS84:
+                xs, ys = CRS_Transforms.utm_to_geographic(numpy.array([point[0] for point in ring]), numpy.array([point[1] for point in ring]))
+                ring = list(zip(xs.tolist(), ys.tolist()))
+            features.append(([ring], [name[:-4], "Thinning Project {0}".format(i), forestTypes[p % len(forestTypes)], "Thinning", "District {0}".format(i % 6 + 1),
+                                      round(rng.uniform(1, 100), 4)]))
+        shapefiles.append(write_shapefile(os.path.join(folder, name), Shapefile_IO.POLYGON, fields, features, prj))
+    for i in range(max(1, files // 50)):
+        write_shapefile(os.path.join(folder, "GPS Waypoints {0}.shp".format(i)), Shapefile_IO.POINT, [("IDENT", "C", 10, 0)],
+                        [((rng.uniform(bbox[0], bbox[2]), rng.uniform(bbox[1], bbox[3])), ["WPT{0}".format(p)]) for p in range(10)])
+        with open(os.path.join(folder, "Site Photos {0}.pdf".format(i)), "wb") as f:
+            f.write(b"%PDF-1.4\n")
+    return shapefiles
+
+
+def make_slope_raster(path, size, cellSize, rng):
+    """Percent slope Float Grid ('size' by 'size' cells, NoData around the edge) over rolling terrain. Returns its bounding box."""
+    xll, yll = 400000.0, 3800000.0
+    rows, cols = numpy.mgrid[0:size, 0:size].astype(numpy.float32)
+    slope = numpy.zeros((size, size), dtype=numpy.float32)
+    for wave in range(6):                                                       # A few random ridges and valleys
+        angle, length, height = rng.uniform(0, numpy.pi), rng.uniform(size / 8.0, size / 2.0), rng.uniform(5, 25)
+        slope += height * (1 + numpy.sin((cols * numpy.cos(angle) + rows * numpy.sin(angle)) * 2 * numpy.pi / length)).astype(numpy.float32)
+    slope += rng.uniform(0, 5, (size, size)).astype(numpy.float32)
+    nodata = -9999.0
+    slope[:, :size // 50 + 1] = nodata
+    slope[-(size // 50 + 1):, :] = nodata
+    base = os.path.splitext(path)[0]
+    slope.astype("<f4").tofile(base + ".flt")
+    with open(base + ".hdr", "w") as f:
+        f.write("ncols {0}\nnrows {0}\nxllcorner {1}\nyllcorner {2}\ncellsize {3}\nNODATA_value {4}\nbyteorder LSBFIRST\n".format(size, xll, yll, cellSize, nodata))
+    return xll, yll, xll + size * cellSize, yll + size * cellSize
+
+
+def make_ipa_layers(folder, ipas, plants, rng):
+    """County and district boundaries (shapefiles, as IPA_Partition.read_regions() reads them), IPA polygons and IPA
+    plant hexagons clustered around the IPAs. Returns (county shp, district shp, IPA shp, IPA plants shp)."""
+    os.makedirs(folder)
+    bbox = utm_extent(margin=0)
+    names = OARS_Ingest.COUNTIES + ["County {0}".format(i) for i in range(len(OARS_Ingest.COUNTIES), 36)]
+    counties = write_shapefile(os.path.join(folder, "County.shp"), Shapefile_IO.POLYGON, [("NAME10", "C", 30, 0)],
+                               [([ring], [names[c + r * 6]]) for c, r, ring in grid_cells(bbox, 6, 6)])
+    districts = write_shapefile(os.path.join(folder, "NMSF_Districts.shp"), Shapefile_IO.POLYGON, [("NAME", "C", 30, 0)],
+                                [([ring], ["District {0}".format(c + r * 3 + 1)]) for c, r, ring in grid_cells(bbox, 3, 2)])
+    centers = numpy.column_stack((rng.uniform(bbox[0], bbox[2], ipas), rng.uniform(bbox[1], bbox[3], ipas)))
+    radii = rng.uniform(1000, 8000, ipas)
+    sites = ["IPA Site #{0} ({1})".format(i + 1, "North" if y > (bbox[1] + bbox[3]) / 2 else "South") for i, (x, y) in enumerate(centers.tolist())]
+    ipaShp = write_shapefile(os.path.join(folder, "IPA_Final.shp"), Shapefile_IO.POLYGON, [("Site_Name", "C", 60, 0), ("Rank", "N", 2, 0)],
+                             [([circle(x, y, radius, 64, rng, 0.3)], [site, i % 5 + 1]) for i, ((x, y), radius, site) in enumerate(zip(centers.tolist(), radii.tolist(), sites))])
+    owner = rng.randint(0, ipas, plants)
+    hexes = []
+    for i in range(plants):
+        angle, distance = rng.uniform(0, 2 * numpy.pi), rng.uniform(0, radii[owner[i]])
+        x, y = centers[owner[i], 0] + distance * math.cos(angle), centers[owner[i], 1] + distance * math.sin(angle)
+        hexes.append(([circle(x, y, 250, 6)], [sites[owner[i]], "Species {0}".format(i % 40)]))
+    plantShp = write_shapefile(os.path.join(folder, "IPA_Plants_Final.shp"), Shapefile_IO.POLYGON, [("Site_Name", "C", 60, 0), ("Species", "C", 40, 0)], hexes)
+    return counties, districts, ipaShp, plantShp
+
+
+# Benchmarks ------------------------------------------------------------------
+BENCHMARKS = []                                                                 # (name, function(folder, sizes, workers)) in the order they run
+
+
+def benchmark(name):
+    def register(function):
+        BENCHMARKS.append((name, function))
+        return function
+    return register
+
+
+@benchmark("e911")
+def benchmark_e911(folder, sizes, workers):
+    """E911 Analysis without arcpy: reference layers loaded into memory, then every fire origin analyzed by E911_Batch.py."""
+    rng = numpy.random.RandomState(SEED)
+    Tool_Timing.step("Generating fire origins and E911 reference files...")
+    fires = make_fires(sizes["fires"], rng)
+    reference = os.path.join(folder, "Reference")
+    make_e911_reference(reference, sizes["addresses"], rng)
+    Tool_Timing.wrote(reference)
+    Tool_Timing.step("Loading reference layers...")
+    Tool_Timing.count(len(E911_Reference.ReferenceData(reference).addresses))
+    Tool_Timing.step("Analyzing fire origins...")
+    output = os.path.join(folder, "Results")
+    E911_Batch.run_batch(fires, output, reference, workers)
+    Tool_Timing.count(len(fires))
+    Tool_Timing.wrote(output)
+
+
+@benchmark("slope")
+def benchmark_slope(folder, sizes, workers):
+    """Percent Slope Analysis zonal engine: acres above and below every threshold for each zone, read window by window."""
+    rng = numpy.random.RandomState(SEED)
+    Tool_Timing.step("Generating slope raster and zones...")
+    os.makedirs(folder)
+    raster = os.path.join(folder, "percent_slope.flt")
+    xmin, ymin, xmax, ymax = make_slope_raster(raster, sizes["rasterSize"], 10.0, rng)
+    Tool_Timing.wrote(raster)
+    zones = []
+    for i in range(sizes["slopeZones"]):
+        radius = rng.uniform(200, (xmax - xmin) / 10.0)
+        x, y = rng.uniform(xmin + radius, xmax - radius), rng.uniform(ymin + radius, ymax - radius)
+        zones.append(("Polygon {0}".format(i + 1), [circle(x, y, radius, 200, rng, 0.25)]))
+    Tool_Timing.step("Calculating acres above and below each slope threshold...")
+    slope = Slope_Zonal.SlopeRasters(percentSlope=Slope_Zonal.FloatGridRaster(raster))
+    results = Slope_Zonal.zonal_slope_acres(zones, slope)
+    Tool_Timing.count(len(zones))
+    table = os.path.join(folder, "Slope_Thresholds.csv")
+    Slope_Zonal.write_threshold_table(table, results)
+    Tool_Timing.wrote(table)
+
+
+@benchmark("oars")
+def benchmark_oars(folder, sizes, workers):
+    """OARS preparation steps that don't need arcpy: the OARS_Preparation1 scan, incremental ingest change detection
+    (first run and rerun) and the merged schema of OARS_Preparation2."""
+    rng = numpy.random.RandomState(SEED)
+    Tool_Timing.step("Generating OARS shapefiles...")
+    raw = os.path.join(folder, "OARS S_FY18")
+    shapefiles = make_oars_folder(raw, sizes["oarsFiles"], sizes["oarsPolygons"], sizes["oarsVertices"], rng)
+    Tool_Timing.wrote(raw)
+    OARS_Pipeline.run(raw, os.path.join(folder, "Wrong Geometry"), os.path.join(folder, "Staging"), dryRun=True)   # Stage: "Scanning the OARS folder..."
+    Tool_Timing.step("Finding new shapefiles to ingest...")
+    cache = {}
+    changed, removed = OARS_Ingest.plan(raw, cache)
+    Tool_Timing.count(len(changed))
+    for f, digest, signature in changed:
+        cache[f] = {"hash": digest, "signature": signature}
+    Tool_Timing.step("Finding new shapefiles to ingest (rerun)...")
+    OARS_Ingest.plan(raw, cache)
+    Tool_Timing.count(len(cache))
+    Tool_Timing.step("Reconciling field schemas...")
+    OARS_Merge.reconcile_schemas(shapefiles)
+    Tool_Timing.count(len(shapefiles))
+
+
+@benchmark("wkt")
+def benchmark_wkt(folder, sizes, workers):
+    """Convert Shapefile to WKT: batched Web Mercator transform and MULTIPOLYGON text, at full precision and simplified."""
+    rng = numpy.random.RandomState(SEED)
+    Tool_Timing.step("Generating treatment polygons...")
+    os.makedirs(folder)
+    bbox = utm_extent(margin=0)
+    shp = write_shapefile(os.path.join(folder, "Treatments.shp"), Shapefile_IO.POLYGON, [("Zone", "N", 6, 0)],
+                          [([circle(rng.uniform(bbox[0], bbox[2]), rng.uniform(bbox[1], bbox[3]), rng.uniform(100, 2000), sizes["wktVertices"], rng, 0.1)], [i])
+                            for i in range(sizes["wktPolygons"])])
+    Tool_Timing.wrote(shp)
+    for label, decimals, tolerance in (("Writing WKT...", None, 0), ("Writing simplified WKT...", 2, 5.0)):
+        Tool_Timing.step(label)
+        textFile = os.path.join(folder, "Treatments_{0}_WKT.txt".format("simplified" if tolerance else "full"))
+        features, polygons, verticesIn, verticesOut = WKT_Export.write_multipolygon_wkt(shp, textFile, "NAD_1983_UTM_Zone_13N", decimals, tolerance)
+        Tool_Timing.count(verticesIn)
+        Tool_Timing.wrote(textFile)
+
+
+@benchmark("ipa")
+def benchmark_ipa(folder, sizes, workers):
+    """IPAs.py: IPAs and IPA plant hexagons partitioned by county, district and site."""
+    rng = numpy.random.RandomState(SEED)
+    Tool_Timing.step("Generating IPA layers...")
+    county, district, ipaShp, plantShp = make_ipa_layers(os.path.join(folder, "Input"), sizes["ipas"], sizes["ipaPlants"], rng)
+    Tool_Timing.step("Indexing county and district boundaries...")
+    counties = IPA_Partition.RegionLayer(IPA_Partition.read_regions(county, "NAME10"))
+    districts = IPA_Partition.RegionLayer(IPA_Partition.read_regions(district, "NAME"))
+    Tool_Timing.count(len(counties.names) + len(districts.names))
+    output = os.path.join(folder, "Output")
+    layers = [(ipaShp, [(counties, os.path.join(output, "By County", "IPAs", "IPA_{0}_County.shp")),
+                        (districts, os.path.join(output, "By District", "IPAs", "IPA_{0}_District.shp"))],
+               "Site_Name", os.path.join(output, "Individual IPAs", "{0}_IPA.shp")),
+              (plantShp, [(counties, os.path.join(output, "By County", "IPA Plants", "IPA_Plants_{0}_County.shp")),
+                          (districts, os.path.join(output, "By District", "IPA Plants", "IPA_Plants_{0}_District.shp"))],
+               "Site_Name", os.path.join(output, "IPA Plants by IPA", "{0}_Plants.shp"))]
+    IPA_Partition.partition(layers, workers)                                    # Stages: "Assigning ... features..." and "Writing partitions..."
+
+
+@benchmark("render")
+def benchmark_render(folder, sizes, workers):
+    """Render_Queue.py with the preview backend: slope maps and graphs, E911 maps and KMZ files, rendered and then
+    delivered again from the render cache."""
+    rng = numpy.random.RandomState(SEED)
+    Tool_Timing.step("Generating render inputs...")
+    os.makedirs(folder)
+    Render_Queue.CACHE_FOLDER = os.path.join(folder, "Render Cache")            # Keep benchmark renders out of the tools' cache
+    features = []
+    bars = []
+    acres = {}
+    for i in range(sizes["renderZones"]):
+        x, y = 400000 + (i % 5) * 3000, 3800000 + (i // 5) * 3000
+        zone = "Polygon {0}".format(i + 1)
+        features.append(([circle(x, y, 1200, 120, rng, 0.2)], [zone]))
+        acres[zone] = rng.uniform(10, 500, 2).tolist()
+        bars += [["{0}: > 25%".format(zone), acres[zone][0]], ["{0}: < 25%".format(zone), acres[zone][1]]]
+    zones = write_shapefile(os.path.join(folder, "Zone_Labels.shp"), Shapefile_IO.POLYGON, [("Zone", "C", 15, 0)], features)
+    origin = write_shapefile(os.path.join(folder, "Fire_Origin.shp"), Shapefile_IO.POINT, [("FireName", "C", 30, 0)], [((410000.0, 3810000.0), ["Benchmark Fire"])])
+    buffer = write_shapefile(os.path.join(folder, "Buffer_5mile.shp"), Shapefile_IO.POLYGON, [("Miles", "N", 2, 0)],
+                             [([circle(410000.0, 3810000.0, 5 * E911_Reference.METERS_PER_MILE, 360)], [5])])
+    points = rng.normal(0, 3000, (sizes["renderZones"] * 100, 2)) + (410000.0, 3810000.0)
+    addresses = write_shapefile(os.path.join(folder, "E911_Addresses_5mile.shp"), Shapefile_IO.POINT, [("ADDRESS", "C", 50, 0)],
+                                [((float(x), float(y)), ["{0} Main St".format(i + 1)]) for i, (x, y) in enumerate(points.tolist())])
+    notes = "NMSF Benchmark\nNAD83 UTM Zone 13N"
+    run = time.time()                                                           # Part of every job, so the first pass always renders
+    specs = []
+    for i in range(max(1, sizes["renderZones"] // 10)):
+        output = os.path.join(folder, "Output {0}".format(i + 1))
+        specs += [{"renderer": "slope_map", "backend": "preview", "inputs": {"zones": zones},
+                   "outputs": {"map": os.path.join(output, "Slope_Map.svg"), "summary": os.path.join(output, "Slope25_Summary.shp")},
+                   "params": {"title": "Benchmark {0}".format(i), "threshold": 25, "acres": acres, "subtitle": "Slope", "notes": notes, "run": run}},
+                  {"renderer": "slope_graph", "backend": "preview", "outputs": {"graph": os.path.join(output, "Slope_Graph.svg")},
+                   "params": {"title": "Benchmark {0}".format(i), "bars": bars, "run": run}},
+                  {"renderer": "e911_map", "backend": "preview", "inputs": {"buffer": buffer, "origin": origin, "addresses": addresses},
+                   "outputs": {"map": os.path.join(output, "5mileBuffer.svg")},
+                   "params": {"title": "Benchmark {0}".format(i), "subtitle": "E911 Addresses", "notes": notes, "scale": 95040, "run": run}},
+                  {"renderer": "kmz", "backend": "preview", "inputs": {"features": zones}, "outputs": {"kmz": os.path.join(output, "Slope.kmz")},
+                   "params": {"name": "Benchmark {0}".format(i), "run": run}}]
+    for label in ("Rendering maps, graphs and KMZ files...", "Delivering cached renders..."):
+        Tool_Timing.step(label)
+        results = Render_Queue.render_all(specs, workers)
+        failed = [error for spec, status, seconds, error in results if error]
+        if failed:
+            raise RuntimeError(failed[0])
+        Tool_Timing.count(len(specs))
+        Tool_Timing.wrote(*[path for spec in specs for path in spec["outputs"].values()])
+
+
+@benchmark("decode")
+def benchmark_decode(folder, sizes, workers):
+    """Forest Health Shapefile Developer: all 18 USFS code fields decoded for a whole table at once."""
+    rng = numpy.random.RandomState(SEED)
+    Tool_Timing.step("Generating Forest Health codes...")
+    rows = sizes["decodeRows"]
+    records = {}
+    for source, field, length, lookup in ForestHealth_Decoder.DECODE_FIELDS:
+        codes = numpy.array(sorted(lookup) + [-1])                              # -1 isn't in any table ("Script Failed")
+        records[source] = codes[rng.randint(0, len(codes), rows)]
+    Tool_Timing.step("Decoding USFS codes...")
+    ForestHealth_Decoder.decode_records(records)
+    Tool_Timing.count(rows)
+
+
+# Suite -----------------------------------------------------------------------
+def scaled_sizes(scale):
+    sizes = dict((key, max(1, int(round(value * scale)))) for key, value in SIZES.items())
+    sizes["rasterSize"] = max(100, int(round(SIZES["rasterSize"] * math.sqrt(scale))))
+    return sizes
+
+
+def run_suite(names=None, scale=1.0, workers=None, workspace=WORKSPACE):
+    """Run the benchmarks (all of them, or those in 'names') on freshly generated data in 'workspace'.
+    Returns the Tool_Timing record of each benchmark."""
+    sizes = scaled_sizes(scale)
+    logFile = os.path.join(workspace, "Benchmark Timing.jsonl")
+    records = []
+    for name, function in BENCHMARKS:
+        if names and name not in names:
+            continue
+        folder = os.path.join(workspace, name)
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        with Tool_Timing.ToolRun("Benchmark: {0}".format(name), logFile, scale=scale, workers=workers) as run:
+            function(folder, sizes, workers)
+        records.append(run.record)
+    return records
+
+
+def compare(records, baseline, tolerance=TOLERANCE):
+    """Messages for the stages that are slower than in the baseline results (stages are matched by benchmark and label).
+    The time spent generating the synthetic data isn't compared."""
+    before = {}
+    for record in baseline["benchmarks"]:
+        for stage in record["stages"]:
+            before[(record["tool"], stage["stage"])] = stage["seconds"]
+    messages = []
+    for record in records:
+        for stage in record["stages"]:
+            if stage["stage"].startswith("Generating"):                         # Synthetic data, not one of the timed code paths
+                continue
+            previous = before.get((record["tool"], stage["stage"]))
+            if previous is not None and stage["seconds"] > previous * (1 + tolerance) and stage["seconds"] - previous >= MIN_SECONDS:
+                messages.append("{0} | {1}: {2:.3f} s (baseline {3:.3f} s, {4:+.0%})".format(
+                    record["tool"], stage["stage"], stage["seconds"], previous, stage["seconds"] / previous - 1 if previous else 0))
+    return messages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Forestry Tools and OARS computations on synthetic data.")
+    parser.add_argument("benchmarks", nargs="*", help="Benchmarks to run (default: all): {0}".format(", ".join(name for name, function in BENCHMARKS)))
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the size of every synthetic dataset (default: 1)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for the parallel steps (default: all cores)")
+    parser.add_argument("--workspace", default=WORKSPACE, help="Folder for the synthetic data (default: {0})".format(WORKSPACE))
+    parser.add_argument("--output", help="Results file (default: 'Benchmark Results.json' in the workspace)")
+    parser.add_argument("--baseline", help="Results file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed slowdown before a stage counts as a regression (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.benchmarks if name not in [n for n, function in BENCHMARKS]]
+    if unknown:
+        parser.error("Unknown benchmark(s): {0}".format(", ".join(unknown)))
+    if not os.path.exists(args.workspace):
+        os.makedirs(args.workspace)
+    records = run_suite(args.benchmarks, args.scale, args.workers, args.workspace)
+    for record in records:
+        print("{0}: {1:.2f} seconds".format(record["tool"], record["seconds"]))
+        for stage in record["stages"]:
+            rate = ", {0:,.0f} rows/s".format(stage["rows"] / stage["seconds"]) if stage["rows"] and stage["seconds"] else ""
+            print("    {0} {1:.3f} s{2}".format(stage["stage"], stage["seconds"], rate))
+    output = args.output or os.path.join(args.workspace, "Benchmark Results.json")
+    with open(output, "w") as f:
+        json.dump({"scale": args.scale, "workers": args.workers, "seed": SEED, "sizes": scaled_sizes(args.scale), "python": platform.python_version(),
+                   "numpy": numpy.__version__, "platform": platform.platform(), "benchmarks": records}, f, indent=1, sort_keys=True)
+    print("Results written to {0}".format(output))
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != args.scale:
+            print("Warning: the baseline was run with --scale {0}.".format(baseline.get("scale")))
+        regressions = compare(records, baseline, args.tolerance)
+        for message in regressions:
+            print("Slower than baseline: " + message)
+        if regressions:
+            sys.exit(1)
+        print("No stage is more than {0:.0%} slower than the baseline.".format(args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
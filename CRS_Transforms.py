@@ -0,0 +1,146 @@
+#-------------------------------------------------------------------------------
+# Name:        CRS Transforms
+''' Purpose:  Vectorized (numpy) coordinate transformations for the coordinate
+              reference systems used by the Forestry Tools, so many points can be
+              reprojected at once without creating a feature class and running
+              Project_management:
+                - WGS 1984 (ITRF00) <-> NAD 1983 using the same 7 parameter
+                  coordinate frame transformation as ESRI's
+                  "WGS_1984_(ITRF00)_To_NAD_1983"
+                - geographic <-> UTM (Krueger series, accurate to well under 1 mm
+                  within a zone)
+                - geographic -> WGS 1984 Web Mercator (auxiliary sphere, WKID 3857)
+              Longitude/latitude are in decimal degrees; projected units are meters.
+'''
+#-------------------------------------------------------------------------------
+import numpy
+
+GRS80 = (6378137.0, 1 / 298.257222101)                                          # NAD 1983 ellipsoid (semi-major axis, flattening)
+WGS84 = (6378137.0, 1 / 298.257223563)
+
+# WGS_1984_(ITRF00)_To_NAD_1983: dx, dy, dz (m), rx, ry, rz (arc-seconds), scale (ppm); coordinate frame method.
+ITRF00_TO_NAD83 = (0.9956, -1.9013, -0.5215, 0.025915, 0.009426, 0.011599, 0.00062)
+
+
+def _geographic_to_ecef(lon, lat, ellipsoid):
+    a, f = ellipsoid
+    e2 = f * (2 - f)
+    lam = numpy.radians(lon)
+    phi = numpy.radians(lat)
+    N = a / numpy.sqrt(1 - e2 * numpy.sin(phi) ** 2)
+    return N * numpy.cos(phi) * numpy.cos(lam), N * numpy.cos(phi) * numpy.sin(lam), N * (1 - e2) * numpy.sin(phi)
+
+
+def _ecef_to_geographic(X, Y, Z, ellipsoid):
+    a, f = ellipsoid
+    e2 = f * (2 - f)
+    p = numpy.hypot(X, Y)
+    phi = numpy.arctan2(Z, p * (1 - e2))
+    for i in range(4):                                                          # Converges to < 1e-12 rad for points near the earth's surface
+        N = a / numpy.sqrt(1 - e2 * numpy.sin(phi) ** 2)
+        h = p / numpy.cos(phi) - N
+        phi = numpy.arctan2(Z, p * (1 - e2 * N / (N + h)))
+    return numpy.degrees(numpy.arctan2(Y, X)), numpy.degrees(phi)
+
+
+def _helmert(lon, lat, parameters, fromEllipsoid, toEllipsoid, inverse=False):
+    dx, dy, dz, rx, ry, rz, ds = parameters
+    rx, ry, rz = [numpy.radians(r / 3600.0) for r in (rx, ry, rz)]
+    scale = 1 + ds * 1e-6
+    X, Y, Z = _geographic_to_ecef(lon, lat, fromEllipsoid)
+    if inverse:
+        X, Y, Z = (X - dx) / scale, (Y - dy) / scale, (Z - dz) / scale
+        X, Y, Z = X - rz * Y + ry * Z, rz * X + Y - rx * Z, -ry * X + rx * Y + Z
+    else:
+        X, Y, Z = X + rz * Y - ry * Z, -rz * X + Y + rx * Z, ry * X - rx * Y + Z
+        X, Y, Z = dx + scale * X, dy + scale * Y, dz + scale * Z
+    return _ecef_to_geographic(X, Y, Z, toEllipsoid)
+
+
+def wgs84_to_nad83(lon, lat):
+    """WGS 1984 (ITRF00) longitude/latitude to NAD 1983 longitude/latitude."""
+    return _helmert(numpy.asarray(lon, dtype=float), numpy.asarray(lat, dtype=float), ITRF00_TO_NAD83, WGS84, GRS80)
+
+
+def nad83_to_wgs84(lon, lat):
+    """NAD 1983 longitude/latitude to WGS 1984 (ITRF00) longitude/latitude."""
+    return _helmert(numpy.asarray(lon, dtype=float), numpy.asarray(lat, dtype=float), ITRF00_TO_NAD83, GRS80, WGS84, inverse=True)
+
+
+def _krueger(ellipsoid):
+    a, f = ellipsoid
+    n = f / (2 - f)
+    A = a / (1 + n) * (1 + n ** 2 / 4 + n ** 4 / 64)
+    alpha = (n / 2 - 2 * n ** 2 / 3 + 5 * n ** 3 / 16 + 41 * n ** 4 / 180,
+             13 * n ** 2 / 48 - 3 * n ** 3 / 5 + 557 * n ** 4 / 1440,
+             61 * n ** 3 / 240 - 103 * n ** 4 / 140,
+             49561 * n ** 4 / 161280)
+    beta = (n / 2 - 2 * n ** 2 / 3 + 37 * n ** 3 / 96 - n ** 4 / 360,
+            n ** 2 / 48 + n ** 3 / 15 - 437 * n ** 4 / 1440,
+            17 * n ** 3 / 480 - 37 * n ** 4 / 840,
+            4397 * n ** 4 / 161280)
+    delta = (2 * n - 2 * n ** 2 / 3 - 2 * n ** 3 + 116 * n ** 4 / 45,
+             7 * n ** 2 / 3 - 8 * n ** 3 / 5 - 227 * n ** 4 / 45,
+             56 * n ** 3 / 15 - 136 * n ** 4 / 35,
+             4279 * n ** 4 / 630)
+    return n, A, alpha, beta, delta
+
+
+def _utm_constants(zone):
+    return (zone * 6 - 183.0), 0.9996, 500000.0, 0.0                            # central meridian, scale factor, false easting, false northing (northern hemisphere)
+
+
+def geographic_to_utm(lon, lat, zone=13, ellipsoid=GRS80):
+    """Longitude/latitude to UTM easting/northing (northern hemisphere). Defaults to NAD 1983 UTM Zone 13N."""
+    lon = numpy.asarray(lon, dtype=float)
+    lat = numpy.asarray(lat, dtype=float)
+    lon0, k0, E0, N0 = _utm_constants(zone)
+    n, A, alpha, beta, delta = _krueger(ellipsoid)
+    phi = numpy.radians(lat)
+    lam = numpy.radians(lon - lon0)
+    c = 2 * numpy.sqrt(n) / (1 + n)
+    t = numpy.sinh(numpy.arctanh(numpy.sin(phi)) - c * numpy.arctanh(c * numpy.sin(phi)))
+    xi = numpy.arctan2(t, numpy.cos(lam))
+    eta = numpy.arctanh(numpy.sin(lam) / numpy.sqrt(1 + t ** 2))
+    easting = eta.copy()
+    northing = xi.copy()
+    for j, aj in enumerate(alpha, 1):
+        easting += aj * numpy.cos(2 * j * xi) * numpy.sinh(2 * j * eta)
+        northing += aj * numpy.sin(2 * j * xi) * numpy.cosh(2 * j * eta)
+    return E0 + k0 * A * easting, N0 + k0 * A * northing
+
+
+def utm_to_geographic(x, y, zone=13, ellipsoid=GRS80):
+    """UTM easting/northing (northern hemisphere) to longitude/latitude. Defaults to NAD 1983 UTM Zone 13N."""
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    lon0, k0, E0, N0 = _utm_constants(zone)
+    n, A, alpha, beta, delta = _krueger(ellipsoid)
+    xi = (y - N0) / (k0 * A)
+    eta = (x - E0) / (k0 * A)
+    xiPrime = xi.copy()
+    etaPrime = eta.copy()
+    for j, bj in enumerate(beta, 1):
+        xiPrime -= bj * numpy.sin(2 * j * xi) * numpy.cosh(2 * j * eta)
+        etaPrime -= bj * numpy.cos(2 * j * xi) * numpy.sinh(2 * j * eta)
+    chi = numpy.arcsin(numpy.sin(xiPrime) / numpy.cosh(etaPrime))
+    phi = chi.copy()
+    for j, dj in enumerate(delta, 1):
+        phi += dj * numpy.sin(2 * j * chi)
+    lam = numpy.arctan2(numpy.sinh(etaPrime), numpy.cos(xiPrime))
+    return lon0 + numpy.degrees(lam), numpy.degrees(phi)
+
+
+def geographic_to_web_mercator(lon, lat):
+    """WGS 1984 longitude/latitude to WGS 1984 Web Mercator (auxiliary sphere) x/y."""
+    lon = numpy.asarray(lon, dtype=float)
+    lat = numpy.clip(numpy.asarray(lat, dtype=float), -85.0511287798, 85.0511287798)
+    R = 6378137.0
+    return R * numpy.radians(lon), R * numpy.log(numpy.tan(numpy.pi / 4 + numpy.radians(lat) / 2))
+
+
+def wgs84_to_utm13(lon, lat):
+    """GPS (WGS 1984) longitude/latitude to NAD 1983 UTM Zone 13N, matching
+    Project_management(..., NAD83 UTM Zone 13N, "WGS_1984_(ITRF00)_To_NAD_1983")."""
+    nadLon, nadLat = wgs84_to_nad83(lon, lat)
+    return geographic_to_utm(nadLon, nadLat, 13, GRS80)
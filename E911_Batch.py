@@ -0,0 +1,192 @@
+#-------------------------------------------------------------------------------
+# Name:        E911 Batch Analysis
+''' Purpose:  Runs the E911 fire analysis for many fire origins at once (e.g. the
+              new starts after a lightning storm) instead of running the
+              "E911 Analysis - Fire Mapping" tool once per fire. Fire origins are
+              read from a CSV (Latitude, Longitude and optional FireName columns;
+              decimal degrees or "deg min sec") or a GeoJSON file of points, all
+              projected from WGS84 to NAD83 UTM Zone 13N in one vectorized
+              transform, and summarized across a pool of worker processes. Each
+              worker loads the E911 reference layers once (see E911_Reference.py).
+              Outputs (in the output folder):
+                E911_Batch_Results.csv  - one row per fire: origin attributes and
+                                          E911 addresses within 1 and 5 miles
+                Per Fire/<FireName>.csv - ownership acreage within 1 and 5 miles
+              Example:
+                python E911_Batch.py fires.csv "C:/Fires/Storm_0712" --workers 4
+'''
+#-------------------------------------------------------------------------------
+import argparse, csv, json, multiprocessing, os, re, sys, time
+import numpy
+import CRS_Transforms, E911_Reference
+
+REFERENCE_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Reference Files - Please don't alter", "E911 Analysis")
+BUFFER_MILES = (1, 5)
+patternFinder = re.compile('[\W]+')
+
+
+def open_csv(path, mode="r"):
+    """Open a file for the csv module on both Python 2 (ArcMap) and Python 3 (ArcGIS Pro)."""
+    if sys.version_info[0] < 3:
+        return open(path, mode + "b")
+    return open(path, mode, newline="")
+
+
+def dms_to_decimal(value, negative=False):
+    """Convert "35 41 12.5" (degrees minutes seconds) or "35.6868" to decimal degrees, the same way the
+    E911 Analysis tool does. Longitudes are forced negative (western hemisphere) when 'negative' is True."""
+    parts = str(value).split()
+    degrees = float(parts[0]) + sum(float(p) / d for p, d in zip(parts[1:3], (60.0, 3600.0)))
+    if negative:
+        degrees = -abs(degrees)
+    return round(degrees, 6) if len(parts) > 1 else degrees
+
+
+def read_fire_origins(path):
+    """Return a list of (fire name, latitude, longitude) from a CSV or GeoJSON file."""
+    fires = []
+    if os.path.splitext(path)[1].lower() in (".geojson", ".json"):
+        with open(path, "r") as f:
+            collection = json.load(f)
+        features = collection["features"] if collection.get("type") == "FeatureCollection" else [collection]
+        for i, feature in enumerate(features):
+            properties = feature.get("properties") or {}
+            longitude, latitude = feature["geometry"]["coordinates"][:2]
+            name = properties.get("FireName") or properties.get("Name") or properties.get("name") or "Fire_{0}".format(i + 1)
+            fires.append((name, float(latitude), float(longitude)))
+    else:
+        with open_csv(path) as f:
+            for i, row in enumerate(csv.DictReader(f)):
+                row = dict((key.strip().lower(), value) for key, value in row.items() if key)
+                latitude = row.get("latitude", row.get("lat"))
+                longitude = row.get("longitude", row.get("long", row.get("lon")))
+                if not latitude or not longitude:
+                    continue
+                name = row.get("firename") or row.get("name") or "Fire_{0}".format(i + 1)
+                fires.append((name, dms_to_decimal(latitude), dms_to_decimal(longitude, negative=True)))
+    return fires
+
+
+def file_names(fires):
+    """Fire names with characters that are illegal in file names removed; duplicates get a numeric suffix."""
+    names = []
+    used = set()
+    for fire in fires:
+        name = patternFinder.sub("", fire[0]) or "Fire"
+        newName, suffix = name, 1
+        while newName.lower() in used:
+            suffix += 1
+            newName = "{0}_{1}".format(name, suffix)
+        used.add(newName.lower())
+        names.append(newName)
+    return names
+
+
+# Worker processes ------------------------------------------------------------
+_reference = None
+
+
+def _init_worker(referenceFolder):
+    global _reference
+    _reference = E911_Reference.get_reference_data(referenceFolder)
+
+
+def analyze_fire(job):
+    """Summarize one projected fire origin. 'job' is (index, x, y); runs in a worker process."""
+    index, x, y = job
+    origin = []
+    for layerName, fields, values in _reference.origin_attributes(x, y):
+        origin.append((layerName, [field[0] for field in fields], values))
+    addresses = dict((miles, _reference.address_count(x, y, miles)) for miles in BUFFER_MILES)
+    ownership = dict((miles, _reference.ownership_acres(x, y, miles)) for miles in BUFFER_MILES)
+    return index, origin, addresses, ownership
+
+
+# Batch -----------------------------------------------------------------------
+def run_batch(fires, outputFolder, referenceFolder=REFERENCE_FILES, workers=None):
+    """Analyze all fires and write the consolidated and per-fire tables. Returns (results, elapsed seconds)."""
+    start = time.time()
+    names = file_names(fires)
+    latitudes = numpy.array([fire[1] for fire in fires], dtype=float)
+    longitudes = numpy.array([fire[2] for fire in fires], dtype=float)
+    xs, ys = CRS_Transforms.wgs84_to_utm13(longitudes, latitudes)             # One transform for every fire origin
+    jobs = [(i, float(xs[i]), float(ys[i])) for i in range(len(fires))]
+
+    workers = workers or multiprocessing.cpu_count()
+    if workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)), _init_worker, (referenceFolder,))
+        try:
+            results = pool.map(analyze_fire, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(referenceFolder)
+        results = [analyze_fire(job) for job in jobs]
+    results.sort()
+
+    perFire = os.path.join(outputFolder, "Per Fire")
+    if not os.path.exists(perFire):
+        os.makedirs(perFire)
+    write_results(os.path.join(outputFolder, "E911_Batch_Results.csv"), fires, xs, ys, results)
+    for index, origin, addresses, ownership in results:
+        with open_csv(os.path.join(perFire, "{0}.csv".format(names[index])), "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["FireName", "Buffer", "Ownership", "Acres"])
+            for miles in BUFFER_MILES:
+                for owner in sorted(ownership[miles], key=str):
+                    writer.writerow([fires[index][0], "{0} mile".format(miles), owner, round(ownership[miles][owner], 2)])
+    return results, time.time() - start
+
+
+def write_results(path, fires, xs, ys, results):
+    """Consolidated table: one row per fire. Origin attribute columns are named like Intersect_analysis would (NAME, NAME_1...)."""
+    header = ["FireName", "Latitude", "Longitude", "Easting", "Northing"]
+    originColumns = []                                                          # (layer, field) in column order
+    usedNames = list(header)
+    columnNames = []
+    for layerName, fields, values in (results[0][1] if results else []):
+        for field in fields:
+            originColumns.append((layerName, field))
+            columnNames.append(E911_Reference.unique_field_name(field, usedNames))
+    header += columnNames + ["Addresses{0}".format(miles) for miles in BUFFER_MILES] + ["OwnershipAcres{0}".format(miles) for miles in BUFFER_MILES]
+    with open_csv(path, "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for index, origin, addresses, ownership in results:
+            lookup = {}
+            for layerName, fields, values in origin:
+                for field, value in zip(fields, values or [None] * len(fields)):
+                    lookup[(layerName, field)] = value
+            row = [fires[index][0], fires[index][1], fires[index][2], round(float(xs[index]), 2), round(float(ys[index]), 2)]
+            row += [lookup.get(column) for column in originColumns]
+            row += [addresses[miles] for miles in BUFFER_MILES]
+            row += [round(sum(ownership[miles].values()), 2) for miles in BUFFER_MILES]
+            writer.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="E911 analysis for many fire origins at once.")
+    parser.add_argument("origins", help="CSV (Latitude, Longitude, FireName) or GeoJSON file of fire origins")
+    parser.add_argument("output_folder", help="Folder for E911_Batch_Results.csv and the per-fire tables")
+    parser.add_argument("--reference", default=REFERENCE_FILES, help="Folder with the E911 reference shapefiles")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="Number of worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    fires = read_fire_origins(args.origins)
+    outside = [fire for fire in fires if not (31.32 <= fire[1] <= 37 and -109.05 <= fire[2] <= -103.02)]
+    for fire in outside:
+        print("Skipping {0}: {1}, {2} is outside of New Mexico.".format(*fire))
+    fires = [fire for fire in fires if fire not in outside]
+    if not fires:
+        print("No fire origins to analyze.")
+        return
+    if not os.path.exists(args.output_folder):
+        os.makedirs(args.output_folder)
+    results, elapsed = run_batch(fires, args.output_folder, args.reference, args.workers)
+    print("Analyzed {0} fires with {1} worker(s) in {2:.2f} seconds ({3:.1f} fires per second).".format(len(results), args.workers, elapsed, len(results) / elapsed))
+    print("Results written to {0}".format(os.path.join(args.output_folder, "E911_Batch_Results.csv")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#-------------------------------------------------------------------------------
+# Name:        E911 Reference Data
+''' Purpose:  In-memory copy of the static E911 Analysis reference layers (E911
+              addresses, land ownership, counties, NMSF districts and PLSS
+              township/range). The shapefiles are read once and indexed with a
+              uniform grid, so the fire origin attributes and the number of E911
+              addresses within a 1 or 5 mile buffer are answered in milliseconds
+              instead of chaining Intersect_analysis and Clip_analysis on disk.
+              get_reference_data() keeps the loaded layers for the rest of the
+              session (ArcMap keeps the toolbox's Python interpreter running between
+              tool runs) and reloads them only if a reference file is modified.
+              All reference layers are expected in NAD83 UTM Zone 13N.
+'''
+#-------------------------------------------------------------------------------
+import os
+import numpy
+import Shapefile_IO
+
+METERS_PER_MILE = 1609.344
+SQ_METERS_PER_ACRE = 4046.8564224
+ADDRESSES = "Addresses_E911.shp"
+# (layer name, shapefile) in the order the fire origin attributes were previously intersected.
+ORIGIN_LAYERS = [("ownership", "E911_Land_Ownership.shp"),
+                 ("counties", "E911_County.shp"),
+                 ("district", "E911_NMSF_Districts.shp"),
+                 ("township_range", "E911_Township.shp")]
+
+
+class GridIndex(object):
+    """Uniform grid over feature bounding boxes. Each cell lists the features whose bounding box overlaps it."""
+
+    def __init__(self, bboxes, cellSize):
+        self.cellSize = float(cellSize)
+        self.bboxes = numpy.asarray(bboxes, dtype=float).reshape(-1, 4)
+        self.cells = {}
+        if len(self.bboxes) == 0:
+            self.x0 = self.y0 = 0.0
+            return
+        self.x0 = self.bboxes[:, 0].min()
+        self.y0 = self.bboxes[:, 1].min()
+        for i, (xmin, ymin, xmax, ymax) in enumerate(self.bboxes.tolist()):
+            ix0, iy0 = self._cell(xmin, ymin)
+            ix1, iy1 = self._cell(xmax, ymax)
+            for ix in range(ix0, ix1 + 1):
+                for iy in range(iy0, iy1 + 1):
+                    self.cells.setdefault((ix, iy), []).append(i)
+
+    def _cell(self, x, y):
+        return int((x - self.x0) // self.cellSize), int((y - self.y0) // self.cellSize)
+
+    def query_point(self, x, y):
+        """Return the features whose bounding box contains (x, y)."""
+        candidates = self.cells.get(self._cell(x, y), [])
+        return [i for i in candidates if self.bboxes[i, 0] <= x <= self.bboxes[i, 2] and self.bboxes[i, 1] <= y <= self.bboxes[i, 3]]
+
+    def query_bbox(self, xmin, ymin, xmax, ymax):
+        """Return the features whose bounding box overlaps the given bounding box."""
+        ix0, iy0 = self._cell(xmin, ymin)
+        ix1, iy1 = self._cell(xmax, ymax)
+        found = set()
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                found.update(self.cells.get((ix, iy), []))
+        return [i for i in sorted(found) if self.bboxes[i, 0] <= xmax and self.bboxes[i, 2] >= xmin and self.bboxes[i, 1] <= ymax and self.bboxes[i, 3] >= ymin]
+
+
+def ring_edges(rings):
+    """Edges of every ring of a polygon as (x1, y1, x2, y2) arrays. Rings are (n, 2) vertex arrays, closed (first vertex repeated)."""
+    starts = numpy.concatenate([ring[:-1] for ring in rings])
+    ends = numpy.concatenate([ring[1:] for ring in rings])
+    return starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+
+
+def edges_contain(edges, x, y):
+    """Even-odd ray casting test of (x, y) against the edges of all rings of a polygon (holes are handled by the parity)."""
+    x1, y1, x2, y2 = edges
+    crosses = (y1 > y) != (y2 > y)
+    if not crosses.any():
+        return False
+    x1, y1, x2, y2 = x1[crosses], y1[crosses], x2[crosses], y2[crosses]
+    xIntersect = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return int((x < xIntersect).sum()) % 2 == 1
+
+
+class PolygonLayer(object):
+    """Polygons held as edge arrays for fast point-in-polygon tests, plus their attributes."""
+
+    def __init__(self, shp, cellSize=5000.0):
+        self.path = shp
+        reader = Shapefile_IO.ShapefileReader(shp)
+        self.fields = reader.fields
+        self.records = []
+        self.parts = []                                                         # Per feature: list of ring vertex arrays
+        self.edges = []                                                         # Per feature: (x1, y1, x2, y2) arrays over all rings
+        bboxes = []
+        for shape, record in reader.iter_shape_records():
+            if not shape:
+                continue
+            rings = [numpy.array(ring, dtype=float) for ring in shape if len(ring) > 1]
+            if not rings:
+                continue
+            allPoints = numpy.concatenate(rings)
+            self.records.append(record)
+            self.parts.append(rings)
+            self.edges.append(ring_edges(rings))
+            bboxes.append((allPoints[:, 0].min(), allPoints[:, 1].min(), allPoints[:, 0].max(), allPoints[:, 1].max()))
+        self.index = GridIndex(bboxes, cellSize)
+
+    def __len__(self):
+        return len(self.records)
+
+    def contains(self, i, x, y):
+        """True if feature i contains (x, y)."""
+        return edges_contain(self.edges[i], x, y)
+
+    def locate(self, x, y):
+        """Return the indexes of all features that contain the point."""
+        return [i for i in self.index.query_point(x, y) if self.contains(i, x, y)]
+
+    def circle_areas(self, x, y, radius):
+        """Return {feature index: area (square meters) of the feature inside the circle} for every feature
+        overlapping a circle of 'radius' around (x, y). Equivalent to clipping with a true-curve buffer."""
+        areas = {}
+        for i in self.index.query_bbox(x - radius, y - radius, x + radius, y + radius):
+            x1, y1, x2, y2 = self.edges[i]
+            area = circle_intersection_area(x1 - x, y1 - y, x2 - x, y2 - y, radius)
+            if area > 0:
+                areas[i] = area
+        return areas
+
+
+def circle_intersection_area(x1, y1, x2, y2, r):
+    """Area of the intersection of a circle (radius r, centered at the origin) with a polygon given as edge
+    arrays relative to the circle's center. Each edge contributes the signed area of the circle clipped to
+    the triangle (center, start, end): the part of the edge inside the circle adds a triangle and the parts
+    outside add circular sectors. Summing over all rings handles holes; the absolute value is returned
+    because shapefile outer rings are clockwise."""
+    dx = x2 - x1
+    dy = y2 - y1
+    a = dx * dx + dy * dy
+    keep = a > 0
+    x1, y1, dx, dy, a = x1[keep], y1[keep], dx[keep], dy[keep], a[keep]
+    b = 2 * (x1 * dx + y1 * dy)
+    c = x1 * x1 + y1 * y1 - r * r
+    disc = numpy.maximum(b * b - 4 * a * c, 0)
+    root = numpy.sqrt(disc)
+    t1 = numpy.clip((-b - root) / (2 * a), 0, 1)                                # Where the edge enters and leaves the circle (clamped to the edge)
+    t2 = numpy.clip((-b + root) / (2 * a), 0, 1)
+    t2 = numpy.where(disc > 0, t2, t1)                                          # Edges whose line misses the circle are entirely outside
+    px1, py1 = x1 + t1 * dx, y1 + t1 * dy
+    px2, py2 = x1 + t2 * dx, y1 + t2 * dy
+    ex, ey = x1 + dx, y1 + dy
+
+    def sector(ux, uy, vx, vy):
+        return 0.5 * r * r * numpy.arctan2(ux * vy - uy * vx, ux * vx + uy * vy)
+
+    total = sector(x1, y1, px1, py1) + 0.5 * (px1 * py2 - py1 * px2) + sector(px2, py2, ex, ey)
+    return abs(float(total.sum()))
+
+
+class PointLayer(object):
+    """Point coordinates sorted by grid cell so a radius search only touches nearby cells."""
+
+    def __init__(self, shp, cellSize=METERS_PER_MILE):
+        self.path = shp
+        self.reader = Shapefile_IO.ShapefileReader(shp)
+        self.fields = self.reader.fields
+        xs, ys = self.reader.read_points()
+        valid = numpy.flatnonzero(~(numpy.isnan(xs) | numpy.isnan(ys)))
+        self.x = xs
+        self.y = ys
+        self.cellSize = float(cellSize)
+        if len(valid) == 0:
+            self.x0 = self.y0 = 0.0
+            self.rows = 1
+            self.cellIds = numpy.zeros(0, dtype=numpy.int64)
+            self.order = valid
+            return
+        self.x0 = xs[valid].min()
+        self.y0 = ys[valid].min()
+        ix = ((xs[valid] - self.x0) // self.cellSize).astype(numpy.int64)
+        iy = ((ys[valid] - self.y0) // self.cellSize).astype(numpy.int64)
+        self.rows = int(iy.max()) + 1
+        cellIds = ix * self.rows + iy
+        sort = numpy.argsort(cellIds, kind="mergesort")
+        self.cellIds = cellIds[sort]
+        self.order = valid[sort]                                                # Record numbers sorted by cell
+
+    def __len__(self):
+        return len(self.x)
+
+    def within(self, x, y, radius):
+        """Return the record numbers (sorted) of all points within 'radius' of (x, y)."""
+        if len(self.order) == 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+        ix0 = int((x - radius - self.x0) // self.cellSize)
+        ix1 = int((x + radius - self.x0) // self.cellSize)
+        iy0 = max(int((y - radius - self.y0) // self.cellSize), 0)
+        iy1 = min(int((y + radius - self.y0) // self.cellSize), self.rows - 1)
+        if iy0 > iy1:
+            return numpy.zeros(0, dtype=numpy.int64)
+        slices = []
+        for ix in range(max(ix0, 0), ix1 + 1):                                  # Cells in one grid column are contiguous in the sorted order
+            lo, hi = numpy.searchsorted(self.cellIds, [ix * self.rows + iy0, ix * self.rows + iy1 + 1])
+            if hi > lo:
+                slices.append(self.order[lo:hi])
+        if not slices:
+            return numpy.zeros(0, dtype=numpy.int64)
+        candidates = numpy.concatenate(slices)
+        dx = self.x[candidates] - x
+        dy = self.y[candidates] - y
+        return numpy.sort(candidates[dx * dx + dy * dy <= radius * radius])
+
+
+class ReferenceData(object):
+    """All E911 Analysis reference layers loaded into memory from the reference files folder."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.signature = reference_signature(folder)
+        self.addresses = PointLayer(os.path.join(folder, ADDRESSES))
+        self.layers = [(name, PolygonLayer(os.path.join(folder, shp))) for name, shp in ORIGIN_LAYERS]
+
+    def origin_attributes(self, x, y):
+        """Return [(layer name, fields, values)] for each reference layer at the fire origin. 'values' is
+        None if the point falls in a gap of that layer (e.g. gaps in PLSS township/range coverage).
+        Where polygons overlap, the first one in the shapefile is used."""
+        results = []
+        for name, layer in self.layers:
+            found = layer.locate(x, y)
+            results.append((name, layer.fields, layer.records[found[0]] if found else None))
+        return results
+
+    def address_indexes(self, x, y, miles):
+        """Record numbers of the E911 addresses within 'miles' of (x, y)."""
+        return self.addresses.within(x, y, miles * METERS_PER_MILE)
+
+    def address_count(self, x, y, miles):
+        return int(len(self.address_indexes(x, y, miles)))
+
+    def ownership_acres(self, x, y, miles, field="Ownership"):
+        """Return {ownership: acres} of land ownership within 'miles' of (x, y), the same totals as
+        clipping E911_Land_Ownership.shp with the buffer and dissolving on 'field'."""
+        layer = self.layers[0][1]
+        position = [f[0] for f in layer.fields].index(field) if field in [f[0] for f in layer.fields] else None
+        acres = {}
+        for i, area in layer.circle_areas(x, y, miles * METERS_PER_MILE).items():
+            key = layer.records[i][position] if position is not None else i
+            acres[key] = acres.get(key, 0.0) + area / SQ_METERS_PER_ACRE
+        return acres
+
+    def write_addresses(self, indexes, outFC, spatialReference):
+        """Write the given E911 address records to a new point feature class with the same fields as Addresses_E911.shp."""
+        import arcpy
+
+        path, name = os.path.split(outFC)
+        arcpy.CreateFeatureclass_management(path, name, "POINT", self.addresses.path, "DISABLED", "DISABLED", spatialReference)
+        outFields = set(field.name for field in arcpy.ListFields(outFC))
+        positions = [i for i, field in enumerate(self.addresses.reader.fieldNames) if field in outFields]
+        cursorFields = ["SHAPE@XY"] + [self.addresses.reader.fieldNames[i] for i in positions]
+        with arcpy.da.InsertCursor(outFC, cursorFields) as cursor:
+            for i, record in zip(indexes, self.addresses.reader.read_records(indexes)):
+                cursor.insertRow([(float(self.addresses.x[i]), float(self.addresses.y[i]))] + [record[j] for j in positions])
+
+
+def reference_signature(folder):
+    """Modification time and size of every reference file, used to notice when the reference data is updated."""
+    signature = []
+    for shp in [ADDRESSES] + [layer[1] for layer in ORIGIN_LAYERS]:
+        for extension in (".shp", ".dbf"):
+            path = os.path.join(folder, os.path.splitext(shp)[0] + extension)
+            if os.path.exists(path):
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime, stat.st_size))
+    return tuple(signature)
+
+
+_cache = {}
+
+
+def get_reference_data(folder):
+    """Return the ReferenceData for 'folder', loading it only on first use or after the files change."""
+    folder = os.path.abspath(folder)
+    reference = _cache.get(folder)
+    if reference is None or reference.signature != reference_signature(folder):
+        reference = ReferenceData(folder)
+        _cache[folder] = reference
+    return reference
+
+
+def unique_field_name(name, usedNames):
+    """Mimic Intersect_analysis naming of duplicate fields (NAME, NAME_1, NAME_2...) and record the name as used."""
+    used = set(n.upper() for n in usedNames)
+    newName = name
+    suffix = 0
+    while newName.upper() in used:
+        suffix += 1
+        newName = "{0}_{1}".format(name, suffix)
+    usedNames.append(newName)
+    return newName
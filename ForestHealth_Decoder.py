@@ -0,0 +1,197 @@
+#-------------------------------------------------------------------------------
+# Name:        Forest Health Decoder
+''' Purpose:  Lookup tables used by the "Forest Health Shapefile Developer" tool to
+              translate the USFS aerial detection survey (ADS) codes into readable
+              descriptions. Every derived field is decoded from one table, so a row
+              only has to be visited once no matter how many fields are added.
+              decode_row() is used with an arcpy.da.UpdateCursor and decode_records()
+              works on plain record arrays (e.g. arcpy.da.FeatureClassToNumPyArray)
+              so the tables can be checked without ArcGIS.
+              Codes not found in a table are written as "Script Failed" and counted,
+              so new codes from subsequent surveys can be added below.
+              Reference: https://www.fs.fed.us/foresthealth/technology/ads_standards.shtml
+'''
+#-------------------------------------------------------------------------------
+UNMAPPED = "Script Failed"
+
+# Damage causing agent (DCA1, DCA2, DCA3)
+DCA_CODES = {
+    11007: "Douglas-fir beetle",
+    11009: "Spruce beetle",
+    11015: "Western balsam bark beetle",
+    11019: "Pinyon Ips",
+    11035: "Cedar bark beetles",
+    11050: "Fir engraver",
+    11900: "Unknown bark beetle",
+    12004: "Needleminers",
+    12005: "Sawflies",
+    12040: "Western spruce budworm",
+    12123: "Douglas-fir tussock moth",
+    12141: "Elm leaf beetle",
+    12239: "Tamarisk Leaf Beetles",
+    12800: "Other defoliator",
+    12900: "Unknown defoliator",
+    14029: "Pinyon needle scale",
+    25005: "Needlecast",
+    29002: "Sudden Aspen Decline",
+    50003: "Drought",
+    50013: "Wind-tornado/hurricane",
+    70008: "Mechanical",
+    71001: "Woodland cutting",
+    90000: "Unknown",
+    90009: "Mortality"}
+
+# Only the 2nd and 3rd damage agents use 99999 when no additional agent was recorded.
+DCA_CODES_SECONDARY = dict(DCA_CODES)
+DCA_CODES_SECONDARY[99999] = "No Data"
+
+# Host species (HOST1, HOST2, HOST3)
+HOST_CODES = {
+    -1: "No Data",
+    15: "White Fir",
+    18: "Corbark Fir",
+    57: "Redcedar; Juniper",
+    90: "Spruce Species",
+    93: "Engelmann Spruce",
+    102: "Bristlecone Pine",
+    106: "Common Pinyon",
+    114: "Southwestern White Pine",
+    122: "Ponderosa Pine",
+    202: "Douglas-Fir",
+    299: "Unknown Conifer(s)",
+    740: "Cottonwood, Poplar",
+    746: "Quaking Aspen",
+    800: "Oak",
+    991: "Saltcedar",
+    998: "Not listed",
+    9998: "Not listed"}
+
+# Forest type (FOR_TYPE1, FOR_TYPE2, FOR_TYPE3)
+FOREST_TYPE_CODES = {
+    -1: "No Data",
+    3000: "Western Fir-Spruce",
+    6740: "Cottonwood",
+    6746: "Quaking Aspen",
+    7141: "Pinyon-Juniper",
+    9000: "Mixed Conifers",
+    9301: "ABCO, PSME, PIEN",                                                   # Douglas-fir, Engelmann spruce, white fir
+    9305: "CUAR, JUDE, JUMO, JUSC, JUOS",                                       # Alligator juniper, Arizona cypress, oneseed juniper, Rocky Mountain juniper, Utah juniper
+    9311: "ABCO, PSME, ABLAA, PIEN",                                            # corkbark fir, Douglas-fir, Engelmann spruce, white fir
+    9315: "POFR2, POAN3",                                                       # Fremont cottonwood, narrowleaf cottonwood
+    9316: "QUAR, QUGA, QUOB, GUGR3"}                                            # Arizona white oak, gambel oak, gray oak, Mexican blue oak
+
+# Percent mortality (PCT_MORT1, PCT_MORT2, PCT_MORT3)
+MORTALITY_CODES = {
+    -1: "No Data",
+    1: "Very Light (1-3%)",
+    2: "Light (4-10%)",
+    3: "Moderate (11-29%)",
+    4: "Severe (30-50%)",
+    5: "Very severe (>50%)"}
+
+# Damage type (DMG_TYPE1, DMG_TYPE2, DMG_TYPE3)
+DAMAGE_TYPE_CODES = {
+    -1: "No Data",
+    1: "Defoliation",
+    2: "Mortality",
+    3: "Discoloration",
+    4: "Dieback",
+    5: "Topkill",
+    6: "Branch breakage",
+    7: "Main stem broken/uprooted",
+    8: "Branch flagging",
+    9: "No damage",
+    10: "Other damage",
+    11: "Previously undocumented (old) mortality",
+    12: "Defoliation - Light (<50% of foliage)",
+    13: "Defoliation - Moderate (50-75% foliage)",
+    14: "Defoliation - Heavy (>75% of foliage)"}
+
+# Defoliation severity (SEVERITY1, SEVERITY2, SEVERITY3)
+SEVERITY_CODES = {
+    -1: "No Data",
+    1: "Low (Equal to or less than 50% defoliation)",
+    2: "High (More than 50% defoliation)"}
+
+# (USFS code field, new description field, text length of new field, lookup table) in the order the new fields are added.
+DECODE_FIELDS = [
+    ("DCA1", "Damage_Ag1", 35, DCA_CODES),
+    ("DCA2", "Damage_Ag2", 35, DCA_CODES_SECONDARY),
+    ("DCA3", "Damage_Ag3", 35, DCA_CODES_SECONDARY),
+    ("HOST1", "Host_Spec1", 25, HOST_CODES),
+    ("HOST2", "Host_Spec2", 25, HOST_CODES),
+    ("HOST3", "Host_Spec3", 25, HOST_CODES),
+    ("FOR_TYPE1", "Frst_Type1", 50, FOREST_TYPE_CODES),
+    ("FOR_TYPE2", "Frst_Type2", 50, FOREST_TYPE_CODES),
+    ("FOR_TYPE3", "Frst_Type3", 50, FOREST_TYPE_CODES),
+    ("PCT_MORT1", "Pcnt_Mort1", 25, MORTALITY_CODES),
+    ("PCT_MORT2", "Pcnt_Mort2", 25, MORTALITY_CODES),
+    ("PCT_MORT3", "Pcnt_Mort3", 25, MORTALITY_CODES),
+    ("DMG_TYPE1", "Dmg_Typ1", 50, DAMAGE_TYPE_CODES),
+    ("DMG_TYPE2", "Dmg_Typ2", 50, DAMAGE_TYPE_CODES),
+    ("DMG_TYPE3", "Dmg_Typ3", 50, DAMAGE_TYPE_CODES),
+    ("SEVERITY1", "Svrty_1", 45, SEVERITY_CODES),
+    ("SEVERITY2", "Svrty_2", 45, SEVERITY_CODES),
+    ("SEVERITY3", "Svrty_3", 45, SEVERITY_CODES)]
+
+SOURCE_FIELDS = [f[0] for f in DECODE_FIELDS]
+NEW_FIELDS = [f[1] for f in DECODE_FIELDS]
+
+
+def new_unmapped_counter():
+    """Return an empty {new field: {code: count}} dictionary for tracking codes missing from the tables."""
+    return dict((field, {}) for field in NEW_FIELDS)
+
+
+def decode_row(codes, unmapped=None):
+    """Decode one row of USFS codes (ordered like SOURCE_FIELDS) into a list of descriptions
+    (ordered like NEW_FIELDS). Codes missing from a table become "Script Failed" and are tallied
+    in 'unmapped' if a counter from new_unmapped_counter() is provided."""
+    labels = []
+    for code, (source, field, length, lookup) in zip(codes, DECODE_FIELDS):
+        label = lookup.get(code)
+        if label is None:
+            label = UNMAPPED
+            if unmapped is not None:
+                unmapped[field][code] = unmapped[field].get(code, 0) + 1
+        labels.append(label)
+    return labels
+
+
+def decode_records(records):
+    """Decode a whole table at once. 'records' is anything indexable by field name that returns a
+    column of codes, e.g. a numpy record array from arcpy.da.FeatureClassToNumPyArray or a dict of
+    lists. Each distinct code is only looked up once per field. Returns a tuple of
+    ({new field: numpy array of descriptions}, {new field: {unmapped code: count}})."""
+    import numpy
+
+    nullCode = -9999
+    decoded = {}
+    unmapped = new_unmapped_counter()
+    for source, field, length, lookup in DECODE_FIELDS:
+        column = numpy.asarray(records[source])
+        if column.dtype == object:                                              # Null values (None) can't be sorted by numpy.unique
+            column = numpy.array([nullCode if code is None else code for code in column.tolist()])
+        codes, inverse = numpy.unique(column, return_inverse=True)
+        counts = numpy.bincount(inverse.ravel(), minlength=len(codes))
+        labels = numpy.empty(len(codes), dtype=object)
+        for i, code in enumerate(codes.tolist()):
+            label = lookup.get(code)
+            if label is None:
+                label = UNMAPPED
+                unmapped[field][None if code == nullCode else code] = int(counts[i])
+            labels[i] = label
+        decoded[field] = labels[inverse.ravel()]
+    return decoded, unmapped
+
+
+def unmapped_messages(unmapped):
+    """Summarize an unmapped counter as a list of messages (one per field with missing codes)."""
+    messages = []
+    for field in NEW_FIELDS:
+        codes = unmapped.get(field)
+        if codes:
+            total = sum(codes.values())
+            codeList = ", ".join("{0} ({1} rows)".format(code, codes[code]) for code in sorted(codes, key=str))
+            messages.append("{0}: {1} rows set to '{2}'. Codes not in ForestHealth_Decoder.py: {3}".format(field, total, UNMAPPED, codeList))
+    return messages
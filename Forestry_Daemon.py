@@ -0,0 +1,407 @@
+#-------------------------------------------------------------------------------
+# Name:        Forestry Tools Daemon
+''' Purpose:  Long-running local worker process for the Forestry Tools. Reference
+              data (E911 layers, slope rasters) is loaded on first use and kept in
+              memory, along with the lookup tables of the helper modules, so jobs
+              don't pay for imports and reference file loading on every run. Jobs
+              are submitted over a local socket (127.0.0.1 only, with an authkey),
+              queued, and run by a bounded pool of worker threads. The authkey is
+              random, created by the first "serve" and kept in a file only the
+              user can read (KEY_FILE); clients read it from there. Tools call
+              submit_or_run(), which falls back to running the job in-process when
+              the daemon isn't running or fails, so results are the same either way.
+              The "metrics" request reports cold (first) and warm job latency for
+              each job type and how long each reference dataset took to load.
+              Example:
+                python Forestry_Daemon.py serve --workers 4 --preload
+                python Forestry_Daemon.py submit e911_origin "{\"latitude\": 35.68, \"longitude\": -105.93}"
+                python Forestry_Daemon.py metrics
+                python Forestry_Daemon.py stop
+'''
+#-------------------------------------------------------------------------------
+import argparse, binascii, errno, json, os, socket, threading, time
+from multiprocessing.connection import Client, Listener, answer_challenge, deliver_challenge
+from multiprocessing.pool import ThreadPool
+startTime = time.time()
+import numpy
+import CRS_Transforms, E911_Batch, E911_Reference, ForestHealth_Decoder, Slope_Zonal, WKT_Export
+importSeconds = time.time() - startTime
+
+ADDRESS = ("127.0.0.1", 50911)
+KEY_FILE = os.environ.get("FORESTRY_DAEMON_KEY_FILE", os.path.join(os.path.expanduser("~"), ".forestry_daemon_key"))
+CONNECT_TIMEOUT = 2.0                                                           # Seconds to wait for the daemon to accept a connection
+NOT_RUNNING = (errno.ECONNREFUSED, 10061)                                       # 10061 = WSAECONNREFUSED (Windows)
+REFERENCE_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Reference Files - Please don't alter")
+E911_FILES = os.path.join(REFERENCE_FILES, "E911 Analysis")
+SLOPE_FILES = os.path.join(REFERENCE_FILES, "Polygon Slope Analysis")
+
+
+# Warm reference data ---------------------------------------------------------
+_resources = {}                                                                 # (kind, folder) -> (signature, data)
+_resourceMetrics = {}                                                           # "kind: folder" -> {"loads", "loadSeconds", "hits"}
+_resourceLock = threading.Lock()
+
+
+def file_signature(paths):
+    return tuple((path, os.path.getmtime(path), os.path.getsize(path)) for path in paths if os.path.exists(path))
+
+
+def resource(kind, folder, signature, loader):
+    """Return the cached 'kind' of reference data for 'folder', calling loader() on first use or when 'signature' changes."""
+    key = (kind, os.path.abspath(folder))
+    name = "{0}: {1}".format(*key)
+    with _resourceLock:
+        metrics = _resourceMetrics.setdefault(name, {"loads": 0, "loadSeconds": [], "hits": 0})
+        cached = _resources.get(key)
+        if cached and cached[0] == signature:
+            metrics["hits"] += 1
+            return cached[1]
+        start = time.time()
+        data = loader()
+        metrics["loads"] += 1
+        metrics["loadSeconds"].append(round(time.time() - start, 4))
+        _resources[key] = (signature, data)
+        return data
+
+
+def e911_reference(folder=E911_FILES):
+    return resource("E911 reference", folder, E911_Reference.reference_signature(folder), lambda: E911_Reference.ReferenceData(folder))
+
+
+def slope_rasters(folder=SLOPE_FILES):
+    paths = dict((t, os.path.join(folder, "slope_{0}%.tif".format(t))) for t in Slope_Zonal.THRESHOLDS)
+    return resource("Slope rasters", folder, file_signature(paths.values()),
+                    lambda: Slope_Zonal.SlopeRasters(reclassified=dict((t, Slope_Zonal.open_raster(path)) for t, path in paths.items())))
+
+
+# Authkey ---------------------------------------------------------------------
+def read_authkey(path=KEY_FILE):
+    """The daemon's authkey, or None if no key file has been created yet."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read().strip() or None
+
+
+def create_authkey(path=KEY_FILE):
+    """Return the existing authkey, or write a new random one to a file only the user can read or write."""
+    authkey = read_authkey(path)
+    if authkey:
+        return authkey
+    authkey = binascii.hexlify(os.urandom(32))
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)    # Permissions apply to the new file; on Windows the user profile folder is already private
+    try:
+        os.write(descriptor, authkey)
+    finally:
+        os.close(descriptor)
+    return authkey
+
+
+# Jobs ------------------------------------------------------------------------
+JOBS = {}
+
+
+def job(name):
+    def register(function):
+        JOBS[name] = function
+        return function
+    return register
+
+
+@job("ping")
+def ping():
+    return {"pid": os.getpid(), "uptime": time.time() - startTime}
+
+
+@job("e911_origin")
+def e911_origin(latitude=None, longitude=None, x=None, y=None, referenceFolder=E911_FILES, miles=E911_Batch.BUFFER_MILES):
+    """Origin attributes, address counts and ownership acres for one fire origin (GPS lat/long or NAD83 UTM 13N x/y)."""
+    if x is None:
+        xs, ys = CRS_Transforms.wgs84_to_utm13([longitude], [latitude])
+        x, y = float(xs[0]), float(ys[0])
+    reference = e911_reference(referenceFolder)
+    return {"x": x, "y": y,
+            "origin": [(name, [field[0] for field in fields], values) for name, fields, values in reference.origin_attributes(x, y)],
+            "addresses": dict((m, reference.address_count(x, y, m)) for m in miles),
+            "ownership": dict((m, reference.ownership_acres(x, y, m)) for m in miles)}
+
+
+@job("e911_batch")
+def e911_batch(origins, outputFolder, referenceFolder=E911_FILES):
+    """Run E911_Batch for a CSV/GeoJSON file of fire origins with the daemon's warm reference data."""
+    fires = E911_Batch.read_fire_origins(origins)
+    if not os.path.exists(outputFolder):
+        os.makedirs(outputFolder)
+    E911_Reference._cache[os.path.abspath(referenceFolder)] = e911_reference(referenceFolder)   # E911_Batch workers use get_reference_data()
+    results, elapsed = E911_Batch.run_batch(fires, outputFolder, referenceFolder, workers=1)
+    return {"fires": len(results), "seconds": elapsed}
+
+
+@job("slope_zonal")
+def slope_zonal(zones, referenceFolder=SLOPE_FILES):
+    """Slope_Zonal.zonal_slope_acres() for a list of (zone name, rings) with the daemon's open slope rasters."""
+    return Slope_Zonal.zonal_slope_acres(zones, slope_rasters(referenceFolder))
+
+
+@job("forest_health_decode")
+def forest_health_decode(records):
+    """ForestHealth_Decoder.decode_records() for {source field: [codes]}."""
+    return ForestHealth_Decoder.decode_records(records)
+
+
+@job("wkt_export")
+def wkt_export(inputPolygon, textFile, crsName, decimals=None, tolerance=0):
+    return WKT_Export.write_multipolygon_wkt(inputPolygon, textFile, crsName, decimals, tolerance)
+
+
+def run_job(name, args):
+    if name not in JOBS:
+        raise ValueError("Unknown job '{0}'. Available jobs: {1}".format(name, ", ".join(sorted(JOBS))))
+    return JOBS[name](**args)
+
+
+# Server ----------------------------------------------------------------------
+def no_delay(connection):
+    """Disable Nagle's algorithm on a connection; small request/response messages otherwise wait ~40 ms for delayed ACKs."""
+    try:
+        sock = socket.fromfd(connection.fileno(), socket.AF_INET, socket.SOCK_STREAM)   # Duplicate of the same socket
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.close()
+    except (AttributeError, OSError, socket.error):                             # socket.fromfd isn't available on Windows in Python 2
+        pass
+
+
+class Daemon(object):
+    """Accepts job requests on a local socket and runs them on a bounded pool of worker threads. At most
+    'maxConnections' clients are served at once (one handler thread each); others are told the daemon is busy."""
+
+    def __init__(self, address=ADDRESS, authkey=None, workers=4, maxQueue=64, maxConnections=16):
+        self.authkey = authkey or read_authkey()
+        if not self.authkey:
+            raise RuntimeError("No daemon key in {0}. Start the daemon with 'python Forestry_Daemon.py serve' to create one.".format(KEY_FILE))
+        self.address = address
+        self.pool = ThreadPool(workers)
+        self.workers = workers
+        self.maxQueue = maxQueue
+        self.connections = threading.BoundedSemaphore(maxConnections)
+        self.maxConnections = maxConnections
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.jobMetrics = {}
+        self.startupSeconds = None
+        self.running = False
+
+    def preload(self):
+        """Load the reference data before the first job so even the first request is warm."""
+        messages = []
+        for name, loader in (("E911 reference", e911_reference), ("Slope rasters", slope_rasters)):
+            try:
+                loader()
+            except Exception as e:
+                messages.append("{0} not preloaded: {1}".format(name, e))
+        return messages
+
+    def _record(self, name, seconds, error):
+        with self.lock:
+            metrics = self.jobMetrics.setdefault(name, {"count": 0, "errors": 0, "coldSeconds": None, "warmSeconds": []})
+            metrics["count"] += 1
+            metrics["errors"] += bool(error)
+            if metrics["coldSeconds"] is None:
+                metrics["coldSeconds"] = round(seconds, 4)
+            else:
+                metrics["warmSeconds"].append(seconds)
+
+    def metrics(self):
+        """Cold vs warm latency per job type plus reference data load times."""
+        jobs = {}
+        with self.lock:
+            for name, metrics in self.jobMetrics.items():
+                warm = numpy.array(metrics["warmSeconds"] or [numpy.nan])
+                jobs[name] = {"count": metrics["count"], "errors": metrics["errors"], "coldSeconds": metrics["coldSeconds"],
+                              "warmMeanSeconds": None if numpy.isnan(warm).all() else round(float(numpy.mean(warm)), 4),
+                              "warmMedianSeconds": None if numpy.isnan(warm).all() else round(float(numpy.median(warm)), 4),
+                              "warmMaxSeconds": None if numpy.isnan(warm).all() else round(float(numpy.max(warm)), 4)}
+            pending = self.pending
+        return {"pid": os.getpid(), "uptimeSeconds": round(time.time() - startTime, 1), "importSeconds": round(importSeconds, 4),
+                "startupSeconds": self.startupSeconds, "workers": self.workers, "pending": pending,
+                "jobs": jobs, "resources": dict((name, dict(m)) for name, m in _resourceMetrics.items())}
+
+    def _timed_job(self, name, args):
+        start = time.time()
+        try:
+            result = run_job(name, args)
+            error = None
+        except Exception as e:
+            result, error = None, "{0}: {1}".format(type(e).__name__, e)
+        seconds = time.time() - start
+        self._record(name, seconds, error)
+        return result, error, seconds
+
+    def handle(self, connection):
+        try:
+            while True:
+                try:
+                    request = connection.recv()
+                except EOFError:
+                    break
+                name = request.get("job")
+                if name == "metrics":
+                    connection.send({"ok": True, "result": self.metrics()})
+                elif name == "stop":
+                    self.running = False
+                    connection.send({"ok": True, "result": "stopping"})
+                    Client(self.address, authkey=self.authkey).close()             # Wake up accept() so serve_forever() can exit
+                elif name not in JOBS:
+                    connection.send({"ok": False, "error": "Unknown job '{0}'. Available jobs: {1}".format(name, ", ".join(sorted(JOBS)))})
+                else:
+                    with self.lock:
+                        busy = self.pending >= self.maxQueue
+                        if not busy:
+                            self.pending += 1
+                    if busy:
+                        connection.send({"ok": False, "error": "Daemon is busy ({0} jobs queued); try again later.".format(self.maxQueue)})
+                        continue
+                    queued = time.time()
+                    try:
+                        result, error, seconds = self.pool.apply_async(self._timed_job, (name, request.get("args") or {})).get()
+                    finally:
+                        with self.lock:
+                            self.pending -= 1
+                    connection.send({"ok": error is None, "result": result, "error": error, "seconds": seconds, "waitSeconds": time.time() - queued - seconds})
+        finally:
+            connection.close()
+            self.connections.release()
+
+    def serve_forever(self, preload=False):
+        listener = Listener(self.address, backlog=32, authkey=self.authkey)
+        messages = self.preload() if preload else []
+        self.startupSeconds = round(time.time() - startTime, 4)
+        self.running = True
+        for message in messages:
+            print(message)
+        print("Forestry Tools daemon listening on {0}:{1} with {2} workers (started in {3:.2f} seconds).".format(self.address[0], self.address[1], self.workers, self.startupSeconds))
+        try:
+            while self.running:
+                try:
+                    connection = listener.accept()
+                except Exception:                                               # e.g. a client with the wrong authkey
+                    continue
+                no_delay(connection)
+                if not self.connections.acquire(False):
+                    try:
+                        connection.send({"ok": False, "error": "Daemon is busy ({0} clients connected); try again later.".format(self.maxConnections)})
+                    finally:
+                        connection.close()
+                    continue
+                thread = threading.Thread(target=self.handle, args=(connection,))
+                thread.daemon = True
+                thread.start()
+        finally:
+            listener.close()
+            self.pool.close()
+            self.pool.join()
+
+
+# Client ----------------------------------------------------------------------
+class NotRunning(IOError):
+    """The daemon isn't running (nothing listening, or no key file yet)."""
+
+
+def connect(address=ADDRESS, authkey=None, timeout=CONNECT_TIMEOUT):
+    """One connection attempt to the daemon. multiprocessing's Client() retries a refused connection
+    for 20 seconds in Python 2, which would delay every tool run while the daemon is stopped."""
+    authkey = authkey or read_authkey()
+    if not authkey:
+        raise NotRunning("No daemon key in {0}".format(KEY_FILE))
+    try:
+        sock = socket.create_connection(address, timeout)
+    except socket.error as e:
+        if e.args and e.args[0] in NOT_RUNNING:
+            raise NotRunning("Nothing is listening on {0}:{1}".format(*address))
+        raise
+    try:
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if hasattr(sock, "detach"):                                             # Python 3
+            from multiprocessing.connection import Connection
+            connection = Connection(sock.detach())
+        else:
+            import _multiprocessing
+            from multiprocessing.forking import duplicate
+            connection = _multiprocessing.Connection(duplicate(sock.fileno()))
+    finally:
+        sock.close()
+    try:
+        answer_challenge(connection, authkey)
+        deliver_challenge(connection, authkey)
+    except Exception:
+        connection.close()
+        raise
+    return connection
+
+
+def submit(name, address=ADDRESS, authkey=None, **args):
+    """Run a job on the daemon and return its result. Raises RuntimeError if the job failed."""
+    connection = connect(address, authkey)
+    try:
+        connection.send({"job": name, "args": args})
+        response = connection.recv()
+    finally:
+        connection.close()
+    if not response["ok"]:
+        raise RuntimeError(response["error"])
+    return response["result"]
+
+
+def warn(message):
+    """AddWarning in a tool run, print otherwise."""
+    try:
+        import arcpy
+    except ImportError:
+        print(message)
+        return
+    arcpy.AddWarning(message)
+
+
+def submit_or_run(name, **args):
+    """Run a job on the daemon if it's running, otherwise in this process. If the daemon can't be reached
+    or the job fails there, it is run in this process too, with a warning."""
+    try:
+        return submit(name, **args)
+    except NotRunning:
+        pass
+    except Exception as e:
+        warn("Forestry Tools daemon: {0} job failed ({1}: {2}); running it in this process instead.".format(name, type(e).__name__, e))
+    return run_job(name, args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Long-running worker process for the Forestry Tools.")
+    subparsers = parser.add_subparsers(dest="command")
+    serve = subparsers.add_parser("serve", help="Start the daemon")
+    serve.add_argument("--workers", type=int, default=4, help="Jobs run at the same time (default: 4)")
+    serve.add_argument("--max-queue", type=int, default=64, help="Jobs accepted before new requests are refused (default: 64)")
+    serve.add_argument("--max-connections", type=int, default=16, help="Clients served at once (default: 16)")
+    serve.add_argument("--preload", action="store_true", help="Load the reference data before accepting jobs")
+    send = subparsers.add_parser("submit", help="Submit a job and print its result as JSON")
+    send.add_argument("job", help="One of: {0}".format(", ".join(sorted(JOBS))))
+    send.add_argument("arguments", nargs="?", default="{}", help="Job arguments as a JSON object")
+    subparsers.add_parser("metrics", help="Print cold vs warm latency metrics")
+    subparsers.add_parser("stop", help="Stop the daemon")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        Daemon(authkey=create_authkey(), workers=args.workers, maxQueue=args.max_queue, maxConnections=args.max_connections).serve_forever(args.preload)
+    elif args.command == "submit":
+        start = time.time()
+        result = submit(args.job, **json.loads(args.arguments))
+        print(json.dumps(result, indent=1, default=str))
+        print("Round trip: {0:.3f} seconds".format(time.time() - start))
+    elif args.command in ("metrics", "stop"):
+        print(json.dumps(submit(args.command), indent=1, default=str))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
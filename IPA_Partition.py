@@ -0,0 +1,193 @@
+#-------------------------------------------------------------------------------
+# Name:        IPA Partition
+''' Purpose:  One-pass spatial partitioner used by IPAs.py. The county and district
+              boundaries are read once and indexed with a uniform grid, every IPA
+              and IPA plant hexagon is assigned to all the regions (and its site)
+              it intersects in a single pass over each layer, and the partitions
+              are then written by a pool of worker processes, each copying its
+              features byte for byte in one sequential read of the input. This
+              replaces a MakeFeatureLayer/SelectLayerByLocation/CopyFeatures round
+              (a full rescan of the IPA layer) per county, district and site.
+              Partitions without any features are skipped instead of being
+              written as empty shapefiles. Intersection is inclusive, like the
+              "INTERSECT" overlap type: features touching a boundary belong to
+              both regions.
+'''
+#-------------------------------------------------------------------------------
+import multiprocessing, os, re
+import numpy
+import E911_Reference, Shapefile_IO, Tool_Timing
+
+MAX_OPEN_WRITERS = 150                                                          # Output shapefiles one worker keeps open at once (3 files each)
+EDGE_BLOCK = 1000000                                                            # Edge pairs tested for crossing at once
+patternFinder = re.compile('[\W]+')                                             # Any nonCharacters (i.e. anything that isn't a-zA-Z0-9_)
+
+
+class Polygon(object):
+    """Rings of one polygon as vertex arrays, with its bounding box and edges."""
+
+    def __init__(self, rings):
+        self.rings = [numpy.asarray(ring, dtype=float) for ring in rings if len(ring) > 1]
+        points = numpy.concatenate(self.rings)
+        self.bbox = (points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max())
+        self.edges = E911_Reference.ring_edges(self.rings)
+
+    def contains(self, x, y):
+        return E911_Reference.edges_contain(self.edges, x, y)
+
+    def edges_within(self, bbox):
+        """Edges whose bounding box overlaps 'bbox'."""
+        x1, y1, x2, y2 = self.edges
+        keep = (numpy.minimum(x1, x2) <= bbox[2]) & (numpy.maximum(x1, x2) >= bbox[0]) & (numpy.minimum(y1, y2) <= bbox[3]) & (numpy.maximum(y1, y2) >= bbox[1])
+        return x1[keep], y1[keep], x2[keep], y2[keep]
+
+
+def orientation(px, py, qx, qy, rx, ry):
+    """Sign of the turn p -> q -> r (1 counterclockwise, -1 clockwise, 0 collinear)."""
+    return numpy.sign((qx - px) * (ry - py) - (qy - py) * (rx - px))
+
+
+def edges_cross(a, b):
+    """True if any edge of 'a' touches or crosses any edge of 'b' (both (x1, y1, x2, y2) arrays)."""
+    if not len(a[0]) or not len(b[0]):
+        return False
+    step = max(1, EDGE_BLOCK // len(b[0]))
+    bx1, by1, bx2, by2 = [v[None, :] for v in b]
+    for start in range(0, len(a[0]), step):
+        ax1, ay1, ax2, ay2 = [v[start:start + step, None] for v in a]
+        overlap = (numpy.minimum(ax1, ax2) <= numpy.maximum(bx1, bx2)) & (numpy.maximum(ax1, ax2) >= numpy.minimum(bx1, bx2)) & \
+                  (numpy.minimum(ay1, ay2) <= numpy.maximum(by1, by2)) & (numpy.maximum(ay1, ay2) >= numpy.minimum(by1, by2))
+        cross = (orientation(ax1, ay1, ax2, ay2, bx1, by1) * orientation(ax1, ay1, ax2, ay2, bx2, by2) <= 0) & \
+                (orientation(bx1, by1, bx2, by2, ax1, ay1) * orientation(bx1, by1, bx2, by2, ax2, ay2) <= 0)
+        if (overlap & cross).any():
+            return True
+    return False
+
+
+def intersects(feature, region):
+    """Inclusive polygon/polygon intersection test: a vertex of one inside the other, or touching/crossing edges."""
+    if any(region.contains(ring[0, 0], ring[0, 1]) for ring in feature.rings):
+        return True
+    if edges_cross(feature.edges_within(region.bbox), region.edges_within(feature.bbox)):
+        return True
+    return any(feature.contains(ring[0, 0], ring[0, 1]) for ring in region.rings)
+
+
+class RegionLayer(object):
+    """Named boundary polygons (e.g. counties) held in memory with a grid index over their bounding boxes."""
+
+    def __init__(self, regions, cellSize=10000.0):
+        self.names = []
+        self.polygons = []
+        for name, rings in regions:
+            if rings and name is not None:
+                self.names.append(name)
+                self.polygons.append(Polygon(rings))
+        self.index = E911_Reference.GridIndex([polygon.bbox for polygon in self.polygons], cellSize)
+
+    def locate(self, feature):
+        """Names of all the regions that intersect the feature."""
+        return [self.names[i] for i in self.index.query_bbox(*feature.bbox) if intersects(feature, self.polygons[i])]
+
+
+def read_regions(path, nameField, spatialReference=None):
+    """(name, rings) of every boundary polygon. Shapefiles are read directly, anything else (e.g. a geodatabase
+    feature class) through an arcpy cursor, projected on the fly to 'spatialReference' if given."""
+    if path.lower().endswith(".shp"):
+        reader = Shapefile_IO.ShapefileReader(path)
+        position = reader.fieldNames.index(nameField)
+        return [(record[position], shape) for shape, record in reader.iter_shape_records() if shape]
+    import arcpy
+    from Slope_Zonal import arcpy_polygon_rings
+
+    with arcpy.da.SearchCursor(path, [nameField, "SHAPE@"], spatial_reference=spatialReference) as cursor:
+        return [(row[0], arcpy_polygon_rings(row[1])) for row in cursor if row[1]]
+
+
+def assign(shp, layers, siteField=None, siteOutput=None):
+    """Single pass over the features of 'shp'. 'layers' is a list of (RegionLayer, output path pattern with {0}
+    for the region name). The site of each feature is its value of 'siteField', written to 'siteOutput'
+    (as 'FID<n>' if the name has no letters or digits).
+    Returns {output path: [record numbers]}, holding only partitions that have features. Record numbers count the
+    records that aren't deleted, in file order, as ShapefileReader.iter_raw() yields them."""
+    reader = Shapefile_IO.ShapefileReader(shp)
+    position = reader.fieldNames.index(siteField) if siteField else None
+    partitions = {}
+    for i, (shape, record) in enumerate(reader.iter_shape_records()):
+        if not shape:
+            continue
+        feature = Polygon(shape)
+        for layer, output in layers:
+            for name in layer.locate(feature):
+                partitions.setdefault(output.format(name), []).append(i)
+        if position is not None and record[position]:
+            # A name of only special characters would otherwise write to "_IPA.shp"
+            site = patternFinder.sub("", record[position]) or "FID{0}".format(i)
+            partitions.setdefault(siteOutput.format(site), []).append(i)
+    return partitions
+
+
+def write_partitions(job):
+    """Worker: copy the features of one input shapefile to a group of outputs in one sequential read."""
+    shp, partitions = job
+    reader = Shapefile_IO.ShapefileReader(shp)
+    targets = {}
+    writers = []
+    try:
+        for output, indexes in partitions:
+            folder = os.path.dirname(output)
+            if folder and not os.path.exists(folder):
+                try:
+                    os.makedirs(folder)
+                except OSError:                                                 # Created by another worker in the meantime
+                    pass
+            writer = Shapefile_IO.ShapefileWriter(output, reader.shapeType, reader.fields, reader.prj)
+            writers.append(writer)
+            for i in indexes:
+                targets.setdefault(i, []).append(writer)
+        last = max(targets) if targets else -1
+        for i, (content, record) in enumerate(reader.iter_raw()):
+            if i > last:
+                break
+            for writer in targets.get(i, []):
+                writer.write_raw(content, record)
+    finally:
+        for writer in writers:
+            writer.close()
+    return [(output, len(indexes)) for output, indexes in partitions]
+
+
+def write_all(jobs, workers=None):
+    """Write {input shapefile: {output path: [record numbers]}} across a worker pool. Returns [(output, features)]."""
+    workers = workers or multiprocessing.cpu_count()
+    outputs = sum(len(partitions) for partitions in jobs.values())
+    groupSize = min(MAX_OPEN_WRITERS, max(1, -(-outputs // workers)))         # Split so every worker gets a share
+    tasks = []
+    for shp in sorted(jobs):
+        partitions = sorted(jobs[shp].items())
+        tasks += [(shp, partitions[i:i + groupSize]) for i in range(0, len(partitions), groupSize)]
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        try:
+            results = pool.map(write_partitions, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [write_partitions(task) for task in tasks]
+    return [result for group in results for result in group]
+
+
+def partition(layers, workers=None):
+    """Partition several inputs in one run. 'layers' is a list of (input shapefile, [(RegionLayer, output pattern)],
+    site field, site output pattern). Returns [(output, features)] for every shapefile written."""
+    jobs = {}
+    for shp, regionLayers, siteField, siteOutput in layers:
+        Tool_Timing.step("Assigning {0} features...".format(os.path.basename(shp)))
+        jobs[shp] = assign(shp, regionLayers, siteField, siteOutput)
+        Tool_Timing.count(Shapefile_IO.ShapefileReader(shp).numRecords)
+    Tool_Timing.step("Writing partitions...")
+    results = write_all(jobs, workers)
+    Tool_Timing.count(sum(count for output, count in results))
+    Tool_Timing.wrote(*[output for output, count in results])
+    return results
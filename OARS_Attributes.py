@@ -0,0 +1,180 @@
+#-------------------------------------------------------------------------------
+# Name:        OARS Attributes
+''' Purpose:  Bulk attribute writer for OARS shapefiles. A record (dictionary of
+              OARS field name -> value) is validated once against the feature
+              class's fields, then every field and the polygon acres are written in
+              a single UpdateCursor pass, instead of one CalculateField_management
+              pass over the table per field. Used by the "OARS Shapefile Developer"
+              tool, by OARS_Pipeline.py (Orig_Name) and by the batch mode below,
+              which attributes a whole folder of submissions in one run:
+                python OARS_Attributes.py "C:/Submissions" "C:/OARS Out" record.json
+                python OARS_Attributes.py "C:/Submissions" "C:/OARS Out" record.json --records per_file.csv
+              record.json holds the values shared by every file (keys are the
+              OARS field names, dates as "mm/dd/yyyy"). per_file.csv has a "File"
+              column plus any fields whose values differ between files.
+'''
+#-------------------------------------------------------------------------------
+import argparse, csv, json, os, re, sys
+from datetime import datetime
+
+OARS_FIELDS = ["Orig_Name", "ProjectNam", "GrantTitle", "FundNumber", "Coop_ID", "WkplanNum", "District", "Landowner", "AgencyInv", "CWPP",
+               "CARS", "ForestType", "Treatment", "AccompDate", "Input_Date", "FY", "Acres"]
+DROP_FIELDS = ["LAT", "LONG", "IDENT", "Name", "SHAPE_Leng", "SHAPE_Area"]     # Fields that come along with appended GPS/KML data ("SHAPE_Leng" comes from Append Mgmt.)
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Reference Files - Please don't alter", "OARS Shapefile Developer", "OARS.gdb", "Data_Template_2018")
+DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%Y %H:%M:%S", "%Y-%m-%d")
+patternFinder = re.compile('[\W]+')                                             # Any nonCharacters (i.e. anything that isn't a-zA-Z0-9_)
+cooperatorPattern = re.compile('[^0-9-]+')
+
+
+def build_record(district, workPlan, fundNumber, cid, landowner, agencies, grantTitle, projectName, CWPP, CARS, forestType, treatment,
+                 accDate, fiscalYear, origName, inputDate=None):
+    """OARS record from the OARS Shapefile Developer inputs, formatted the way the tool always has: multivalue
+    parameters joined with ", ", apostrophes removed, underscores in titles replaced and the fund number upper case."""
+    return {"Orig_Name": origName,
+            "ProjectNam": projectName.replace("_", " "),
+            "GrantTitle": grantTitle.replace("_", " "),
+            "FundNumber": str(fundNumber).upper(),
+            "Coop_ID": cooperatorPattern.sub("", cid),
+            "WkplanNum": workPlan,
+            "District": district,
+            "Landowner": landowner.replace(";", ", ").replace("'", ""),
+            "AgencyInv": agencies.replace(";", ", ").replace("'", ""),
+            "CWPP": CWPP,
+            "CARS": CARS.replace(";", ", ").replace("'", ""),
+            "ForestType": forestType.replace(";", ", ").replace("'", ""),
+            "Treatment": treatment.replace(";", ", ").replace("'", ""),
+            "AccompDate": accDate,
+            "Input_Date": inputDate or datetime.now(),
+            "FY": fiscalYear}
+
+
+def parse_date(value):
+    if value is None or hasattr(value, "strftime"):
+        return value
+    for dateFormat in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), dateFormat)
+        except ValueError:
+            pass
+    raise ValueError("'{0}' is not a date (expected mm/dd/yyyy).".format(value))
+
+
+def validate_record(fields, record):
+    """Check and convert every value of 'record' once against the feature class 'fields' (arcpy Field objects).
+    Returns (field names, values) in matching order. All problems are reported together in one ValueError."""
+    byName = dict((field.name.lower(), field) for field in fields)
+    names, values, problems = [], [], []
+    for key in sorted(record, key=lambda k: OARS_FIELDS.index(k) if k in OARS_FIELDS else len(OARS_FIELDS)):
+        value = record[key]
+        field = byName.get(key.lower())
+        if field is None:
+            problems.append("Field '{0}' doesn't exist.".format(key))
+            continue
+        try:
+            if value is None or value == "":
+                value = None
+            elif field.type == "String":
+                value = value if isinstance(value, type(u"")) else str(value)
+                if len(value) > field.length:
+                    raise ValueError("'{0}' is longer than {1} characters.".format(value, field.length))
+            elif field.type in ("Integer", "SmallInteger"):
+                value = int(value)
+            elif field.type in ("Double", "Single"):
+                value = float(value)
+            elif field.type == "Date":
+                value = parse_date(value)
+        except (TypeError, ValueError) as e:
+            problems.append("{0}: {1}".format(field.name, e))
+            continue
+        names.append(field.name)
+        values.append(value)
+    if problems:
+        raise ValueError("Invalid OARS attributes:\n" + "\n".join(problems))
+    return names, values
+
+
+def write_attributes(fc, record, acresField="Acres"):
+    """Write the validated record to every feature of 'fc' and the planar area in acres of each polygon to
+    'acresField' (None to skip), all in one UpdateCursor pass. Returns the number of features updated."""
+    import arcpy
+
+    fields = arcpy.ListFields(fc)
+    names, values = validate_record(fields, record)
+    computeAcres = acresField is not None and acresField.lower() in [field.name.lower() for field in fields]
+    cursorFields = names + ([acresField, "SHAPE@"] if computeAcres else [])
+    count = 0
+    with arcpy.da.UpdateCursor(fc, cursorFields) as cursor:
+        for row in cursor:
+            newRow = list(values)
+            if computeAcres:
+                newRow += [row[-1].getArea("PLANAR", "ACRES") if row[-1] else 0, row[-1]]
+            cursor.updateRow(newRow)
+            count += 1
+    return count
+
+
+def prepare_from_template(inputPolygon, newfc, template=TEMPLATE):
+    """Copy the OARS template to 'newfc', append the input polygons and delete the fields that come with GPS data."""
+    import arcpy
+
+    arcpy.CopyFeatures_management(template, newfc)
+    arcpy.Append_management(inputPolygon, newfc, "NO_TEST")
+    existing = set(field.name for field in arcpy.ListFields(newfc))
+    dropFields = [field for field in DROP_FIELDS if field in existing]
+    if dropFields:
+        arcpy.DeleteField_management(newfc, dropFields)
+
+
+def read_per_file_records(path):
+    """{file name (lower case, without extension): {field: value}} from a CSV with a "File" column."""
+    records = {}
+    f = open(path, "rb") if sys.version_info[0] < 3 else open(path, "r", newline="")
+    with f:
+        for row in csv.DictReader(f):
+            name = os.path.splitext(os.path.basename(row.pop("File")))[0].lower()
+            records[name] = dict((key, value) for key, value in row.items() if value not in (None, ""))
+    return records
+
+
+def attribute_folder(inputFolder, outputFolder, record, perFile=None, template=TEMPLATE):
+    """Batch mode: develop one OARS shapefile per polygon shapefile in 'inputFolder'. Each output is named after its
+    input and gets 'record' updated with that file's row of 'perFile'. Returns a list of (input, output, features, error)."""
+    perFile = perFile or {}
+    results = []
+    if not os.path.exists(outputFolder):
+        os.makedirs(outputFolder)
+    for f in sorted(os.listdir(inputFolder)):
+        if f[-4:].lower() != ".shp":
+            continue
+        name = patternFinder.sub("", f[:-4])
+        newfc = os.path.join(outputFolder, name + ".shp")
+        fileRecord = dict(record)
+        fileRecord.update(perFile.get(f[:-4].lower(), {}))
+        fileRecord.setdefault("Orig_Name", name)
+        fileRecord.setdefault("Input_Date", datetime.now())
+        try:
+            prepare_from_template(os.path.join(inputFolder, f), newfc, template)
+            results.append((f, newfc, write_attributes(newfc, fileRecord), None))
+        except Exception as e:
+            results.append((f, newfc, 0, str(e)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Attribute a folder of treatment shapefiles with the OARS template fields.")
+    parser.add_argument("input_folder", help="Folder of submitted polygon shapefiles (NAD83 UTM Zone 13N)")
+    parser.add_argument("output_folder", help="Folder for the OARS shapefiles")
+    parser.add_argument("record", help="JSON file of the OARS field values shared by every file")
+    parser.add_argument("--records", help="CSV with a 'File' column and the field values that differ per file")
+    parser.add_argument("--template", default=TEMPLATE, help="OARS data template feature class")
+    args = parser.parse_args(argv)
+
+    with open(args.record, "r") as f:
+        record = json.load(f)
+    perFile = read_per_file_records(args.records) if args.records else None
+    for f, newfc, count, error in attribute_folder(args.input_folder, args.output_folder, record, perFile, args.template):
+        print("{0}: {1}".format(f, error if error else "{0} polygons attributed -> {1}".format(count, newfc)))
+
+
+if __name__ == "__main__":
+    main()
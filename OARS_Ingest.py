@@ -0,0 +1,318 @@
+#-------------------------------------------------------------------------------
+# Name:        OARS Incremental Ingest
+''' Purpose:  Adds new or changed OARS shapefiles to an existing
+              "OARS_Treatments_{year}" feature class in OARS_Temp.gdb instead of
+              rerunning OARS_Preparation1, 2, 3b and OARS_UniqueID for the whole
+              fiscal year. Shapefiles in the raw data folder are first normalized by
+              OARS_Pipeline.py (which skips files it already processed); only the
+              shapefiles its manifest lists as committed in NAD83 UTM Zone 13N are
+              ingested. A cache (OARS_Ingest_cache_{year}.json in the "OARS Temp"
+              folder) keeps a content hash of every ingested shapefile; only
+              shapefiles whose hash is new or changed are read. Their features
+              replace (upsert) the rows with the same Unique_ID or Orig_Name. Rows of
+              shapefiles removed from the folder are deleted.
+              Example:
+                python OARS_Ingest.py 2018
+                python OARS_Ingest.py 2018 --dry-run
+                python OARS_Ingest.py 2018 --benchmark 400
+'''
+#-------------------------------------------------------------------------------
+import argparse, hashlib, json, math, os, random, re, shutil, time
+import OARS_Merge, OARS_Pipeline, Shapefile_IO
+
+CACHE = "OARS_Ingest_cache_{0}.json"
+SIDECARS = (".shp", ".shx", ".dbf", ".prj")
+COUNTIES = ['Bernalillo', 'Catron', 'Chaves', 'Cibola', 'Colfax', 'Curry', 'De Baca', 'Dona Ana', 'Eddy', 'Grant', 'Guadalupe', 'Harding',
+            'Hidalgo', 'Lea', 'Lincoln', 'Los Alamos', 'Luna', 'McKinley', 'Mora', 'Otero', 'Quay', 'Rio Arriba', 'Roosevelt', 'San Juan', 'San Miguel',
+            'Sandoval', 'Santa Fe', 'Sierra', 'Socorro', 'Taos', 'Torrance', 'Union', 'Valencia']
+uniqueIdPattern = re.compile(r'_\d+\.shp$')
+
+
+def unique_id(origName):
+    """OARS Unique ID appended to the original shapefile name (e.g. "Thinning_5480_proj.shp" -> 5480), or None."""
+    match = uniqueIdPattern.findall(origName.replace("_proj", ""))
+    return int(match[0][1:-4]) if match else None
+
+
+def cwpp_county(name):
+    """Add " County" to CWPP values that are only a county name."""
+    if name and name.title() in COUNTIES:
+        return name + " County"
+    return name
+
+
+def content_hash(shp):
+    """SHA-1 of the shapefile's geometry, index, attributes and projection files."""
+    digest = hashlib.sha1()
+    base = os.path.splitext(shp)[0]
+    for extension in SIDECARS:
+        if os.path.exists(base + extension):
+            with open(base + extension, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+def read_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    """Write to a temporary file first so an interrupted run can't corrupt the cache."""
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(temp, path)
+
+
+def committed(folder, manifest):
+    """Shapefiles of 'folder' that OARS_Pipeline committed (see its manifest) and that haven't been modified since."""
+    return set(f for f, entry in manifest.items()
+               if os.path.exists(os.path.join(folder, f)) and entry.get("signature") == OARS_Pipeline.file_signature(os.path.join(folder, f)))
+
+
+def orig_names(f, manifest):
+    """Orig_Name values the rows of shapefile 'f' can have: the file name itself and the sanitized name of the
+    original shapefile, which OARS_Pipeline writes to Orig_Name."""
+    source = manifest.get(f, {}).get("source")
+    if source:
+        origName = OARS_Pipeline.sanitize_name(source)
+    else:
+        origName = f[:-len("_proj.shp")] + ".shp" if f.endswith("_proj.shp") else f
+    return sorted(set([f, origName]))
+
+
+def plan(folder, cache, manifest=None):
+    """Compare the polygon shapefiles in 'folder' with the cache. Returns (changed [(file, hash, signature)], removed [file]).
+    With an OARS_Pipeline 'manifest', only the shapefiles it committed are candidates. Files whose size and
+    modification time match the cache aren't re-hashed."""
+    changed = []
+    current = set()
+    candidates = committed(folder, manifest) if manifest is not None else None
+    for f in sorted(os.listdir(folder)):
+        if f[-4:].lower() != ".shp":
+            continue
+        shp = os.path.join(folder, f)
+        current.add(f)
+        if candidates is not None and f not in candidates:
+            continue
+        signature = OARS_Pipeline.file_signature(shp)
+        entry = cache.get(f)
+        if entry and entry["signature"] == signature:
+            continue
+        digest = content_hash(shp)
+        if entry and entry["hash"] == digest:
+            entry["signature"] = signature                                      # Touched but not changed
+            continue
+        if Shapefile_IO.base_shape_type(Shapefile_IO.read_header(shp)[0]) == Shapefile_IO.POLYGON:
+            changed.append((f, digest, signature))
+    removed = [f for f in sorted(cache) if f not in current]
+    return changed, removed
+
+
+def target_fields(fc):
+    """dbf style definitions (name, type, length, decimals) of the editable fields of the treatments feature class."""
+    import arcpy
+
+    fields = []
+    for field in arcpy.ListFields(fc):
+        if field.type == "String":
+            fields.append((field.name, "C", field.length, 0))
+        elif field.type in ("Double", "Single"):
+            fields.append((field.name, "N", 19, 11))
+        elif field.type in ("Integer", "SmallInteger"):
+            fields.append((field.name, "N", 10, 0))
+        elif field.type == "Date":
+            fields.append((field.name, "D", 8, 0))
+    return [field for field in fields if field[0] not in ("Shape_Length", "Shape_Area")]
+
+
+def _delete_rows(fc, uniqueIDs, origNames):
+    import arcpy
+
+    clauses = []
+    ids = sorted(set(uniqueIDs))
+    names = sorted(set(origNames))
+    for i in range(0, len(ids), 500):                                           # Keep IN lists to a size every workspace accepts
+        clauses.append("{0} IN ({1})".format(arcpy.AddFieldDelimiters(fc, "Unique_ID"), ", ".join(str(x) for x in ids[i:i + 500])))
+    for i in range(0, len(names), 500):
+        clauses.append("{0} IN ({1})".format(arcpy.AddFieldDelimiters(fc, "Orig_Name"), ", ".join("'{0}'".format(n.replace("'", "''")) for n in names[i:i + 500])))
+    deleted = 0
+    for clause in clauses:
+        with arcpy.da.UpdateCursor(fc, ["OID@"], clause) as cursor:
+            for row in cursor:
+                cursor.deleteRow()
+                deleted += 1
+    return deleted
+
+
+def upsert(fc, folder, changed, removed, cache, manifest=None):
+    """Replace the rows of changed shapefiles and delete the rows of removed ones. Rows are matched by the Unique_IDs
+    and Orig_Names recorded in the cache and by those derived from the file names, so rows loaded by a full
+    rebuild are replaced too. Returns (rows deleted, rows inserted)."""
+    import arcpy
+
+    fields = target_fields(fc)
+    fieldNames = [field[0] for field in fields]
+    if "Unique_ID" not in fieldNames:
+        arcpy.AddField_management(fc, "Unique_ID", "LONG")
+        fields.append(("Unique_ID", "N", 10, 0))
+        fieldNames.append("Unique_ID")
+    converters = [OARS_Merge.converter(field) for field in fields]
+    oldIDs, oldNames = [], []
+    for f in removed + [item[0] for item in changed]:
+        oldIDs += cache.get(f, {}).get("uniqueIDs", [])
+        oldNames += cache.get(f, {}).get("origNames", [])
+    for f, digest, signature in changed:                                       # Rows loaded by a full rebuild aren't in the cache
+        oldNames += orig_names(f, manifest or {})
+        uniqueID = unique_id(f)
+        if uniqueID is not None:
+            oldIDs.append(uniqueID)
+    deleted = _delete_rows(fc, oldIDs, oldNames)
+
+    inserted = 0
+    with arcpy.da.InsertCursor(fc, ["SHAPE@"] + fieldNames) as insertCursor:
+        for f, digest, signature in changed:
+            shp = os.path.join(folder, f)
+            mapping = dict((OARS_Merge.canonical_name(name), name) for name in [field.name for field in arcpy.ListFields(shp)] if OARS_Merge.canonical_name(name))
+            inputFields = [mapping.get(name) for name in fieldNames]
+            readFields = [name for name in inputFields if name]
+            uniqueIDs, origNames = set(), set()
+            with arcpy.da.SearchCursor(shp, ["SHAPE@"] + readFields) as searchCursor:
+                for row in searchCursor:
+                    values = dict(zip(readFields, row[1:]))
+                    newRow = [convert(values.get(name)) if name else None for convert, name in zip(converters, inputFields)]
+                    record = dict(zip(fieldNames, newRow))
+                    origName = record.get("Orig_Name") or f
+                    uniqueID = unique_id(origName)
+                    record.update(Orig_Name=origName, Unique_ID=uniqueID, CWPP=cwpp_county(record.get("CWPP")))
+                    insertCursor.insertRow([row[0]] + [record.get(name) for name in fieldNames])
+                    origNames.add(origName)
+                    if uniqueID is not None:
+                        uniqueIDs.add(uniqueID)
+                    inserted += 1
+            cache[f] = {"hash": digest, "signature": signature, "uniqueIDs": sorted(uniqueIDs), "origNames": sorted(origNames)}
+    for f in removed:
+        cache.pop(f, None)
+    return deleted, inserted
+
+
+def ingest(year, scriptpath=None, dryRun=False, workers=None):
+    """Normalize new files with OARS_Pipeline, then upsert new/changed shapefiles into OARS_Treatments_{year}."""
+    scriptpath = scriptpath or os.getcwd()
+    OARSdata = os.path.join(scriptpath, "OARS Raw Data", "OARS S_FY{0}".format(year[2:]))
+    tempData = os.path.join(scriptpath, "OARS Temp")
+    wrongGeometry = os.path.join(scriptpath, "OARS Null or Wrong Geometry", "State_FY", "S_FY{0}".format(year[2:]))
+    staging = os.path.join(tempData, "Prep1 Staging S_FY{0}".format(year[2:]))
+    fc = os.path.join(tempData, "OARS_Temp.gdb", "OARS_Treatments_{0}".format(year))
+    cachePath = os.path.join(tempData, CACHE.format(year))
+
+    start = time.time()
+    if dryRun:                                                                  # The scan of OARS_Pipeline.run(dryRun=True), keeping its items
+        junk, items = OARS_Pipeline.scan(OARSdata)
+        messages = OARS_Pipeline.report(junk, items)
+    else:
+        messages = OARS_Pipeline.run(OARSdata, wrongGeometry, staging, workers=workers)
+    manifest = OARS_Pipeline.load_manifest(OARSdata)
+    cache = read_json(cachePath)
+    changed, removed = plan(OARSdata, cache, manifest)
+    if not dryRun:                                                              # Failed, wrong geometry and unaccounted for files
+        done = committed(OARSdata, manifest)
+        messages += ["{0} isn't a committed NAD 1983 UTM Zone 13N shapefile and won't be ingested.".format(f)
+                     for f in sorted(os.listdir(OARSdata)) if f[-4:].lower() == ".shp" and f not in done]
+    messages += ["{0} is new or changed and will be ingested.".format(item[0]) for item in changed]
+    if dryRun:                                                                  # Shapefiles the real run commits before it plans, so they aren't in the manifest yet
+        pending = sorted(set(OARS_Pipeline.output_name(item) for item in items if item["action"] in OARS_Pipeline.PROCESS_ACTIONS) - set(item[0] for item in changed))
+        removed = [f for f in removed if f not in pending]
+        messages += ["{0} would be committed by OARS_Pipeline and would be ingested.".format(f) for f in pending]
+        messages += ["{0} was removed; its rows would be deleted.".format(f) for f in removed]
+        messages.append("Dry run only: no files were changed." if changed or removed or pending else "Nothing to ingest.")
+        return messages
+    messages += ["{0} was removed; its rows will be deleted.".format(f) for f in removed]
+    if not (changed or removed):
+        write_json(cachePath, cache)                                            # Save refreshed signatures
+        messages.append("Nothing to ingest.")
+        return messages
+    deleted, inserted = upsert(fc, OARSdata, changed, removed, cache, manifest)
+    write_json(cachePath, cache)
+    messages.append("{0} rows replaced/deleted and {1} rows inserted from {2} shapefiles in {3:.1f} seconds.".format(deleted, inserted, len(changed), time.time() - start))
+    return messages
+
+
+def benchmark(folder, files=400, newFiles=5, polygons=50, vertices=40):
+    """Time an ingest of a synthetic fiscal year of shapefiles: first ingest (every file new), a rerun with nothing
+    new, and a rerun after 'newFiles' shapefiles arrive. Each is timed as change detection (plan) and as the
+    arcpy upsert into a feature class in a scratch file geodatabase. Returns a list of
+    (label, files to ingest, plan seconds, upsert seconds); upsert seconds are None without arcpy."""
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    fields = [("Orig_Name", "C", 250, 0), ("ForestType", "C", 50, 0), ("Acres", "N", 19, 11)]
+    random.seed(1)
+
+    def make(i):
+        name = "Treatment_{0}_proj.shp".format(5000 + i)
+        with Shapefile_IO.ShapefileWriter(os.path.join(folder, name), Shapefile_IO.POLYGON, fields) as writer:
+            for p in range(polygons):
+                x, y = random.uniform(200000, 700000), random.uniform(3500000, 4100000)
+                ring = [(x + 200 * math.cos(-2 * math.pi * k / vertices), y + 200 * math.sin(-2 * math.pi * k / vertices)) for k in range(vertices)]
+                writer.write([ring + ring[:1]], [name, "Ponderosa Pine", 10.5])
+
+    for i in range(files):
+        make(i)
+    try:
+        import arcpy
+    except ImportError:
+        arcpy = None
+    if arcpy:
+        arcpy.CreateFileGDB_management(folder, "Ingest_Benchmark.gdb")
+        fc = os.path.join(folder, "Ingest_Benchmark.gdb", "OARS_Treatments")
+        arcpy.CreateFeatureclass_management(os.path.dirname(fc), os.path.basename(fc), "POLYGON", spatial_reference=arcpy.SpatialReference(26913))
+        arcpy.AddField_management(fc, "Orig_Name", "TEXT", "", "", 250)
+        arcpy.AddField_management(fc, "ForestType", "TEXT", "", "", 50)
+        arcpy.AddField_management(fc, "Acres", "DOUBLE")
+    cache = {}
+    results = []
+    for label, arriving in (("First ingest", 0), ("Rerun, no new files", 0), ("Rerun, {0} new files".format(newFiles), newFiles)):
+        for i in range(files, files + arriving):
+            make(i)
+        start = time.time()
+        changed, removed = plan(folder, cache)
+        planSeconds = time.time() - start
+        upsertSeconds = None
+        if arcpy:
+            start = time.time()
+            upsert(fc, folder, changed, removed, cache)
+            upsertSeconds = time.time() - start
+        else:
+            for f, digest, signature in changed:                                # Record as ingested
+                cache[f] = {"hash": digest, "signature": signature, "uniqueIDs": [unique_id(f)], "origNames": [f]}
+        results.append((label, len(changed), planSeconds, upsertSeconds))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incrementally ingest new or changed OARS shapefiles.")
+    parser.add_argument("year", help="Fiscal year, e.g. 2018")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be ingested")
+    parser.add_argument("--workers", type=int, default=None, help="Processes used to reproject (default: all cores)")
+    parser.add_argument("--benchmark", type=int, metavar="FILES", help="Time change detection and upserts on FILES synthetic shapefiles instead")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        folder = os.path.join(os.getcwd(), "OARS Temp", "Ingest Benchmark")
+        for label, count, planSeconds, upsertSeconds in benchmark(folder, args.benchmark):
+            print("{0}: {1} shapefiles to ingest, found in {2:.3f} seconds, {3}.".format(
+                label, count, planSeconds, "upserted in {0:.3f} seconds".format(upsertSeconds) if upsertSeconds is not None else "upsert not timed (needs arcpy)"))
+        return
+    for message in ingest(args.year, dryRun=args.dry_run, workers=args.workers):
+        print(message)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#-------------------------------------------------------------------------------
+# Name:        OARS Merge
+''' Purpose:  Streaming merge used by OARS_Preparation2.py. Merge_management with
+              FieldMappings takes the output field definitions from the first
+              shapefile that has each field, so a shorter "Forest_Typ" field early in
+              the list made the merge fail and files had to be renamed to change the
+              merge order. Here the output schema is built first from every input's
+              .dbf header (no arcpy): only the whitelisted fields are kept, aliases
+              are mapped to one field (e.g. Forest_Typ -> ForestType) and each field
+              gets the widest length/type found in any input. Features are then
+              streamed from each input's SearchCursor straight into one
+              InsertCursor, so memory doesn't grow with the number of records and
+              input order doesn't matter.
+'''
+#-------------------------------------------------------------------------------
+import os
+import Shapefile_IO
+
+KEEP_FIELDS = ["Landowner", "Project", "Agencies", "Acres", "Funding", "CWPP", "All_CARS", "Treatment", "ProjectNum", "District", "ForestType",
+               "ProjectNam", "GrantTitle", "FundNumber", "Coop_ID", "WkplanNum", "AgencyInv", "CARS", "AccompDate", "Input_Date", "FY", "Orig_Name", "Veg_Type"]
+FIELD_ALIASES = {"Forest_Typ": "ForestType", "WP_Num": "WkplanNum", "InputDate": "Input_Date"}   # Older data templates -> field name used by OARS_Preparation3b
+MAX_TEXT_LENGTH = 254
+
+
+def canonical_name(name):
+    """Whitelisted output field name for an input field name (case-insensitive), or None if the field is dropped."""
+    lookup = dict((field.lower(), field) for field in KEEP_FIELDS)
+    lookup.update((alias.lower(), field) for alias, field in FIELD_ALIASES.items())
+    return lookup.get(name.lower())
+
+
+def widen(a, b):
+    """Smallest dbf field definition (name, type, length, decimals) that can hold values of both a and b."""
+    name, typeA, lengthA, decimalsA = a
+    typeB, lengthB, decimalsB = b[1:]
+    if typeA == typeB:
+        return name, typeA, max(lengthA, lengthB), max(decimalsA, decimalsB)
+    if typeA in ("N", "F") and typeB in ("N", "F"):
+        return name, "N", max(lengthA, lengthB), max(decimalsA, decimalsB)
+    return name, "C", min(max(lengthA, lengthB, 10 if "D" in (typeA, typeB) else 0), MAX_TEXT_LENGTH), 0   # Mixed types (e.g. a date stored as text in one file) become text
+
+
+def reconcile_schemas(inputs):
+    """Return (output fields [(name, type, length, decimals)], {input: {input field: output field}})
+    from the .dbf headers of all inputs."""
+    schema = {}
+    mappings = {}
+    for shp in inputs:
+        mapping = {}
+        for field in Shapefile_IO.ShapefileReader(shp).fields:
+            name = canonical_name(field[0])
+            if name is None or name in mapping.values():                        # A file with both Forest_Typ and ForestType keeps the first one
+                continue
+            mapping[field[0]] = name
+            schema[name] = widen(schema[name], field) if name in schema else (name,) + tuple(field[1:])
+        mappings[shp] = mapping
+    fields = [schema[name] for name in KEEP_FIELDS if name in schema]
+    return fields, mappings
+
+
+def converter(field):
+    """Function that converts an input value to the output field's type (None if it can't be converted)."""
+    name, fieldType, length, decimals = field
+
+    def to_text(value):
+        if value is None:
+            return None
+        if hasattr(value, "strftime"):
+            value = value.strftime("%m/%d/%Y")
+        return (value if isinstance(value, type(u"")) else str(value))[:length]
+
+    def to_number(value):
+        try:
+            return float(value) if decimals or fieldType == "F" else int(float(value))
+        except (TypeError, ValueError):
+            return None
+
+    def to_date(value):
+        return value if hasattr(value, "strftime") else None
+
+    if fieldType == "C":
+        return to_text
+    if fieldType in ("N", "F"):
+        return to_number
+    if fieldType == "D":
+        return to_date
+    return lambda value: value
+
+
+def merge_shapefiles(inputs, output, spatialReference=None):
+    """Merge polygon shapefiles into 'output' with the reconciled schema. Returns the number of features written."""
+    import arcpy
+
+    if not inputs:
+        raise ValueError("No shapefiles to merge into {0}.".format(output))
+    fields, mappings = reconcile_schemas(inputs)
+    if spatialReference is None:
+        spatialReference = arcpy.Describe(inputs[0]).spatialReference
+    arcpy.CreateFeatureclass_management(os.path.dirname(output), os.path.basename(output), "POLYGON", "", "DISABLED", "DISABLED", spatialReference)
+    for field in fields:
+        fieldType, fieldLength = Shapefile_IO.esri_field_type(field)
+        arcpy.AddField_management(output, field[0], fieldType, "", "", fieldLength)
+    if "Id" not in [field[0] for field in fields]:
+        arcpy.DeleteField_management(output, "Id")                             # Default field added by CreateFeatureclass
+    outputFields = [field[0] for field in fields]
+    converters = [converter(field) for field in fields]
+
+    count = 0
+    with arcpy.da.InsertCursor(output, ["SHAPE@"] + outputFields) as insertCursor:
+        for shp in inputs:
+            mapping = mappings[shp]
+            inputFields = list(mapping)
+            positions = [outputFields.index(mapping[f]) for f in inputFields]
+            with arcpy.da.SearchCursor(shp, ["SHAPE@"] + inputFields) as searchCursor:
+                for row in searchCursor:
+                    values = [None] * len(outputFields)
+                    for position, value in zip(positions, row[1:]):
+                        values[position] = converters[position](value)
+                    insertCursor.insertRow([row[0]] + values)
+                    count += 1
+    return count
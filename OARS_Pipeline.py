@@ -0,0 +1,270 @@
+#-------------------------------------------------------------------------------
+# Name:        OARS Pipeline
+''' Purpose:  Coordinate reference system normalization used by OARS_Preparation1.py,
+              split into three stages so a failure can't leave the OARS folder half
+              renamed:
+                1) scan     - one pass over the folder. Each shapefile is classified
+                              from its .shp header (shape type) and .prj (datum and
+                              projection) without arcpy. Nothing is changed.
+                2) process  - shapefiles are copied or reprojected to NAD83 UTM Zone
+                              13N into a staging folder by a pool of worker processes,
+                              and "Orig_Name" is added to the staged copies.
+                3) commit   - staged outputs replace the originals, junk files are
+                              deleted and non-polygon shapefiles are moved to the
+                              "Wrong Geometry" folder. Originals are held in a backup
+                              folder until every move succeeds, otherwise the folder
+                              is rolled back.
+              A manifest (OARS_Preparation1_manifest.json) in the OARS folder records
+              every committed output, so reruns skip shapefiles that are already done.
+'''
+#-------------------------------------------------------------------------------
+import json, multiprocessing, os, re, shutil, time
+import OARS_Attributes, Shapefile_IO, Tool_Timing
+
+JUNK_EXTENSIONS = (".pdf", ".ocx", ".mxd", ".zip")
+MANIFEST = "OARS_Preparation1_manifest.json"
+TARGET_CRS = "NAD_1983_UTM_Zone_13N"
+PROCESS_ACTIONS = ("project", "define", "copy")                                 # Actions that write a shapefile to commit
+invalidCharacters = re.compile('[^a-zA-Z_0-9-]+')
+NAD83_HARN = re.compile("D_North_American_1983_HARN")                           # Check shapefile Datum in order to specify correct geographic transformation if necessary.
+WGS_1984 = re.compile("D_WGS_1984")
+NAD83 = re.compile("D_North_American_1983")
+NAD27 = re.compile("D_North_American_1927")
+crsName = re.compile(r'^\s*\w+\[\s*"([^"]*)"')
+
+
+def sanitize_name(filename):
+    """Remove characters that are illegal in ESRI file names (including extra periods), keeping the 3 letter extension."""
+    if invalidCharacters.findall(filename):
+        newName = invalidCharacters.sub("", filename)
+        return "{0}.{1}".format(newName[:-3], newName[-3:])
+    return filename
+
+
+def classify_crs(prj):
+    """Return (datum, CRS name, action, geographic transformation) for a .prj string (None if missing).
+    The order of the checks matters: the NAD83 HARN datum name also matches the NAD83 pattern."""
+    if not prj:
+        return None, "Unknown", "define", None
+    match = crsName.match(prj)
+    name = match.group(1) if match else "Unknown"
+    if NAD83_HARN.findall(prj):
+        return "D_North_American_1983_HARN", name, "project", "NAD_1983_To_HARN_New_Mexico"
+    elif WGS_1984.findall(prj):
+        return "D_WGS_1984", name, "project", "WGS_1984_(ITRF00)_To_NAD_1983"
+    elif NAD27.findall(prj):
+        return "D_North_American_1927", name, "project", "NAD_1927_To_NAD_1983_NADCON"
+    elif NAD83.findall(prj) and name != TARGET_CRS:
+        return "D_North_American_1983", name, "project", None
+    elif name == "Unknown":
+        return None, name, "define", None
+    elif NAD83.findall(prj) and name == TARGET_CRS:                             # Shapefile already has correct datum and projection.
+        return "D_North_American_1983", name, "copy", None
+    return None, name, "unaccounted", None
+
+
+def file_signature(path):
+    """(size, modification time) of a shapefile's .shp and .dbf, used to recognize files that are already processed."""
+    signature = []
+    for extension in (".shp", ".dbf"):
+        sidecar = os.path.splitext(path)[0] + extension
+        if os.path.exists(sidecar):
+            stat = os.stat(sidecar)
+            signature += [stat.st_size, int(stat.st_mtime)]
+    return signature
+
+
+def load_manifest(folder):
+    path = os.path.join(folder, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(folder, manifest):
+    """Write the manifest to a temporary file first so an interrupted write can't corrupt it."""
+    path = os.path.join(folder, MANIFEST)
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(temp, path)
+
+
+# Stage 1 ---------------------------------------------------------------------
+def scan(folder):
+    """Classify every file in the OARS folder in a single pass. Returns (junk files, shapefile items)."""
+    manifest = load_manifest(folder)
+    files = sorted(f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f)) and f != MANIFEST)
+    junk = [f for f in files if f[-4:] in JUNK_EXTENSIONS]
+    stems = sorted((f[:-4].lower() for f in files if f[-4:].lower() == ".shp"), key=len, reverse=True)
+    sidecars = {}
+    for f in files:
+        for stem in stems:                                                      # Longest match first, so "a.b.shp" files don't go to "a.shp"
+            if f not in junk and f.lower().startswith(stem + "."):
+                sidecars.setdefault(stem, []).append(f)
+                break
+    items = []
+    for f in files:
+        if f[-4:].lower() != ".shp":
+            continue
+        shp = os.path.join(folder, f)
+        newName = sanitize_name(f)
+        item = {"file": f, "name": newName[:-4], "origName": newName, "shp": shp, "sidecars": sidecars[f[:-4].lower()]}
+        done = manifest.get(f)
+        if done and done.get("signature") == file_signature(shp):
+            item.update(action="done", shapeType=done.get("shapeType"), datum=done.get("datum"), crs=done.get("crs"), transformation=done.get("transformation"))
+            items.append(item)
+            continue
+        shapeType, bbox = Shapefile_IO.read_header(shp)
+        item["shapeType"] = Shapefile_IO.SHAPE_TYPES.get(shapeType, str(shapeType))
+        datum, name, action, transformation = classify_crs(Shapefile_IO.read_prj(shp))
+        if Shapefile_IO.base_shape_type(shapeType) != Shapefile_IO.POLYGON:
+            action = "wrong geometry"
+        item.update(datum=datum, crs=name, action=action, transformation=transformation)
+        items.append(item)
+    return junk, items
+
+
+def report(junk, items):
+    """Dry-run report of what process() and commit() would do with each file."""
+    lines = ["{0} will be deleted from the OARS folder.".format(f) for f in junk]
+    for item in items:
+        rename = " (renamed to {0})".format(item["origName"]) if item["origName"] != item["file"] else ""
+        if item["action"] == "project":
+            detail = "project from {0} to NAD 1983 UTM Zone 13N using transformation: {1}".format(item["crs"], item["transformation"] or "none needed (same datum)")
+        elif item["action"] == "define":
+            detail = "has 'Unknown' spatial reference; will be defined as NAD 1983 UTM Zone 13N"
+        elif item["action"] == "copy":
+            detail = "already NAD 1983 UTM Zone 13N; only 'Orig_Name' will be added"
+        elif item["action"] == "wrong geometry":
+            detail = "is a {0} shapefile; will be moved to the 'Wrong Geometry' folder".format(item["shapeType"])
+        elif item["action"] == "done":
+            detail = "already processed (in manifest); skipped"
+        else:
+            detail = "has projection {0}. It is currently unaccounted for in this script!".format(item["crs"])
+        lines.append("{0}{1}: {2}".format(item["file"], rename, detail))
+    return lines
+
+
+# Stage 2 ---------------------------------------------------------------------
+def output_name(item):
+    """File name of the shapefile process_item() writes for 'item', which commit() moves into the OARS folder."""
+    return item["name"] + ("_proj.shp" if item["action"] == "project" else ".shp")
+
+
+def process_item(args):
+    """Worker: write the NAD83 UTM Zone 13N version of one shapefile (with 'Orig_Name') to the staging folder."""
+    item, staging = args
+    import arcpy
+
+    try:
+        arcpy.env.overwriteOutput = True
+        sr = arcpy.SpatialReference("NAD 1983 UTM Zone 13N")
+        output = os.path.join(staging, output_name(item))
+        if item["action"] == "project":
+            if item["transformation"]:
+                arcpy.Project_management(item["shp"], output, sr, item["transformation"])
+            else:
+                arcpy.Project_management(item["shp"], output, sr)
+        else:
+            arcpy.CopyFeatures_management(item["shp"], output)
+            if item["action"] == "define":
+                arcpy.DefineProjection_management(output, sr)
+        fields = [field.name for field in arcpy.ListFields(output)]
+        if "Orig_Name" not in fields:
+            arcpy.AddField_management(output, "Orig_Name", "TEXT", "", "", 250)
+        OARS_Attributes.write_attributes(output, {"Orig_Name": item["origName"]}, acresField=None)
+        return item["file"], output, None
+    except Exception as e:
+        return item["file"], None, str(e)
+
+
+def process(items, staging, workers=None):
+    """Reproject/copy every polygon shapefile into 'staging' across a worker pool. Returns {file: (output, error)}."""
+    jobs = [(item, staging) for item in items if item["action"] in PROCESS_ACTIONS]
+    if not jobs:
+        return {}
+    if not os.path.exists(staging):
+        os.makedirs(staging)
+    workers = min(workers or multiprocessing.cpu_count(), len(jobs))
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(process_item, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [process_item(job) for job in jobs]
+    return dict((f, (output, error)) for f, output, error in results)
+
+
+# Stage 3 ---------------------------------------------------------------------
+def shapefile_parts(path):
+    """All files belonging to a shapefile (same base name, any extension, e.g. .shp.xml)."""
+    folder, name = os.path.split(os.path.splitext(path)[0])
+    return [os.path.join(folder, f) for f in os.listdir(folder) if f.split(".")[0] == name]
+
+
+def commit(folder, wrongGeometry, junk, items, results):
+    """Move staged outputs into the OARS folder and record them in the manifest. All originals are moved
+    to a backup folder first and restored if anything fails, so the folder is never left half processed."""
+    manifest = load_manifest(folder)
+    backup = os.path.join(folder, "_backup_{0}".format(int(time.time())))
+    os.makedirs(backup)
+    moved = []                                                                  # (from, to) so the commit can be rolled back
+    try:
+        def move(source, destination):
+            shutil.move(source, destination)
+            moved.append((source, destination))
+
+        for f in junk:
+            move(os.path.join(folder, f), os.path.join(backup, f))
+        for item in items:
+            if item["action"] == "wrong geometry":
+                if not os.path.exists(wrongGeometry):
+                    os.makedirs(wrongGeometry)
+                for sidecar in item["sidecars"]:
+                    move(os.path.join(folder, sidecar), os.path.join(wrongGeometry, sanitize_name(sidecar)))
+            output, error = results.get(item["file"], (None, None))
+            if not output:
+                continue
+            for sidecar in item["sidecars"]:
+                move(os.path.join(folder, sidecar), os.path.join(backup, sidecar))
+            for part in shapefile_parts(output):
+                move(part, os.path.join(folder, os.path.basename(part)))
+            outputFile = os.path.basename(output)
+            manifest[outputFile] = {"source": item["file"], "action": item["action"], "shapeType": item["shapeType"], "datum": item["datum"],
+                                    "crs": TARGET_CRS, "sourceCrs": item["crs"], "transformation": item["transformation"],
+                                    "signature": file_signature(os.path.join(folder, outputFile))}
+        save_manifest(folder, manifest)
+    except Exception:
+        for source, destination in reversed(moved):
+            if os.path.exists(destination):
+                shutil.move(destination, source)
+        shutil.rmtree(backup)                                                   # Empty again once every move is undone
+        raise
+    shutil.rmtree(backup)
+
+
+def run(folder, wrongGeometry, staging, dryRun=False, workers=None):
+    """Run all 3 stages (or only the scan and report if dryRun). Returns the list of report/result messages."""
+    Tool_Timing.step("Scanning the OARS folder...")
+    junk, items = scan(folder)
+    Tool_Timing.count(len(items))
+    messages = report(junk, items)
+    if dryRun:
+        return messages
+    Tool_Timing.step("Projecting shapefiles to NAD 1983 UTM Zone 13N...")
+    results = process(items, staging, workers)
+    Tool_Timing.count(len(results))
+    Tool_Timing.wrote(*[output for output, error in results.values()])
+    errors = ["{0} failed: {1}".format(f, error) for f, (output, error) in sorted(results.items()) if error]
+    Tool_Timing.step("Committing the processed shapefiles...")
+    commit(folder, wrongGeometry, junk, items, results)
+    if os.path.exists(staging) and not os.listdir(staging):
+        os.rmdir(staging)
+    return messages + errors
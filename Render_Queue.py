@@ -0,0 +1,668 @@
+#-------------------------------------------------------------------------------
+# Name:        Render Queue
+''' Purpose:  Deferred rendering of the maps (PDF), graphs, KMZ files and slope
+              summary shapefiles created by the E911 Analysis and Percent Slope
+              Analysis tools. The tools finish their analysis, describe each
+              output as a render job (renderer, input datasets, templates, map
+              text and output paths) and call
+              submit(), which returns right away: the jobs are written to a queue
+              file and rendered by a background Python process with a pool of
+              worker processes, and each PDF opens when it's ready.
+              Every job is identified by a hash of the content of its input
+              datasets, its templates and its parameters. Rendered files are kept
+              in a cache folder, so rerunning a tool on identical data copies the
+              cached map instead of exporting it again, and identical jobs in one
+              batch are only rendered once. Jobs with geodatabase inputs are hashed
+              by the background process, so the tool doesn't wait for a cursor
+              pass over them. The background process logs its progress next to
+              the queue file, and the next tool run reports the renders that
+              failed (see previous_failures()).
+              Two sets of renderers are available: "arcpy" (the ArcMap map
+              document, graph and layer file templates) and "preview", written in
+              pure Python (SVG maps and graphs, KMZ), which stands in for the
+              ArcMap templates for testing.
+                python Render_Queue.py run queue.json --workers 4
+                python Render_Queue.py render jobs.json --backend preview
+'''
+#-------------------------------------------------------------------------------
+import argparse, hashlib, json, multiprocessing, os, shutil, subprocess, sys, tempfile, time, zipfile
+from xml.sax.saxutils import escape
+import numpy
+import CRS_Transforms, Shapefile_IO, WKT_Export
+
+BACKEND = os.environ.get("FORESTRY_RENDER_BACKEND", "arcpy")                  # "arcpy" or "preview"
+CACHE_FOLDER = os.path.join(tempfile.gettempdir(), "Forestry Tools Render Cache")
+QUEUE_FOLDER = os.path.join(CACHE_FOLDER, "Queue")
+CACHE_DAYS = 30                                                                 # Cached renders not used for this long are deleted
+
+
+# Job identity ----------------------------------------------------------------
+def _update_file(digest, path):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+
+
+def dataset_hash(path):
+    """sha1 of a dataset's content: the .shp/.dbf/.prj bytes of a shapefile, otherwise (e.g. a geodatabase
+    feature class) every row's geometry and attributes read with an arcpy cursor."""
+    digest = hashlib.sha1()
+    if path.lower().endswith(".shp"):
+        base = os.path.splitext(path)[0]
+        for ext in (".shp", ".dbf", ".prj"):
+            if os.path.exists(base + ext):
+                _update_file(digest, base + ext)
+        return digest.hexdigest()
+    import arcpy
+
+    fields = sorted(field.name for field in arcpy.ListFields(path) if field.type not in ("OID", "Geometry", "Raster", "Blob"))
+    with arcpy.da.SearchCursor(path, fields + ["SHAPE@WKB"]) as cursor:
+        for row in cursor:
+            digest.update(repr(row[:-1]).encode("utf-8"))
+            digest.update(bytes(row[-1]) if row[-1] else b"")
+    return digest.hexdigest()
+
+
+def job_key(spec):
+    """Content hash of a render job. Output locations aren't part of it, so an identical rerun into another folder
+    still reuses the cached render. Templates are identified by size and modification time."""
+    identity = {"renderer": spec["renderer"],
+                "backend": spec.get("backend", BACKEND),
+                "params": spec.get("params", {}),
+                "inputs": dict((role, dataset_hash(path)) for role, path in spec.get("inputs", {}).items()),
+                "templates": dict((role, (os.path.getsize(path), os.path.getmtime(path)) if os.path.exists(path) else None)
+                                  for role, path in spec.get("templates", {}).items()),
+                "outputs": sorted((role, os.path.splitext(path)[1].lower()) for role, path in spec["outputs"].items())}
+    return hashlib.sha1(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def cached_files(spec, key):
+    """{role: cached file} for the job, or None if it hasn't been rendered yet."""
+    folder = os.path.join(CACHE_FOLDER, key)
+    files = dict((role, os.path.join(folder, role + os.path.splitext(path)[1])) for role, path in spec["outputs"].items())
+    return files if all(os.path.exists(f) for f in files.values()) else None
+
+
+# Rendering -------------------------------------------------------------------
+RENDERERS = {}                                                                  # (renderer, backend) -> function(spec, outputs, workspace)
+
+
+def renderer(name, backend):
+    def register(function):
+        RENDERERS[(name, backend)] = function
+        return function
+    return register
+
+
+def dataset_files(path):
+    """The file at 'path', or every part of a shapefile (.shp, .dbf, .shx, .prj...)."""
+    if not path.lower().endswith(".shp"):
+        return [path] if os.path.exists(path) else []
+    folder, name = os.path.split(os.path.splitext(path)[0])
+    folder = folder or "."
+    return [os.path.join(folder, f) for f in os.listdir(folder) if f.split(".")[0] == name] if os.path.isdir(folder) else []
+
+
+def remove_datasets(paths):
+    """Delete the temporary datasets listed in a job's "cleanup" once the job is done. Files still locked are left."""
+    for path in paths:
+        for f in dataset_files(path):
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+
+
+def deliver(spec, files):
+    """Copy the cached files to the job's output paths and open the ones listed in "open"."""
+    for role, path in spec["outputs"].items():
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        for f in dataset_files(files[role]):                                    # A shapefile output has several parts
+            shutil.copyfile(f, os.path.splitext(path)[0] + os.path.basename(f)[len(role):])
+        os.utime(files[role], None)                                             # Keeps it from being pruned
+    for role in spec.get("open", []):
+        if hasattr(os, "startfile"):
+            os.startfile(spec["outputs"][role])
+
+
+def render(spec):
+    """Render one job (or reuse its cached render) and deliver it. Returns "cached" or "rendered"."""
+    key = spec.get("key") or job_key(spec)
+    files = cached_files(spec, key)
+    if files:
+        deliver(spec, files)
+        return "cached"
+    backend = spec.get("backend", BACKEND)
+    function = RENDERERS.get((spec["renderer"], backend))
+    if function is None:
+        raise ValueError("No '{0}' renderer for the '{1}' backend.".format(spec["renderer"], backend))
+    if not os.path.exists(CACHE_FOLDER):
+        os.makedirs(CACHE_FOLDER)
+    workspace = tempfile.mkdtemp(prefix="render_", dir=CACHE_FOLDER)           # Intermediate data, e.g. the dissolved label polygons
+    staging = os.path.join(workspace, "outputs")
+    os.makedirs(staging)
+    try:
+        outputs = dict((role, os.path.join(staging, role + os.path.splitext(path)[1])) for role, path in spec["outputs"].items())
+        function(spec, outputs, workspace)
+        missing = [role for role, path in outputs.items() if not os.path.exists(path)]
+        if missing:
+            raise RuntimeError("The {0} renderer didn't create: {1}".format(spec["renderer"], ", ".join(missing)))
+        try:
+            os.rename(staging, os.path.join(CACHE_FOLDER, key))
+        except OSError:                                                         # Rendered by another process in the meantime
+            pass
+        deliver(spec, cached_files(spec, key) or outputs)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)                            # arcpy may still hold a lock on intermediate data
+    return "rendered"
+
+
+def render_job(spec):
+    """Worker: render one job, returning (spec, status, seconds, error) instead of raising."""
+    start = time.time()
+    try:
+        status, error = render(spec), None
+    except Exception as e:
+        status, error = "failed", "{0}: {1}".format(type(e).__name__, e)
+    remove_datasets(spec.get("cleanup", []))
+    return spec, status, time.time() - start, error
+
+
+def render_all(specs, workers=None):
+    """Render a batch of jobs across a worker pool. Jobs with the same key are rendered once; the duplicates are
+    then delivered from the cache. Returns a list of (spec, status, seconds, error)."""
+    keyed, failed = [], []
+    for spec in specs:
+        try:
+            keyed.append(spec if spec.get("key") else dict(spec, key=job_key(spec)))
+        except Exception as e:                                                  # e.g. an input that no longer exists
+            failed.append((spec, "failed", 0.0, "{0}: {1}".format(type(e).__name__, e)))
+            remove_datasets(spec.get("cleanup", []))
+    unique, duplicates, keys = [], [], set()
+    for spec in keyed:
+        (duplicates if spec["key"] in keys else unique).append(spec)
+        keys.add(spec["key"])
+    workers = min(workers or multiprocessing.cpu_count(), len(unique))
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(render_job, unique, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [render_job(spec) for spec in unique]
+    return results + [render_job(spec) for spec in duplicates] + failed
+
+
+def report_errors(results):
+    """Write "<output>.render_error.txt" next to the outputs of failed jobs, since a background render has no console."""
+    for spec, status, seconds, error in results:
+        if error:
+            path = sorted(spec["outputs"].values())[0]
+            with open(path + ".render_error.txt", "w") as f:
+                f.write("{0} render job failed:\n{1}\n\n{2}\n".format(spec["renderer"], error, json.dumps(spec, indent=1, sort_keys=True)))
+
+
+def prune_cache(days=CACHE_DAYS):
+    """Delete cached renders and queue results older than 'days'."""
+    cutoff = time.time() - days * 86400
+    for folder in (CACHE_FOLDER, QUEUE_FOLDER):
+        if not os.path.exists(folder):
+            continue
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if path != QUEUE_FOLDER and os.path.getmtime(path) < cutoff:
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+
+
+# Queue -----------------------------------------------------------------------
+def python_executable():
+    """The Python interpreter to start the background renderer with. Inside ArcMap, sys.executable is ArcMap.exe."""
+    executable = sys.executable or ""
+    if os.path.basename(executable).lower().startswith(("arcmap", "arccatalog", "arcgispro")) or not executable:
+        executable = os.path.join(sys.exec_prefix, "python.exe" if os.name == "nt" else "python")
+    return executable
+
+
+def submit(specs, workers=None):
+    """Queue render jobs and return immediately. Jobs whose inputs are all shapefiles are hashed here and, if they
+    are already in the cache, delivered right away; the rest are hashed and rendered by a background process (or in
+    this process if one can't be started). Returns a list of (spec, status) with status "cached", "queued" or the
+    result of rendering in-process. Queued specs have a "log" path, where the background process reports progress.
+    Datasets listed in a spec's "cleanup" (e.g. temporary inputs) are deleted once its job is done."""
+    results, pending = [], []
+    for spec in specs:
+        spec = dict(spec)
+        if all(path.lower().endswith(".shp") for path in spec.get("inputs", {}).values()):
+            spec["key"] = job_key(spec)                                         # Hashed now, before the tool moves on
+            files = cached_files(spec, spec["key"])
+            if files:
+                deliver(spec, files)
+                remove_datasets(spec.get("cleanup", []))
+                results.append((spec, "cached"))
+                continue
+        pending.append(spec)
+    if not pending:
+        return results
+    if not os.path.exists(QUEUE_FOLDER):
+        os.makedirs(QUEUE_FOLDER)
+    queueFile = os.path.join(QUEUE_FOLDER, "render_{0}_{1}.json".format(time.strftime("%Y%m%d_%H%M%S"), os.getpid()))
+    logFile = queueFile[:-5] + ".log"
+    with open(queueFile, "w") as f:
+        json.dump(pending, f, indent=1)
+    command = [python_executable(), os.path.abspath(__file__).replace(".pyc", ".py"), "run", queueFile]
+    if workers:
+        command += ["--workers", str(workers)]
+    try:
+        with open(logFile, "w") as log:
+            subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), close_fds=os.name != "nt", stdout=log, stderr=subprocess.STDOUT,
+                             creationflags=0x08000000 if os.name == "nt" else 0)  # CREATE_NO_WINDOW
+        return results + [(dict(spec, log=logFile), "queued") for spec in pending]
+    except (OSError, ValueError):
+        os.remove(queueFile)
+        rendered = render_all(pending, workers)
+        report_errors(rendered)
+        return results + [(spec, error or status) for spec, status, seconds, error in rendered]
+
+
+def run_queue(queueFile, workers=None):
+    """Background process: render the jobs of a queue file, then replace it with a "_results.json" file."""
+    prune_cache()
+    with open(queueFile, "r") as f:
+        specs = json.load(f)
+    print("Rendering {0} jobs...".format(len(specs)))
+    sys.stdout.flush()
+    results = render_all(specs, workers)
+    report_errors(results)
+    with open(queueFile[:-5] + "_results.json", "w") as f:
+        json.dump([{"renderer": spec["renderer"], "outputs": spec["outputs"], "status": status, "seconds": round(seconds, 3), "error": error}
+                   for spec, status, seconds, error in results], f, indent=1)
+    os.remove(queueFile)
+    return results
+
+
+def previous_failures():
+    """Messages about background renders that failed since the last call, so the next tool run can report them:
+    failed jobs in "_results.json" files, and background processes that stopped with a traceback in their log.
+    Each file is renamed to "..._reported" once it has been read, so every failure is reported once."""
+    messages = []
+    if not os.path.exists(QUEUE_FOLDER):
+        return messages
+    for name in sorted(os.listdir(QUEUE_FOLDER)):
+        path = os.path.join(QUEUE_FOLDER, name)
+        if name.endswith("_results.json"):
+            try:
+                with open(path, "r") as f:
+                    results = json.load(f)
+            except (IOError, ValueError):                                       # Still being written
+                continue
+            for result in results:
+                if result["error"]:
+                    messages.append("Background {0} render of {1} failed: {2}".format(result["renderer"], ", ".join(sorted(result["outputs"].values())), result["error"]))
+            os.rename(path, path[:-len("_results.json")] + "_reported.json")
+        elif name.endswith(".log") and not name.endswith("_reported.log") and not os.path.exists(path[:-4] + "_reported.json"):
+            with open(path, "r") as f:
+                log = f.read()
+            if "Traceback" in log:                                              # The process stopped before writing its results
+                messages.append("Background render {0} stopped: {1} (see {2})".format(name[:-4], log.strip().splitlines()[-1], path))
+                os.rename(path, path[:-4] + "_reported.log")
+    return messages
+
+
+# Map text --------------------------------------------------------------------
+def scale_text(scale, metric):
+    """Scale text below the scale bar, e.g. "1:95,040  1 inch = 1.5 miles"."""
+    if metric:
+        return "1:{0:,}  1 cm = {1} meters".format(int(scale), int(scale / 100))
+    return "1:{0:,}  1 inch = {1} miles".format(int(scale), round(scale / 12 / 5280, 2))
+
+
+# arcpy renderers -------------------------------------------------------------
+def add_layer(arcpy, mxd, df, dataset, name, symbology=None, position="TOP"):
+    """Add 'dataset' to the data frame as a layer called 'name' with the symbology of a layer file. Returns (layer, map layer)."""
+    arcpy.MakeFeatureLayer_management(dataset, name)
+    layer = arcpy.mapping.Layer(name)
+    arcpy.mapping.AddLayer(df, layer, position)
+    mapLayer = arcpy.mapping.ListLayers(mxd, name, df)[0]
+    if symbology:
+        arcpy.mapping.UpdateLayer(df, mapLayer, arcpy.mapping.Layer(symbology))
+    return layer, mapLayer
+
+
+def update_map_text(arcpy, mxd, df, params):
+    """Title, subtitle and notes, plus the meters or miles scale bar and scale text depending on the data frame scale."""
+    for element in arcpy.mapping.ListLayoutElements(mxd, "TEXT_ELEMENT"):
+        if element.name == "Map Title":
+            element.text = params["title"]
+        elif element.name == "Map Subtitle":
+            element.text = params["subtitle"]
+        elif element.name == "Map Notes":
+            element.text = params["notes"]
+    met_scale = arcpy.mapping.ListLayoutElements(mxd, "MAPSURROUND_ELEMENT", "Scale Bar - meters")[0]
+    mil_scale = arcpy.mapping.ListLayoutElements(mxd, "MAPSURROUND_ELEMENT", "Scale Bar - miles")[0]
+    if df.scale < 25000:
+        met_scale.elementPositionX = 1.936                                      # On the page
+        mil_scale.elementPositionX = 15                                         # Move scale bar off the page
+    else:
+        met_scale.elementPositionX = 15
+        mil_scale.elementPositionX = 1.936
+    text = arcpy.mapping.ListLayoutElements(mxd, "TEXT_ELEMENT", "Scale Text")[0]
+    text.text = params.get("scalePrefix", "") + scale_text(df.scale, df.scale < 25000)
+
+
+def save_map(mxd, outputs):
+    """Save a copy of the map document if requested, then export it to PDF."""
+    import arcpy
+
+    if "mxd" in outputs:
+        mxd.saveACopy(outputs["mxd"])
+    arcpy.mapping.ExportToPDF(mxd, outputs["map"])
+
+
+@renderer("slope_map", "arcpy")
+def arcpy_slope_map(spec, outputs, workspace):
+    """Percent Slope Analysis map: steep/less steep polygons labeled by zone, inset map zoomed to the counties.
+    The steep and less steep polygons are also saved as the "summary" output, with the acres of the tool's
+    zonal results ("acres": {zone: [acres above, acres below the threshold]}) rather than measured polygon areas."""
+    import arcpy
+
+    params, zones = spec["params"], spec["inputs"]["zones"]
+    mxd_template = arcpy.mapping.MapDocument(spec["templates"]["mxd"])
+    df_main = arcpy.mapping.ListDataFrames(mxd_template, "Main Map")[0]
+    df_inset = arcpy.mapping.ListDataFrames(mxd_template, "Inset Map")[0]
+
+    # Polygons of steep and less steep slope within each zone, from the reclassified slope raster (GRIDCODE 0 = above slope threshold, 1 = below)
+    clip = os.path.join(workspace, "slope.tif")
+    arcpy.Clip_management(spec["templates"]["slope"], "", clip, zones, "", "ClippingGeometry", "NO_MAINTAIN_EXTENT")
+    binarySlope = os.path.join(workspace, "binarySlope.shp")
+    arcpy.RasterToPolygon_conversion(clip, binarySlope, "SIMPLIFY", "VALUE")
+    intersect = os.path.join(workspace, "intersect.shp")
+    arcpy.Intersect_analysis([zones, binarySlope], intersect, "ALL")
+    arcpy.AddField_management(intersect, "Slope", "TEXT", "", "", 20)
+    with arcpy.da.UpdateCursor(intersect, ["GRIDCODE", "Slope"]) as cursor:
+        for row in cursor:
+            cursor.updateRow([row[0], "{0} {1}%".format(">" if row[0] == 0 else "<", params["threshold"])])
+    slope = os.path.join(workspace, "slope.shp")
+    arcpy.Dissolve_management(intersect, slope, "Zone;Slope", multi_part="MULTI_PART")
+    arcpy.AddField_management(slope, "SUM_Acres", "DOUBLE")
+    arcpy.AddField_management(slope, "GraphLabel", "TEXT", "", "", 30)
+    with arcpy.da.UpdateCursor(slope, ["Zone", "Slope", "SUM_Acres", "GraphLabel"]) as cursor:
+        for row in cursor:
+            acres = params["acres"][row[0]][0 if row[1].startswith(">") else 1]
+            cursor.updateRow([row[0], row[1], acres, "{0}: {1}".format(row[0], row[1])])
+
+    # Treatments with the symbology of the slope threshold & transparency
+    treatments, updateLayer = add_layer(arcpy, mxd_template, df_main, slope, params["layerName"], spec["templates"]["symbology"])
+    updateLayer.transparency = 50                                               # has to be the map layer object, can't be the feature layer object (i.e. treatments)
+
+    # Zones for labeling (1 label per polygon)
+    legend = arcpy.mapping.ListLayoutElements(mxd_template, "LEGEND_ELEMENT", "Legend")[0]
+    legend.autoAdd = False                                                      # Prevents layer used for labeling from showing up in legend.
+    labels_lyr = add_layer(arcpy, mxd_template, df_main, zones, "{0}_labels".format(params["layerName"]), position="BOTTOM")[1]
+    labels_lyr.labelClasses[0].expression = "[Zone]"
+    labels_lyr.showLabels = True
+
+    # Zoom Main Map extent to Treatments
+    df_main.extent = treatments.getExtent(True)
+    df_main.scale = df_main.scale * 1.05                                        # Zoom out just a tad.
+
+    # Zoom Inset Map Extent to Correct Counties
+    arcpy.mapping.AddLayer(df_inset, treatments, "TOP")
+    treatmentsInset = arcpy.mapping.ListLayers(mxd_template, params["layerName"], df_inset)[0]
+    arcpy.mapping.UpdateLayer(df_inset, treatmentsInset, arcpy.mapping.Layer(spec["templates"]["symbology"]))
+    countiesInset = arcpy.mapping.ListLayers(mxd_template, "County Boundaries", df_inset)[0]
+    arcpy.SelectLayerByLocation_management(countiesInset, "INTERSECT", treatmentsInset)
+    df_inset.extent = countiesInset.getSelectedExtent()
+    arcpy.SelectLayerByAttribute_management(countiesInset, "CLEAR_SELECTION")
+    df_inset.scale = df_inset.scale * 1.05
+
+    update_map_text(arcpy, mxd_template, df_main, params)
+    save_map(mxd_template, outputs)
+    del mxd_template
+    if "summary" in outputs:
+        arcpy.CopyFeatures_management(slope, outputs["summary"])
+
+
+@renderer("slope_graph", "arcpy")
+def arcpy_slope_graph(spec, outputs, workspace):
+    """Bar graph of the acres above and below the slope threshold for each polygon."""
+    import arcpy
+
+    table = os.path.join(workspace, "bars.dbf")
+    arcpy.CreateTable_management(workspace, "bars.dbf")
+    arcpy.AddField_management(table, "GraphLabel", "TEXT", "", "", 60)
+    arcpy.AddField_management(table, "SUM_Acres", "DOUBLE")
+    with arcpy.da.InsertCursor(table, ["GraphLabel", "SUM_Acres"]) as cursor:
+        for bar in spec["params"]["bars"]:
+            cursor.insertRow(bar)
+    arcpy.MakeGraph_management(spec["templates"]["graph"], "SERIES=bar:vertical DATA={0} Y=SUM_Acres LABEL=GraphLabel;GRAPH=general TITLE={1} Percent Slope Results FOOTER=New Mexico State Forestry;LEGEND=general;AXIS=left TITLE=Acres;AXIS=right;AXIS=bottom;AXIS=top".format(table, spec["params"]["title"]), "temp_graph")
+    arcpy.SaveGraph_management("temp_graph", outputs["graph"], "MAINTAIN_ASPECT_RATIO", "1000", "559")
+
+
+@renderer("e911_map", "arcpy")
+def arcpy_e911_map(spec, outputs, workspace):
+    """E911 Analysis map of a 1 or 5 mile buffer: buffer, E911 addresses in the buffer and the fire origin."""
+    import arcpy
+
+    params, inputs, templates = spec["params"], spec["inputs"], spec["templates"]
+    mxd_template = arcpy.mapping.MapDocument(templates["mxd"])
+    df_main = arcpy.mapping.ListDataFrames(mxd_template, "Main Map")[0]
+
+    # Convert datasets to layers, add them to mxd, change symbology and layer names for legend entry
+    buffer, bufferLayer = add_layer(arcpy, mxd_template, df_main, inputs["buffer"], "buffer", templates["buffer"])
+    bufferLayer.name = "Buffer - {0} mile".format(params["miles"])
+    if "addresses" in inputs:                                                   # Not included when no addresses are in the buffer
+        add_layer(arcpy, mxd_template, df_main, inputs["addresses"], "e911", templates["addresses"])[1].name = "E911 Addresses in Buffer"
+    add_layer(arcpy, mxd_template, df_main, inputs["origin"], "fire_origin", templates["origin"])[1].name = params["fire"]
+
+    # Zoom Main Map extent to Fire Buffer
+    df_main.extent = buffer.getExtent(True)
+    df_main.scale = params["scale"]
+
+    update_map_text(arcpy, mxd_template, df_main, params)
+    save_map(mxd_template, outputs)
+    del mxd_template
+
+
+@renderer("kmz", "arcpy")
+def arcpy_kmz(spec, outputs, workspace):
+    """KMZ of a dataset with the symbology of a layer file, for Google Earth."""
+    import arcpy
+
+    mxd_template = arcpy.mapping.MapDocument(spec["templates"]["mxd"])
+    df_main = arcpy.mapping.ListDataFrames(mxd_template, "Main Map")[0]
+    mapLayer = add_layer(arcpy, mxd_template, df_main, spec["inputs"]["features"], "kmz_layer", spec["templates"].get("symbology"))[1]
+    mapLayer.name = spec["params"]["name"]
+    arcpy.LayerToKML_conversion(mapLayer, outputs["kmz"], "", "NO_COMPOSITE", "", "", "", "CLAMPED_TO_GROUND")
+    del mxd_template
+
+
+# Preview renderers (pure Python) ---------------------------------------------
+def read_features(path):
+    """[(shape, {field: value})] of a dataset, shapes as ShapefileReader returns them. Shapefiles are read
+    directly; other datasets (e.g. geodatabase feature classes) need arcpy."""
+    if path.lower().endswith(".shp"):
+        reader = Shapefile_IO.ShapefileReader(path)
+        names = reader.fieldNames
+        return [(shape, dict(zip(names, record))) for shape, record in reader.iter_shape_records() if shape]
+    import arcpy
+    from Slope_Zonal import arcpy_polygon_rings
+
+    fields = [field.name for field in arcpy.ListFields(path) if field.type not in ("OID", "Geometry", "Raster", "Blob")]
+    features = []
+    with arcpy.da.SearchCursor(path, ["SHAPE@"] + fields) as cursor:
+        for row in cursor:
+            if row[0]:
+                shape = (row[0].firstPoint.X, row[0].firstPoint.Y) if row[0].type == "point" else arcpy_polygon_rings(row[0])
+                features.append((shape, dict(zip(fields, row[1:]))))
+    return features
+
+
+def shape_bbox(shapes):
+    points = numpy.array([point for shape in shapes for point in ([shape] if isinstance(shape, tuple) else [p for ring in shape for p in ring])], dtype=float)
+    return points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max()
+
+
+class SvgMap(object):
+    """Minimal SVG page: map features fitted to a frame below the title, text in page coordinates."""
+
+    def __init__(self, bbox, width=1100, height=850, frame=(50, 130, 1050, 770)):
+        self.width, self.height = width, height
+        self.elements = []
+        xmin, ymin, xmax, ymax = bbox
+        left, top, right, bottom = frame
+        self.scale = min((right - left) / max(xmax - xmin, 1e-9), (bottom - top) / max(ymax - ymin, 1e-9)) / 1.05
+        self.x0 = (left + right) / 2.0 - (xmin + xmax) / 2.0 * self.scale
+        self.y0 = (top + bottom) / 2.0 + (ymin + ymax) / 2.0 * self.scale
+        self.elements.append('<rect x="{0}" y="{1}" width="{2}" height="{3}" fill="none" stroke="#444"/>'.format(left, top, right - left, bottom - top))
+
+    def xy(self, x, y):
+        return self.x0 + x * self.scale, self.y0 - y * self.scale
+
+    def polygon(self, rings, fill, opacity=1.0, stroke="#333"):
+        path = " ".join("M " + " L ".join("{0:.1f} {1:.1f}".format(*self.xy(x, y)) for x, y in ring) + " Z" for ring in rings)
+        self.elements.append('<path d="{0}" fill="{1}" fill-opacity="{2}" stroke="{3}" fill-rule="evenodd"/>'.format(path, fill, opacity, stroke))
+
+    def point(self, x, y, radius, fill):
+        px, py = self.xy(x, y)
+        self.elements.append('<circle cx="{0:.1f}" cy="{1:.1f}" r="{2}" fill="{3}" stroke="#000"/>'.format(px, py, radius, fill))
+
+    def text(self, x, y, text, size=14, anchor="start", weight="normal"):
+        for i, line in enumerate(u"{0}".format(text).split("\n")):
+            self.elements.append(u'<text x="{0:.1f}" y="{1:.1f}" font-family="Arial" font-size="{2}" font-weight="{3}" text-anchor="{4}">{5}</text>'.format(
+                x, y + i * size * 1.2, size, weight, anchor, escape(line)))
+
+    def map_text(self, params):
+        self.text(self.width / 2.0, 50, params["title"], 30, "middle", "bold")
+        self.text(self.width / 2.0, 90, params["subtitle"], 18, "middle")
+        self.text(50, 800, params["notes"], 12)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(u'<?xml version="1.0" encoding="UTF-8"?>\n<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}">\n{2}\n</svg>\n'.format(
+                self.width, self.height, u"\n".join(self.elements)).encode("utf-8"))
+
+
+@renderer("slope_map", "preview")
+def preview_slope_map(spec, outputs, workspace):
+    features = read_features(spec["inputs"]["zones"])
+    page = SvgMap(shape_bbox([shape for shape, attributes in features]))
+    zones = {}
+    for shape, attributes in features:
+        page.polygon(shape, "#fdae61", 0.5)                                     # The preview doesn't read the slope raster
+        zones.setdefault(attributes["Zone"], []).extend(point for ring in shape for point in ring)
+    for zone, points in sorted(zones.items()):
+        x, y = numpy.mean(numpy.array(points, dtype=float), axis=0)
+        page.text(*page.xy(x, y), text=zone, size=12, anchor="middle", weight="bold")
+    page.map_text(spec["params"])
+    page.save(outputs["map"])
+    if "summary" in outputs:                                                    # Both slope classes get the outline of the zone
+        fields = [("Zone", "C", 15, 0), ("Slope", "C", 20, 0), ("SUM_Acres", "N", 19, 11), ("GraphLabel", "C", 30, 0)]
+        with Shapefile_IO.ShapefileWriter(outputs["summary"], Shapefile_IO.POLYGON, fields, Shapefile_IO.read_prj(spec["inputs"]["zones"])) as writer:
+            for shape, attributes in features:
+                for i, slope in enumerate(["> {0}%", "< {0}%"]):
+                    slope = slope.format(spec["params"]["threshold"])
+                    writer.write(shape, [attributes["Zone"], slope, spec["params"]["acres"][attributes["Zone"]][i], "{0}: {1}".format(attributes["Zone"], slope)])
+
+
+@renderer("slope_graph", "preview")
+def preview_slope_graph(spec, outputs, workspace):
+    bars = spec["params"]["bars"]
+    page = SvgMap((0, 0, 1, 1), 1000, 559)
+    page.elements = []
+    page.text(500, 40, "{0} Percent Slope Results".format(spec["params"]["title"]), 22, "middle", "bold")
+    left, top, bottom, width = 80, 70, 430, 880.0
+    maximum = max([acres for label, acres in bars] + [1e-9])
+    step = width / max(len(bars), 1)
+    for i, (label, acres) in enumerate(bars):
+        height = (bottom - top) * acres / maximum
+        page.elements.append('<rect x="{0:.1f}" y="{1:.1f}" width="{2:.1f}" height="{3:.1f}" fill="{4}"/>'.format(
+            left + i * step + step * 0.15, bottom - height, step * 0.7, height, "#d7301f" if ": >" in label else "#1a9850"))
+        page.text(left + (i + 0.5) * step, bottom - height - 5, "{0:,.2f}".format(acres), 11, "middle")
+        page.text(left + (i + 0.5) * step, bottom + 18, label, 11, "middle")
+    page.text(20, (top + bottom) / 2.0, "Acres", 14)
+    page.text(500, 540, "New Mexico State Forestry", 12, "middle")
+    page.save(outputs["graph"])
+
+
+@renderer("e911_map", "preview")
+def preview_e911_map(spec, outputs, workspace):
+    inputs = spec["inputs"]
+    buffer = read_features(inputs["buffer"])
+    origin = read_features(inputs["origin"])
+    addresses = read_features(inputs["addresses"]) if "addresses" in inputs else []
+    page = SvgMap(shape_bbox([shape for shape, attributes in buffer]))
+    for shape, attributes in buffer:
+        page.polygon(shape, "#fdae61", 0.3)
+    for (x, y), attributes in addresses:
+        page.point(x, y, 2, "#2c7bb6")
+    for (x, y), attributes in origin:
+        page.point(x, y, 6, "#d7191c")
+    page.map_text(spec["params"])
+    page.text(1050, 800, scale_text(spec["params"]["scale"], spec["params"]["scale"] < 25000), 12, "end")
+    page.save(outputs["map"])
+
+
+def kml_geometry(shape, zone=13):
+    """KML Point or (Multi)Polygon of a NAD83 UTM shape, in WGS 1984 longitude/latitude."""
+    rings = [[[shape]]] if isinstance(shape, tuple) else WKT_Export.shapefile_polygons(shape)   # Polygons, each a list of rings
+    flat = numpy.array([point for polygon in rings for ring in polygon for point in ring], dtype=float)
+    lon, lat = CRS_Transforms.utm_to_geographic(flat[:, 0], flat[:, 1], zone, CRS_Transforms.GRS80)
+    lon, lat = CRS_Transforms.nad83_to_wgs84(lon, lat)
+    coordinates = ["{0:.8f},{1:.8f},0".format(x, y) for x, y in zip(lon, lat)]
+    if isinstance(shape, tuple):
+        return "<Point><altitudeMode>clampToGround</altitudeMode><coordinates>{0}</coordinates></Point>".format(coordinates[0])
+    polygons, position = [], 0
+    for polygon in rings:
+        boundaries = []
+        for i, ring in enumerate(polygon):
+            text = " ".join(coordinates[position:position + len(ring)])
+            position += len(ring)
+            boundaries.append("<{0}><LinearRing><coordinates>{1}</coordinates></LinearRing></{0}>".format("outerBoundaryIs" if i == 0 else "innerBoundaryIs", text))
+        polygons.append("<Polygon><altitudeMode>clampToGround</altitudeMode>{0}</Polygon>".format("".join(boundaries)))
+    return polygons[0] if len(polygons) == 1 else "<MultiGeometry>{0}</MultiGeometry>".format("".join(polygons))
+
+
+@renderer("kmz", "preview")
+def preview_kmz(spec, outputs, workspace):
+    name = spec["params"]["name"]
+    placemarks = []
+    for shape, attributes in read_features(spec["inputs"]["features"]):
+        data = "".join(u'<Data name="{0}"><value>{1}</value></Data>'.format(escape(key), escape(u"{0}".format(value)))
+                       for key, value in sorted(attributes.items()) if value is not None)
+        placemarks.append(u"<Placemark><name>{0}</name><ExtendedData>{1}</ExtendedData>{2}</Placemark>".format(escape(name), data, kml_geometry(shape)))
+    kml = u'<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document><name>{0}</name>\n{1}\n</Document></kml>\n'.format(
+        escape(name), u"\n".join(placemarks))
+    with zipfile.ZipFile(outputs["kmz"], "w", zipfile.ZIP_DEFLATED) as kmz:
+        kmz.writestr("doc.kml", kml.encode("utf-8"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render queued Forestry Tools maps, graphs and KMZ files.")
+    parser.add_argument("command", choices=["run", "render"], help="run: render a queue file written by submit(); render: render a JSON list of jobs")
+    parser.add_argument("jobs", help="JSON file of render jobs")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--backend", choices=["arcpy", "preview"], help="Renderers to use for jobs that don't specify one")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run_queue(args.jobs, args.workers)
+    else:
+        with open(args.jobs, "r") as f:
+            specs = json.load(f)
+        if args.backend:
+            specs = [dict(spec, backend=spec.get("backend", args.backend)) for spec in specs]
+        results = render_all(specs, args.workers)
+        report_errors(results)
+    for spec, status, seconds, error in results:
+        print("{0} {1}: {2} ({3:.2f} seconds)".format(spec["renderer"], ", ".join(sorted(spec["outputs"].values())), error or status, seconds))
+
+
+if __name__ == "__main__":
+    main()
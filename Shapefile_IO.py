@@ -0,0 +1,364 @@
+#-------------------------------------------------------------------------------
+# Name:        Shapefile IO
+''' Purpose:  Reads shapefiles (.shp/.dbf/.prj) directly without arcpy. Used where
+              a tool only needs coordinates and attributes held in memory (e.g. the
+              E911 reference layers), so the files are read once instead of being
+              rescanned by geoprocessing tools. Supports the point and polygon
+              shape types (including Z and M variants, whose Z/M values are ignored).
+              Records flagged as deleted in the .dbf are skipped, as ArcGIS does.
+              ShapefileWriter writes 2D point/polyline/polygon shapefiles, e.g. to
+              create synthetic OARS data for benchmarks, or copies records of
+              another shapefile byte for byte (iter_raw/write_raw, Z/M kept).
+'''
+#-------------------------------------------------------------------------------
+import datetime, os, struct
+
+NULL, POINT, POLYLINE, POLYGON, MULTIPOINT = 0, 1, 3, 5, 8
+DBF_BLOCK = 10000                                                               # dbf records read at once when scanning deletion flags
+SHAPE_TYPES = {0: "Null", 1: "Point", 3: "Polyline", 5: "Polygon", 8: "Multipoint",
+               11: "Point", 13: "Polyline", 15: "Polygon", 18: "Multipoint",
+               21: "Point", 23: "Polyline", 25: "Polygon", 28: "Multipoint"}
+
+
+def base_shape_type(shapeType):
+    """Collapse Z (1x) and M (2x) shape types to their 2D equivalent (e.g. 15 'PolygonZ' -> 5)."""
+    return shapeType % 10 if shapeType >= 10 else shapeType
+
+
+def read_header(shp):
+    """Return (shape type, (xmin, ymin, xmax, ymax)) from the 100 byte header of a .shp file."""
+    with open(shp, "rb") as f:
+        header = f.read(100)
+    fileCode = struct.unpack(">i", header[0:4])[0]
+    if fileCode != 9994:
+        raise ValueError("{0} is not a shapefile.".format(shp))
+    shapeType = struct.unpack("<i", header[32:36])[0]
+    bbox = struct.unpack("<4d", header[36:68])
+    return shapeType, bbox
+
+
+def read_prj(shp):
+    """Return the ESRI WKT string in the shapefile's .prj file, or None if it doesn't have one."""
+    prj = os.path.splitext(shp)[0] + ".prj"
+    if not os.path.exists(prj):
+        return None
+    with open(prj, "r") as f:
+        return f.read().strip()
+
+
+class ShapefileReader(object):
+    """Sequential reader for a shapefile's geometry and attributes. Points are returned as (x, y),
+    polygons and polylines as a list of parts, each part a list of (x, y) vertices. Null shapes are None."""
+
+    def __init__(self, shp, encoding="latin-1"):
+        self.shp = shp
+        self.dbf = os.path.splitext(shp)[0] + ".dbf"
+        self.encoding = encoding
+        self.shapeType, self.bbox = read_header(shp)
+        self.prj = read_prj(shp)
+        self._read_dbf_header()
+
+    def _read_dbf_header(self):
+        self.fields = []                                                        # (name, type, length, decimals)
+        self.numRecords = 0
+        if not os.path.exists(self.dbf):
+            return
+        with open(self.dbf, "rb") as f:
+            header = f.read(32)
+            self.numRecords, self._headerLength, self._recordLength = struct.unpack("<IHH", header[4:12])
+            while True:
+                descriptor = f.read(32)
+                if not descriptor or descriptor[0:1] == b"\r":
+                    break
+                name = descriptor[:11].split(b"\x00")[0].decode("ascii").strip()
+                fieldType = descriptor[11:12].decode("ascii")
+                length, decimals = struct.unpack("<BB", descriptor[16:18])
+                self.fields.append((name, fieldType, length, decimals))
+
+    @property
+    def fieldNames(self):
+        return [field[0] for field in self.fields]
+
+    def deleted_records(self):
+        """Set of the (0-based) record numbers whose dbf deletion flag is '*'."""
+        deleted = set()
+        if not self.fields:
+            return deleted
+        with open(self.dbf, "rb") as f:
+            f.seek(self._headerLength)
+            for start in range(0, self.numRecords, DBF_BLOCK):
+                block = f.read(self._recordLength * min(DBF_BLOCK, self.numRecords - start))
+                flags = block[0::self._recordLength]
+                position = flags.find(b"*")
+                while position != -1:
+                    deleted.add(start + position)
+                    position = flags.find(b"*", position + 1)
+        return deleted
+
+    # Geometry -----------------------------------------------------------------
+    def iter_shapes(self):
+        with open(self.shp, "rb") as f:
+            f.seek(100)
+            while True:
+                recordHeader = f.read(8)
+                if len(recordHeader) < 8:
+                    break
+                contentLength = struct.unpack(">2i", recordHeader)[1] * 2      # Record length is stored in 16-bit words
+                yield self._parse_shape(f.read(contentLength))
+
+    def _parse_shape(self, content):
+        shapeType = base_shape_type(struct.unpack("<i", content[0:4])[0])
+        if shapeType == NULL:
+            return None
+        if shapeType == POINT:
+            return struct.unpack("<2d", content[4:20])
+        if shapeType == MULTIPOINT:
+            numPoints = struct.unpack("<i", content[36:40])[0]
+            xy = struct.unpack("<{0}d".format(2 * numPoints), content[40:40 + 16 * numPoints])
+            return [list(zip(xy[0::2], xy[1::2]))]
+        numParts, numPoints = struct.unpack("<2i", content[36:44])
+        parts = struct.unpack("<{0}i".format(numParts), content[44:44 + 4 * numParts]) + (numPoints,)
+        start = 44 + 4 * numParts
+        xy = struct.unpack("<{0}d".format(2 * numPoints), content[start:start + 16 * numPoints])
+        xs, ys = xy[0::2], xy[1::2]
+        return [list(zip(xs[parts[i]:parts[i + 1]], ys[parts[i]:parts[i + 1]])) for i in range(numParts)]
+
+    def read_points(self):
+        """Return all point coordinates as two numpy arrays (x, y). Null shapes and deleted records become NaN
+        so that array positions still line up with record numbers."""
+        import numpy
+
+        if base_shape_type(self.shapeType) != POINT:
+            raise ValueError("{0} is not a point shapefile.".format(self.shp))
+        with open(self.shp, "rb") as f:
+            f.seek(100)
+            data = f.read()
+        xs = ys = None
+        if self.shapeType == POINT and len(data) % 28 == 0:                     # Fast path: every record is an 8 byte header + 20 byte 2D point
+            records = numpy.frombuffer(data, dtype=numpy.dtype([("header", "V8"), ("type", "<i4"), ("x", "<f8"), ("y", "<f8")]))
+            if (records["type"] == POINT).all():
+                xs, ys = records["x"].copy(), records["y"].copy()
+        if xs is None:
+            xs, ys = [], []
+            for shape in self.iter_shapes():
+                x, y = shape if shape is not None else (float("nan"), float("nan"))
+                xs.append(x)
+                ys.append(y)
+            xs, ys = numpy.array(xs, dtype=float), numpy.array(ys, dtype=float)
+        deleted = [i for i in self.deleted_records() if i < len(xs)]
+        xs[deleted] = numpy.nan
+        ys[deleted] = numpy.nan
+        return xs, ys
+
+    # Attributes ---------------------------------------------------------------
+    def _parse_value(self, raw, fieldType, decimals):
+        if fieldType == "C":
+            return raw.decode(self.encoding).rstrip(" \x00")
+        text = raw.strip(b" \x00").decode("ascii", "replace")
+        if fieldType in ("N", "F"):
+            if not text or text.startswith("*"):
+                return None
+            try:
+                return int(text) if decimals == 0 and "." not in text else float(text)
+            except ValueError:
+                return None
+        if fieldType == "D":
+            try:
+                return datetime.date(int(text[0:4]), int(text[4:6]), int(text[6:8]))
+            except ValueError:
+                return None
+        if fieldType == "L":
+            return None if text in ("", "?") else text in ("T", "t", "Y", "y")
+        return text
+
+    def _parse_record(self, data):
+        values = []
+        position = 1                                                            # Skip the deletion flag
+        for name, fieldType, length, decimals in self.fields:
+            values.append(self._parse_value(data[position:position + length], fieldType, decimals))
+            position += length
+        return values
+
+    def _iter_dbf(self):
+        """Raw dbf records in file order, including deleted ones."""
+        with open(self.dbf, "rb") as f:
+            f.seek(self._headerLength)
+            for i in range(self.numRecords):
+                data = f.read(self._recordLength)
+                if len(data) < self._recordLength:
+                    break
+                yield data
+
+    def iter_records(self):
+        if not self.fields:
+            return
+        for data in self._iter_dbf():
+            if data[0:1] != b"*":
+                yield self._parse_record(data)
+
+    def read_records(self, indexes):
+        """Return the attribute rows at the given (0-based) record numbers without reading the rest of the table."""
+        rows = []
+        if not self.fields:
+            return [[] for i in indexes]
+        with open(self.dbf, "rb") as f:
+            for i in indexes:
+                f.seek(self._headerLength + int(i) * self._recordLength)
+                rows.append(self._parse_record(f.read(self._recordLength)))
+        return rows
+
+    def iter_raw(self):
+        """Yield (shape record content, dbf record) as unparsed bytes, for copying features with ShapefileWriter.write_raw().
+        Deleted records are skipped."""
+        with open(self.shp, "rb") as shp:
+            records = self._iter_dbf() if self.fields else None
+            shp.seek(100)
+            while True:
+                recordHeader = shp.read(8)
+                if len(recordHeader) < 8:
+                    break
+                content = shp.read(struct.unpack(">2i", recordHeader)[1] * 2)
+                record = next(records, None) if records else b" "
+                if record is None:
+                    break
+                if record[0:1] != b"*":
+                    yield content, record
+
+    def iter_shape_records(self):
+        """Yield (shape, attribute row) of every record that isn't deleted."""
+        shapes = self.iter_shapes()
+        if not self.fields:
+            for shape in shapes:
+                yield shape, []
+            return
+        for shape, data in zip(shapes, self._iter_dbf()):
+            if data[0:1] != b"*":
+                yield shape, self._parse_record(data)
+
+
+class ShapefileWriter(object):
+    """Writes a 2D shapefile one feature at a time. 'fields' are dbf field definitions (name, type, length, decimals);
+    shapes use the same format ShapefileReader returns. Headers are completed when the writer is closed."""
+
+    def __init__(self, shp, shapeType, fields, prj=None, encoding="latin-1"):
+        base = os.path.splitext(shp)[0]
+        self.shapeType = shapeType
+        self.fields = list(fields)
+        self.encoding = encoding
+        self.numRecords = 0
+        self.bbox = None
+        self._shp = open(base + ".shp", "wb")
+        self._shx = open(base + ".shx", "wb")
+        self._dbf = open(base + ".dbf", "wb")
+        for f in (self._shp, self._shx):
+            f.write(b"\x00" * 100)                                              # Header is written on close()
+        self._dbf.write(b"\x00" * (33 + 32 * len(self.fields)))
+        if prj:
+            with open(base + ".prj", "w") as f:
+                f.write(prj)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _shape_content(self, shape):
+        if shape is None:
+            return struct.pack("<i", NULL), None
+        if self.shapeType == POINT:
+            return struct.pack("<i2d", POINT, shape[0], shape[1]), (shape[0], shape[1], shape[0], shape[1])
+        points = [point for part in shape for point in part]
+        xs = [point[0] for point in points]
+        ys = [point[1] for point in points]
+        bbox = (min(xs), min(ys), max(xs), max(ys))
+        parts, start = [], 0
+        for part in shape:
+            parts.append(start)
+            start += len(part)
+        content = struct.pack("<i4d2i", self.shapeType, bbox[0], bbox[1], bbox[2], bbox[3], len(shape), len(points))
+        content += struct.pack("<{0}i".format(len(parts)), *parts)
+        content += struct.pack("<{0}d".format(2 * len(points)), *[c for point in points for c in point[:2]])
+        return content, bbox
+
+    def _format_value(self, value, fieldType, length, decimals):
+        if value is None:
+            text = b""
+        elif fieldType == "C":
+            if isinstance(value, bytes):
+                value = value.decode(self.encoding)
+            elif not isinstance(value, type(u"")):
+                value = u"{0}".format(value)
+            text = value.encode(self.encoding)
+        elif fieldType == "D":
+            text = value.strftime("%Y%m%d").encode("ascii")
+        elif fieldType == "L":
+            text = b"T" if value else b"F"
+        else:
+            text = ("{0:.{1}f}".format(value, decimals) if decimals else str(int(value))).encode("ascii")
+        return text[:length].ljust(length) if fieldType == "C" else text[:length].rjust(length)
+
+    def _extend_bbox(self, bbox):
+        if bbox:
+            self.bbox = bbox if self.bbox is None else (min(self.bbox[0], bbox[0]), min(self.bbox[1], bbox[1]), max(self.bbox[2], bbox[2]), max(self.bbox[3], bbox[3]))
+
+    def write(self, shape, record=()):
+        content, bbox = self._shape_content(shape)
+        offset = self._shp.tell()
+        self._shp.write(struct.pack(">2i", self.numRecords + 1, len(content) // 2) + content)
+        self._shx.write(struct.pack(">2i", offset // 2, len(content) // 2))
+        values = list(record) + [None] * (len(self.fields) - len(record))
+        self._dbf.write(b" " + b"".join(self._format_value(value, *field[1:]) for value, field in zip(values, self.fields)))
+        self._extend_bbox(bbox)
+        self.numRecords += 1
+
+    def write_raw(self, content, record):
+        """Write a feature read with ShapefileReader.iter_raw() from a shapefile with the same shape type and fields."""
+        shapeType = base_shape_type(struct.unpack("<i", content[0:4])[0])
+        bbox = None
+        if shapeType == POINT:
+            x, y = struct.unpack("<2d", content[4:20])
+            bbox = (x, y, x, y)
+        elif shapeType != NULL:
+            bbox = struct.unpack("<4d", content[4:36])
+        offset = self._shp.tell()
+        self._shp.write(struct.pack(">2i", self.numRecords + 1, len(content) // 2) + content)
+        self._shx.write(struct.pack(">2i", offset // 2, len(content) // 2))
+        self._dbf.write(record)
+        self._extend_bbox(bbox)
+        self.numRecords += 1
+
+    def close(self):
+        if self._shp.closed:
+            return
+        bbox = self.bbox or (0.0, 0.0, 0.0, 0.0)
+        for f in (self._shp, self._shx):
+            length = f.tell()
+            f.seek(0)
+            f.write(struct.pack(">7i", 9994, 0, 0, 0, 0, 0, length // 2) + struct.pack("<2i8d", 1000, self.shapeType, bbox[0], bbox[1], bbox[2], bbox[3], 0, 0, 0, 0))
+            f.close()
+        self._dbf.write(b"\x1a")
+        recordLength = 1 + sum(field[2] for field in self.fields)
+        today = datetime.date.today()
+        self._dbf.seek(0)
+        self._dbf.write(struct.pack("<4BIHH20x", 3, today.year - 1900, today.month, today.day, self.numRecords, 33 + 32 * len(self.fields), recordLength))
+        for name, fieldType, length, decimals in self.fields:
+            self._dbf.write(name.encode("ascii")[:10].ljust(11, b"\x00") + fieldType.encode("ascii") + b"\x00" * 4 + struct.pack("<2B", length, decimals) + b"\x00" * 14)
+        self._dbf.write(b"\r")
+        self._dbf.close()
+
+
+def esri_field_type(field):
+    """Return the (AddField_management field type, field length) for a dbf field (name, type, length, decimals)."""
+    name, fieldType, length, decimals = field
+    if fieldType == "C":
+        return "TEXT", length
+    if fieldType == "N" and decimals == 0:
+        return ("LONG" if length < 10 else "DOUBLE"), ""
+    if fieldType in ("N", "F"):
+        return "DOUBLE", ""
+    if fieldType == "D":
+        return "DATE", ""
+    if fieldType == "L":
+        return "SHORT", ""
+    return "TEXT", length
@@ -0,0 +1,225 @@
+#-------------------------------------------------------------------------------
+# Name:        Slope Zonal Statistics
+''' Purpose:  Zonal statistics engine for the "Percent Slope Analysis" tool. Each
+              input polygon is rasterized (cell centers) onto the slope raster grid
+              and only the raster window covering that polygon is read, in blocks of
+              rows, so memory stays bounded for large treatment units. Acres above
+              and below every slope threshold (15/20/25/30/40%) are computed in the
+              same pass, without converting the raster to polygons and intersecting.
+              Slope can come from one percent slope raster or from the reclassified
+              threshold rasters (value 0 = steeper than the threshold, 1 = less steep)
+              kept in the tool's reference files. Rasters are read with
+              arcpy.RasterToNumPyArray, or memory-mapped if they are ESRI Float Grids
+              (.flt + .hdr, e.g. from RasterToFloat_conversion) so no arcpy is needed.
+'''
+#-------------------------------------------------------------------------------
+import math, os
+import numpy
+
+THRESHOLDS = (15, 20, 25, 30, 40)
+SQ_METERS_PER_ACRE = 4046.8564224
+
+
+class RasterWindowSource(object):
+    """Base class for a single band raster read one window at a time. Subclasses set xmin, ymax,
+    cellSize, nrows, ncols and nodata, and implement read_window()."""
+
+    def window_for_bbox(self, xmin, ymin, xmax, ymax):
+        """Return (row0, col0, nrows, ncols) of the cells overlapping the bounding box, clipped to the raster."""
+        col0 = max(int(math.floor((xmin - self.xmin) / self.cellSize)), 0)
+        col1 = min(int(math.ceil((xmax - self.xmin) / self.cellSize)), self.ncols)
+        row0 = max(int(math.floor((self.ymax - ymax) / self.cellSize)), 0)
+        row1 = min(int(math.ceil((self.ymax - ymin) / self.cellSize)), self.nrows)
+        return row0, col0, max(row1 - row0, 0), max(col1 - col0, 0)
+
+    def read_window(self, row0, col0, nrows, ncols):
+        raise NotImplementedError
+
+    def valid(self, values):
+        if self.nodata is None:
+            return ~numpy.isnan(values) if values.dtype.kind == "f" else numpy.ones(values.shape, dtype=bool)
+        return (values != self.nodata) & ~numpy.isnan(values) if values.dtype.kind == "f" else values != self.nodata
+
+
+class FloatGridRaster(RasterWindowSource):
+    """ESRI Float Grid (.flt with a .hdr header) read through numpy.memmap; only the requested window is paged in."""
+
+    def __init__(self, path):
+        base = os.path.splitext(path)[0]
+        header = {}
+        with open(base + ".hdr", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2:
+                    header[parts[0].lower()] = parts[1]
+        self.path = base + ".flt"
+        self.ncols = int(header["ncols"])
+        self.nrows = int(header["nrows"])
+        self.cellSize = float(header["cellsize"])
+        xll = float(header.get("xllcorner", header.get("xllcenter", 0)))
+        yll = float(header.get("yllcorner", header.get("yllcenter", 0)))
+        if "xllcenter" in header:
+            xll -= self.cellSize / 2
+            yll -= self.cellSize / 2
+        self.xmin = xll
+        self.ymax = yll + self.nrows * self.cellSize
+        self.nodata = float(header["nodata_value"]) if "nodata_value" in header else None
+        byteOrder = ">" if header.get("byteorder", "LSBFIRST").upper() == "MSBFIRST" else "<"
+        self.data = numpy.memmap(self.path, dtype=byteOrder + "f4", mode="r", shape=(self.nrows, self.ncols))
+
+    def read_window(self, row0, col0, nrows, ncols):
+        return numpy.asarray(self.data[row0:row0 + nrows, col0:col0 + ncols])
+
+
+class ArcpyRaster(RasterWindowSource):
+    """Any raster arcpy can read (e.g. the .tif slope rasters); windows are read with RasterToNumPyArray."""
+
+    def __init__(self, path):
+        import arcpy
+
+        self.raster = arcpy.Raster(path)
+        self.path = path
+        self.cellSize = float(self.raster.meanCellWidth)
+        self.xmin = float(self.raster.extent.XMin)
+        self.ymax = float(self.raster.extent.YMax)
+        self.nrows = int(self.raster.height)
+        self.ncols = int(self.raster.width)
+        self.nodata = self.raster.noDataValue
+
+    def read_window(self, row0, col0, nrows, ncols):
+        import arcpy
+
+        lowerLeft = arcpy.Point(self.xmin + col0 * self.cellSize, self.ymax - (row0 + nrows) * self.cellSize)
+        return arcpy.RasterToNumPyArray(self.raster, lowerLeft, ncols, nrows)
+
+
+def open_raster(path):
+    """Memory-map ESRI Float Grids; use arcpy for every other raster format."""
+    if os.path.splitext(path)[1].lower() in (".flt", ".hdr"):
+        return FloatGridRaster(path)
+    return ArcpyRaster(path)
+
+
+class SlopeRasters(object):
+    """Slope source for the zonal engine: either one percent slope raster, or one reclassified raster per
+    threshold (0 = steeper than the threshold, 1 = less steep). All rasters must share the same grid."""
+
+    def __init__(self, percentSlope=None, reclassified=None):
+        if percentSlope is None and not reclassified:
+            raise ValueError("A percent slope raster or the reclassified threshold rasters are required.")
+        self.percentSlope = percentSlope
+        self.reclassified = reclassified or {}
+        self.thresholds = tuple(THRESHOLDS) if percentSlope is not None else tuple(sorted(self.reclassified))
+        self.grid = percentSlope if percentSlope is not None else self.reclassified[self.thresholds[0]]
+
+    def steep_masks(self, row0, col0, nrows, ncols):
+        """Return (valid cells, {threshold: cells steeper than the threshold}) for a window."""
+        if self.percentSlope is not None:
+            slope = self.percentSlope.read_window(row0, col0, nrows, ncols)
+            valid = self.percentSlope.valid(slope)
+            return valid, dict((t, valid & (slope > t)) for t in self.thresholds)
+        valid = numpy.ones((nrows, ncols), dtype=bool)
+        steep = {}
+        for t in self.thresholds:
+            source = self.reclassified[t]
+            values = source.read_window(row0, col0, nrows, ncols)
+            valid &= source.valid(values)
+            steep[t] = values == 0
+        return valid, dict((t, mask & valid) for t, mask in steep.items())
+
+
+def polygon_mask(rings, xmin, ymax, cellSize, row0, col0, nrows, ncols):
+    """Rasterize polygon rings onto a window of the grid: True where the cell center falls inside
+    (even-odd rule, so holes are excluded). Scanline fill, vectorized over the polygon's edges."""
+    mask = numpy.zeros((nrows, ncols), dtype=bool)
+    starts = numpy.concatenate([numpy.asarray(ring, dtype=float)[:-1] for ring in rings if len(ring) > 1])
+    ends = numpy.concatenate([numpy.asarray(ring, dtype=float)[1:] for ring in rings if len(ring) > 1])
+    x1, y1, x2, y2 = starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+    firstCenterX = xmin + (col0 + 0.5) * cellSize
+    for r in range(nrows):
+        y = ymax - (row0 + r + 0.5) * cellSize
+        crosses = (y1 > y) != (y2 > y)
+        if not crosses.any():
+            continue
+        cx1, cy1, cx2, cy2 = x1[crosses], y1[crosses], x2[crosses], y2[crosses]
+        xs = numpy.sort(cx1 + (y - cy1) * (cx2 - cx1) / (cy2 - cy1))
+        for left, right in zip(xs[0::2], xs[1::2]):
+            c0 = max(int(math.ceil((left - firstCenterX) / cellSize)), 0)       # First cell center at or right of the crossing
+            c1 = min(int(math.floor((right - firstCenterX) / cellSize)), ncols - 1)
+            if c1 >= c0:
+                mask[r, c0:c1 + 1] = True
+    return mask
+
+
+def zone_slope_acres(rings, slope, blockRows=1024):
+    """Return {"Acres": total, threshold: (acres steeper, acres less steep), ...} for one polygon,
+    reading the slope rasters window by window (at most 'blockRows' rows at a time)."""
+    grid = slope.grid
+    xs = [p[0] for ring in rings for p in ring]
+    ys = [p[1] for ring in rings for p in ring]
+    row0, col0, nrows, ncols = grid.window_for_bbox(min(xs), min(ys), max(xs), max(ys))
+    cellAcres = grid.cellSize * grid.cellSize / SQ_METERS_PER_ACRE
+    counts = dict((t, [0, 0]) for t in slope.thresholds)
+    total = 0
+    for blockStart in range(row0, row0 + nrows, blockRows):
+        blockRowCount = min(blockRows, row0 + nrows - blockStart)
+        inside = polygon_mask(rings, grid.xmin, grid.ymax, grid.cellSize, blockStart, col0, blockRowCount, ncols)
+        if not inside.any():
+            continue
+        valid, steep = slope.steep_masks(blockStart, col0, blockRowCount, ncols)
+        inside &= valid
+        insideCount = int(inside.sum())
+        total += insideCount
+        for t in slope.thresholds:
+            steepCount = int((steep[t] & inside).sum())
+            counts[t][0] += steepCount
+            counts[t][1] += insideCount - steepCount
+    result = {"Acres": total * cellAcres}
+    for t in slope.thresholds:
+        result[t] = (counts[t][0] * cellAcres, counts[t][1] * cellAcres)
+    return result
+
+
+def zonal_slope_acres(zones, slope, blockRows=1024):
+    """Run zone_slope_acres() for a list of (zone name, rings). Returns a list of (zone name, result)."""
+    return [(zone, zone_slope_acres(rings, slope, blockRows)) for zone, rings in zones]
+
+
+def arcpy_polygon_rings(geometry):
+    """Rings of an arcpy Polygon as lists of (x, y). Interior rings are separated by None in each part."""
+    rings = []
+    for part in geometry:
+        ring = []
+        for point in part:
+            if point is None:
+                if ring:
+                    rings.append(ring)
+                ring = []
+            else:
+                ring.append((point.X, point.Y))
+        if ring:
+            rings.append(ring)
+    return rings
+
+
+def write_threshold_table(path, results, thresholds=THRESHOLDS):
+    """CSV comparing every threshold: one row per zone plus a total row."""
+    import csv, sys
+
+    header = ["Zone", "Acres"]
+    for t in thresholds:
+        header += ["Above{0}".format(t), "Below{0}".format(t)]
+    totals = dict((key, 0.0) for key in header[1:])
+    f = open(path, "wb") if sys.version_info[0] < 3 else open(path, "w", newline="")
+    with f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for zone, result in results:
+            row = [zone, round(result["Acres"], 2)]
+            totals["Acres"] += result["Acres"]
+            for t in thresholds:
+                row += [round(result[t][0], 2), round(result[t][1], 2)]
+                totals["Above{0}".format(t)] += result[t][0]
+                totals["Below{0}".format(t)] += result[t][1]
+            writer.writerow(row)
+        writer.writerow(["Total"] + [round(totals[key], 2) for key in header[1:]])
@@ -0,0 +1,202 @@
+#-------------------------------------------------------------------------------
+# Name:        Tool Timing
+''' Purpose:  Per-stage timing for the Forestry Tools and the OARS scripts. A run is
+              split into stages (the same steps shown with SetProgressorLabel);
+              each stage records its wall time, the rows it processed and the
+              bytes it wrote. Every run is appended to a JSON lines log, one line
+              per run:
+                {"tool": "E911 Analysis", "started": ..., "seconds": 41.2,
+                 "status": "ok", "stages": [{"stage": "Intersecting...",
+                 "seconds": 12.9, "rows": 1, "bytes": 16384}, ...]}
+              The log is "Forestry Tools Timing.jsonl" in the temp folder, or the
+              file named by the FORESTRY_TIMING_LOG environment variable. Summary
+              of the log (median/mean/max seconds and rows per second per stage):
+                python Tool_Timing.py
+                python Tool_Timing.py "C:/Temp/Forestry Tools Timing.jsonl" --tool "E911 Analysis"
+'''
+#-------------------------------------------------------------------------------
+import argparse, functools, json, os, platform, socket, sys, tempfile, time
+
+LOG_FILE = os.environ.get("FORESTRY_TIMING_LOG", os.path.join(tempfile.gettempdir(), "Forestry Tools Timing.jsonl"))
+_current = None                                                                 # The ToolRun that step()/count()/wrote() report to
+
+
+def path_bytes(path):
+    """Size on disk of a file, of every part of a shapefile (.shp, .dbf, .shx, .prj...) or of a folder (e.g. a file geodatabase)."""
+    path = str(path)
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, folders, files in os.walk(path) for f in files)
+    if path.lower().endswith(".shp"):
+        folder, name = os.path.split(os.path.splitext(path)[0])
+        folder = folder or "."
+        if os.path.isdir(folder):
+            return sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder) if f.split(".")[0] == name)
+    return os.path.getsize(path) if os.path.isfile(path) else 0
+
+
+class ToolRun(object):
+    """Timing of one tool run. Use as a context manager; the run is logged when it exits (also if it fails)."""
+
+    def __init__(self, tool, logFile=None, progress=None, **details):
+        self.tool = tool
+        self.logFile = logFile or LOG_FILE
+        self.progress = progress                                                # e.g. arcpy.SetProgressorLabel
+        self.details = details
+        self.stages = []
+        self.stage = None
+        self.start = time.time()
+        self.record = None
+        self._previous = None
+
+    def step(self, label):
+        """End the current stage and start a new one."""
+        self._end_stage()
+        self.stage = {"stage": label, "start": time.time(), "rows": 0, "bytes": 0}
+        if self.progress:
+            self.progress(label)
+
+    def count(self, rows):
+        """Add to the rows processed by the current stage."""
+        if self.stage is None:
+            self.step(self.tool)
+        self.stage["rows"] += int(rows)
+
+    def wrote(self, *paths):
+        """Add the size of the given outputs to the bytes written by the current stage."""
+        if self.stage is None:
+            self.step(self.tool)
+        self.stage["bytes"] += sum(path_bytes(path) for path in paths if path)
+
+    def _end_stage(self):
+        if self.stage is not None:
+            start = self.stage.pop("start")
+            self.stage["seconds"] = round(time.time() - start, 4)
+            self.stages.append(self.stage)
+            self.stage = None
+
+    def finish(self, error=None):
+        """End the last stage and append the run to the log. Returns the logged record."""
+        self._end_stage()
+        self.record = {"tool": self.tool,
+                       "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.start)),
+                       "seconds": round(time.time() - self.start, 4),
+                       "status": "failed" if error else "ok",
+                       "error": error,
+                       "host": socket.gethostname(),
+                       "python": platform.python_version(),
+                       "stages": self.stages}
+        self.record.update(self.details)
+        try:
+            folder = os.path.dirname(self.logFile)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            with open(self.logFile, "a") as f:
+                f.write(json.dumps(self.record, sort_keys=True) + "\n")
+        except (IOError, OSError):                                              # Timing must never break a tool
+            pass
+        return self.record
+
+    def __enter__(self):
+        global _current
+        self._previous, _current = _current, self
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        global _current
+        _current = self._previous
+        self.finish("{0}: {1}".format(excType.__name__, excValue) if excType else None)
+        return False
+
+
+def _arcpy_progress():
+    try:
+        import arcpy
+    except ImportError:
+        return None
+    return arcpy.SetProgressorLabel
+
+
+def timed(tool=None):
+    """Decorator for a tool's execute method (or a script's main function): the whole call is one logged run,
+    and the module level step() calls inside it update the progressor label and start a new stage. The run is
+    named 'tool', or after the label of the tool whose method is decorated."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            name = tool or (getattr(args[0], "label", None) if args else None) or function.__name__
+            with ToolRun(name, progress=_arcpy_progress()):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def step(label):
+    """Start a new stage of the current run (does nothing if no run is being timed)."""
+    if _current is not None:
+        _current.step(label)
+
+
+def count(rows):
+    if _current is not None:
+        _current.count(rows)
+
+
+def wrote(*paths):
+    if _current is not None:
+        _current.wrote(*paths)
+
+
+# Log summary -----------------------------------------------------------------
+def read_log(path=None, tool=None):
+    """Logged runs, oldest first (optionally only those of one tool). Lines that aren't valid JSON are skipped."""
+    runs = []
+    with open(path or LOG_FILE, "r") as f:
+        for line in f:
+            try:
+                run = json.loads(line)
+            except ValueError:                                                  # A line cut short by a crash
+                continue
+            if tool is None or run.get("tool") == tool:
+                runs.append(run)
+    return runs
+
+
+def summarize(runs):
+    """[(tool, stage, runs, median, mean and max seconds, rows per second, bytes per run)] in the order the stages were first seen."""
+    stages = {}
+    order = []
+    for run in runs:
+        for stage in [{"stage": "(whole run)", "seconds": run["seconds"], "rows": 0, "bytes": 0}] + run.get("stages", []):
+            key = (run["tool"], stage["stage"])
+            if key not in stages:
+                stages[key] = []
+                order.append(key)
+            stages[key].append(stage)
+    summary = []
+    for key in order:
+        seconds = sorted(stage["seconds"] for stage in stages[key])
+        middle = len(seconds) // 2
+        median = seconds[middle] if len(seconds) % 2 else (seconds[middle - 1] + seconds[middle]) / 2.0
+        rows = sum(stage["rows"] for stage in stages[key])
+        total = sum(seconds)
+        summary.append(key + (len(seconds), median, total / len(seconds), seconds[-1], rows / total if rows and total else None,
+                              sum(stage["bytes"] for stage in stages[key]) // len(seconds)))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize the Forestry Tools timing log.")
+    parser.add_argument("log", nargs="?", default=LOG_FILE, help="Timing log (default: {0})".format(LOG_FILE))
+    parser.add_argument("--tool", help="Only summarize this tool")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.log):
+        sys.exit("No timing log at {0}".format(args.log))
+    for tool, stage, runs, median, mean, maximum, rate, size in summarize(read_log(args.log, args.tool)):
+        print("{0} | {1}: {2} runs, median {3:.2f} s, mean {4:.2f} s, max {5:.2f} s{6}{7}".format(
+            tool, stage, runs, median, mean, maximum, ", {0:,.0f} rows/s".format(rate) if rate else "",
+            ", {0:,.1f} MB written".format(size / 1048576.0) if size else ""))
+
+
+if __name__ == "__main__":
+    main()
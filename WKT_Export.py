@@ -0,0 +1,186 @@
+#-------------------------------------------------------------------------------
+# Name:        WKT Export
+''' Purpose:  Streaming writer for the "Convert Shapefile to WKT" tool. Polygons are
+              read one feature at a time (as WKB from an arcpy cursor, or straight
+              from a .shp file), reprojected to WGS 1984 Web Mercator (auxiliary
+              sphere, WKID 3857) in vectorized batches with CRS_Transforms.py, and
+              written to the text file as a single MULTIPOLYGON in one pass, which is
+              the format the USFS SMART web-based data entry tool expects. No
+              temporary projected shapefile is created and the text file is never
+              reread. Optionally, coordinates are rounded to a number of decimal
+              places and rings are simplified (Douglas-Peucker) to shrink the text.
+'''
+#-------------------------------------------------------------------------------
+import os, struct
+import numpy
+import CRS_Transforms, Shapefile_IO
+
+SUPPORTED_CRS = ("WGS_1984_Web_Mercator_Auxiliary_Sphere", "GCS_WGS_1984", "NAD_1983_UTM_Zone_12N", "NAD_1983_UTM_Zone_13N")
+BATCH_VERTICES = 200000                                                         # Vertices transformed (and held in memory) at once
+
+
+def to_web_mercator(xs, ys, crsName):
+    """Reproject coordinate arrays from one of the SUPPORTED_CRS to WGS 1984 Web Mercator. NAD83 UTM coordinates
+    use the inverse of the "WGS_1984_(ITRF00)_To_NAD_1983" transformation, like the tool did with Project_management."""
+    if crsName == "WGS_1984_Web_Mercator_Auxiliary_Sphere":
+        return numpy.asarray(xs, dtype=float), numpy.asarray(ys, dtype=float)
+    if crsName == "GCS_WGS_1984":
+        return CRS_Transforms.geographic_to_web_mercator(xs, ys)
+    if crsName in ("NAD_1983_UTM_Zone_12N", "NAD_1983_UTM_Zone_13N"):
+        lon, lat = CRS_Transforms.utm_to_geographic(xs, ys, int(crsName[-3:-1]), CRS_Transforms.GRS80)
+        lon, lat = CRS_Transforms.nad83_to_wgs84(lon, lat)
+        return CRS_Transforms.geographic_to_web_mercator(lon, lat)
+    raise ValueError("Unsupported coordinate reference system: {0}".format(crsName))
+
+
+def parse_wkb(wkb):
+    """Polygons (each a list of rings, each ring an (n, 2) numpy array) of a WKB Polygon or MultiPolygon.
+    Z and M values (ISO or extended WKB type codes) are dropped."""
+    wkb = bytes(wkb)
+    polygons = []
+
+    def geometry(offset):
+        byteOrder = "<" if wkb[offset:offset + 1] == b"\x01" else ">"
+        code = struct.unpack(byteOrder + "I", wkb[offset + 1:offset + 5])[0]
+        baseCode = code & 0x0FFFFFFF
+        dims = 2 + (baseCode // 1000 in (1, 2)) + 2 * (baseCode // 1000 == 3) + bool(code & 0x80000000) + bool(code & 0x40000000)
+        return byteOrder, baseCode % 1000, dims, offset + 5
+
+    def polygon(offset):
+        byteOrder, geometryType, dims, offset = geometry(offset)
+        numRings = struct.unpack(byteOrder + "I", wkb[offset:offset + 4])[0]
+        offset += 4
+        rings = []
+        for r in range(numRings):
+            numPoints = struct.unpack(byteOrder + "I", wkb[offset:offset + 4])[0]
+            offset += 4
+            coordinates = numpy.frombuffer(wkb, dtype=byteOrder + "f8", count=numPoints * dims, offset=offset).reshape(numPoints, dims)
+            rings.append(coordinates[:, :2])
+            offset += 8 * numPoints * dims
+        polygons.append(rings)
+        return offset
+
+    byteOrder, geometryType, dims, offset = geometry(0)
+    if geometryType == 3:
+        polygon(0)
+    elif geometryType == 6:
+        numPolygons = struct.unpack(byteOrder + "I", wkb[offset:offset + 4])[0]
+        offset += 4
+        for p in range(numPolygons):
+            offset = polygon(offset)
+    else:
+        raise ValueError("Only polygon geometries can be written as MULTIPOLYGON WKT.")
+    return polygons
+
+
+def shapefile_polygons(rings):
+    """Group shapefile rings into polygons: a clockwise ring starts a polygon, counterclockwise rings are its holes."""
+    polygons = []
+    for ring in rings:
+        ring = numpy.asarray(ring, dtype=float)
+        x, y = ring[:, 0], ring[:, 1]
+        clockwise = numpy.dot(x[:-1], y[1:]) - numpy.dot(x[1:], y[:-1]) < 0
+        if clockwise or not polygons:
+            polygons.append([ring])
+        else:
+            polygons[-1].append(ring)
+    return polygons
+
+
+def iter_features(inputPolygon):
+    """Yield the polygons of each feature. Shapefiles are read directly; anything else (feature classes, layers
+    with a selection) through an arcpy cursor."""
+    path = str(inputPolygon)
+    if path.lower().endswith(".shp") and os.path.exists(path):
+        reader = Shapefile_IO.ShapefileReader(path)
+        deleted = reader.deleted_records()
+        for i, shape in enumerate(reader.iter_shapes()):
+            if shape and i not in deleted:
+                yield shapefile_polygons(shape)
+        return
+    import arcpy
+
+    with arcpy.da.SearchCursor(inputPolygon, ["SHAPE@WKB"]) as cursor:
+        for row in cursor:
+            if row[0]:
+                yield parse_wkb(row[0])
+
+
+def simplify_ring(ring, tolerance):
+    """Douglas-Peucker simplification of a closed ring; keeps the original if fewer than 4 vertices would remain."""
+    if tolerance <= 0 or len(ring) <= 4:
+        return ring
+    keep = numpy.zeros(len(ring), dtype=bool)
+    keep[0] = keep[-1] = True
+    farthest = int(numpy.argmax(numpy.hypot(ring[:, 0] - ring[0, 0], ring[:, 1] - ring[0, 1])))  # Split the ring so the first segment isn't degenerate (start == end)
+    keep[farthest] = True
+    stack = [(0, farthest), (farthest, len(ring) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        (x1, y1), (x2, y2) = ring[start], ring[end]
+        segment = ring[start + 1:end]
+        length = numpy.hypot(x2 - x1, y2 - y1)
+        if length == 0:
+            distances = numpy.hypot(segment[:, 0] - x1, segment[:, 1] - y1)
+        else:
+            distances = numpy.abs((x2 - x1) * (y1 - segment[:, 1]) - (x1 - segment[:, 0]) * (y2 - y1)) / length
+        index = int(numpy.argmax(distances))
+        if distances[index] > tolerance:
+            keep[start + 1 + index] = True
+            stack += [(start, start + 1 + index), (start + 1 + index, end)]
+    return ring[keep] if keep.sum() >= 4 else ring
+
+
+def format_ring(ring, decimals=None):
+    if decimals is None:
+        return "({0})".format(", ".join("{0!r} {1!r}".format(float(x), float(y)) for x, y in ring))
+    return "({0})".format(", ".join("{0:.{2}f} {1:.{2}f}".format(x, y, decimals) for x, y in ring))
+
+
+def write_multipolygon_wkt(inputPolygon, textFile, crsName, decimals=None, tolerance=0, batchVertices=BATCH_VERTICES):
+    """Write every polygon of the input as one Web Mercator MULTIPOLYGON to 'textFile'. 'tolerance' is the
+    simplification tolerance in meters (0 = no simplification). An input without polygons is written as
+    'MULTIPOLYGON EMPTY'. Returns (features, polygons, vertices in, vertices written)."""
+    counts = [0, 0, 0, 0]
+    with open(textFile, "w") as outFile:
+        batch = []                                                              # Polygons waiting for the next batched transform
+        batchSize = [0]
+
+        def flush():
+            if not batch:
+                return
+            rings = [ring for polygon in batch for ring in polygon]
+            xs, ys = to_web_mercator(numpy.concatenate([ring[:, 0] for ring in rings]), numpy.concatenate([ring[:, 1] for ring in rings]), crsName)
+            projected = numpy.column_stack((xs, ys))
+            position = 0
+            for polygon in batch:
+                parts = []
+                for ring in polygon:
+                    newRing = projected[position:position + len(ring)]
+                    if tolerance:
+                        latitude = 2 * numpy.arctan(numpy.exp(newRing[:, 1].mean() / 6378137.0)) - numpy.pi / 2
+                        newRing = simplify_ring(newRing, tolerance / numpy.cos(latitude))   # Meters on the ground -> Web Mercator units at the ring's latitude
+                    if decimals is not None:
+                        newRing = numpy.round(newRing, decimals)
+                    position += len(ring)
+                    counts[3] += len(newRing)
+                    parts.append(format_ring(newRing, decimals))
+                outFile.write("{0}({1})".format(", " if counts[1] else "MULTIPOLYGON (", ", ".join(parts)))
+                counts[1] += 1
+            del batch[:]
+            batchSize[0] = 0
+
+        for polygons in iter_features(inputPolygon):
+            counts[0] += 1
+            for polygon in polygons:
+                batch.append(polygon)
+                vertices = sum(len(ring) for ring in polygon)
+                counts[2] += vertices
+                batchSize[0] += vertices
+            if batchSize[0] >= batchVertices:
+                flush()
+        flush()
+        outFile.write(")" if counts[1] else "MULTIPOLYGON EMPTY")
+    return tuple(counts)